@@ -0,0 +1,148 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional
+
+from app.config.settings import AdmissionSettings
+
+
+class AdmissionRejectedError(Exception):
+    """Raised when a request is shed instead of being queued or served."""
+
+    def __init__(self, message: str, retry_after_seconds: int):
+        super().__init__(message)
+        self.retry_after_seconds = retry_after_seconds
+
+
+class AdmissionQueueFullError(AdmissionRejectedError):
+    pass
+
+
+class AdmissionDeadlineError(AdmissionRejectedError):
+    pass
+
+
+class AdmissionController:
+    """
+    Concurrency limit with a bounded FIFO wait queue, in front of the bcrypt-bound work.
+
+    At most `max_concurrency` requests are served at the same time, the others wait for a slot
+    in a queue of `max_queue_size` requests. A request arriving with the queue full is rejected
+    right away, a queued one is dropped when its deadline, or `max_wait_seconds`, expires,
+    so the work the clients stopped waiting for is never started.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue_size: int, max_wait_seconds: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue_size = max_queue_size
+        self.max_wait_seconds = max_wait_seconds
+        self.active = 0
+        self.max_queued = 0
+        self.admitted = 0
+        self.queue_full = 0
+        self.expired = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._total_wait_seconds = 0.0
+        # moving average of the time a request holds its slot, estimates the Retry-After
+        self._service_seconds = 0.0
+
+    @classmethod
+    def from_settings(cls, settings: AdmissionSettings) -> "AdmissionController":
+        return cls(
+            max_concurrency=settings.max_concurrency,
+            max_queue_size=settings.max_queue_size,
+            max_wait_seconds=settings.max_wait_seconds,
+        )
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Seconds for the queue to drain at the current service time, at least one."""
+        backlog = self.active + self.queued
+        return max(1, math.ceil(backlog * self._service_seconds / self.max_concurrency))
+
+    @asynccontextmanager
+    async def admit(self, deadline: Optional[float] = None) -> AsyncIterator[None]:
+        """
+        Hold a slot while serving a request.
+
+        :param deadline: The `time.monotonic()` after which the client gives up, if known.
+
+        :raises AdmissionQueueFullError: If all the slots are taken and the queue is full.
+        :raises AdmissionDeadlineError: If no slot became free before the deadline.
+        """
+        await self._acquire(deadline)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            self._service_seconds = (
+                elapsed
+                if self._service_seconds == 0
+                else 0.9 * self._service_seconds + 0.1 * elapsed
+            )
+            self._release()
+
+    async def _acquire(self, deadline: Optional[float]) -> None:
+        if deadline is not None and deadline <= time.monotonic():
+            self.expired += 1
+            raise AdmissionDeadlineError("Request deadline exceeded", self.retry_after())
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_queue_size:
+            self.queue_full += 1
+            raise AdmissionQueueFullError("Too many requests queued", self.retry_after())
+
+        start = time.monotonic()
+        timeout = self.max_wait_seconds
+        if deadline is not None:
+            timeout = min(timeout, deadline - start)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.max_queued = max(self.max_queued, len(self._waiters))
+        try:
+            # the slot is handed over by the releasing request, `active` is unchanged
+            await asyncio.wait_for(waiter, timeout=timeout)
+        except asyncio.TimeoutError:
+            self.expired += 1
+            raise AdmissionDeadlineError("Request deadline exceeded", self.retry_after())
+        except asyncio.CancelledError:
+            # cancelled after being handed the slot, pass it on
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        self.admitted += 1
+        self._total_wait_seconds += time.monotonic() - start
+
+    def _release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue_size": self.max_queue_size,
+            "active": self.active,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.queue_full,
+            "rejected_deadline": self.expired,
+            "mean_wait_ms": round(self._total_wait_seconds / max(self.admitted, 1) * 1000, 3),
+            "mean_service_ms": round(self._service_seconds * 1000, 3),
+        }
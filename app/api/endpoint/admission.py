@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Depends
+
+from app.api.endpoint.auth import require_admin_key
+from app.container import Container, get_container
+
+router = APIRouter()
+
+
+@router.get(
+    "/admission/stats",
+    status_code=200,
+    description="Queue depth and load shedding statistics of the logins and registrations",
+    dependencies=[Depends(require_admin_key)],
+)
+async def admission_stats(container: Container = Depends(get_container)):
+    rate_limit = container.rate_limiter.rejected if container.rate_limiter is not None else {}
+    return {"login": container.login_admission.stats(), "rate_limit_rejected": rate_limit}
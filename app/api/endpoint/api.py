@@ -1,6 +1,11 @@
 from fastapi import APIRouter
-from app.api.endpoint import health, auth
+from app.api.endpoint import health, auth, token, pool, admission, users, profiling
 
 router = APIRouter(prefix="/api/v1")
 router.include_router(health.router, tags=["health"])
 router.include_router(auth.router, tags=["auth"])
+router.include_router(token.router, tags=["token"])
+router.include_router(pool.router, tags=["pool"])
+router.include_router(admission.router, tags=["admission"])
+router.include_router(users.router, tags=["users"])
+router.include_router(profiling.router, tags=["profiling"])
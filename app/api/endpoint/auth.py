@@ -1,9 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException
+import hmac
+import time
+from typing import Optional, Union
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
-from app.model.user import User
+from app.admission import AdmissionController, AdmissionRejectedError
+from app.container import Container, get_container
+from app.hash import HashingUnavailableError
+from app.metrics import LOGINS
+from app.model.user import UserIdentity
+from app.rate_limit import IP_SCOPE, RateLimitExceededError
 from app.repository import UserAlreadyExistsError
+from app.repository.postgres.user import UserRepository, get_user_repository
 from app.schema.user import (
+    BulkRegisterResponse,
     RegisterUserRequest,
     RegisterUserResponse,
     LoginResponse,
@@ -12,16 +23,83 @@ from app.schema.user import (
 )
 from app.service import InvalidCredentialsError
 from app.service.auth import AuthService, get_auth_service
+from app.service.user_import import CREATED, UserImporter, iter_lines
 
 router = APIRouter()
 
 bearer_scheme = HTTPBearer()
 
+# milliseconds the client is willing to wait for the response
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+# input formats of the bulk registration by content type
+BULK_CONTENT_TYPES = {
+    "application/x-ndjson": "jsonl",
+    "application/jsonl": "jsonl",
+    "text/csv": "csv",
+}
+
+
+def request_deadline(request: Request) -> Optional[float]:
+    timeout_ms = request.headers.get(DEADLINE_HEADER)
+    if timeout_ms is None:
+        return None
+    try:
+        return time.monotonic() + float(timeout_ms) / 1000
+    except ValueError:
+        return None
+
+
+def get_login_admission(container: Container = Depends(get_container)) -> AdmissionController:
+    return container.login_admission
+
+
+async def limit_client_ip(request: Request, container: Container = Depends(get_container)):
+    if container.rate_limiter is None or request.client is None:
+        return
+    try:
+        await container.rate_limiter.hit(IP_SCOPE, request.client.host)
+    except RateLimitExceededError as e:
+        # guards both login steps
+        LOGINS.labels(
+            "otp" if request.url.path.endswith("/otp") else "password", "rate_limited"
+        ).inc()
+        raise too_many_requests(e)
+
+
+def too_many_requests(e: RateLimitExceededError) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Too many attempts",
+        headers={"Retry-After": str(e.retry_after_seconds)},
+    )
+
+
+def service_unavailable(e: Union[AdmissionRejectedError, HashingUnavailableError]) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Service temporarily unavailable",
+        headers={"Retry-After": str(e.retry_after_seconds)},
+    )
+
+
+def require_admin_key(
+    x_admin_key: Optional[str] = Header(None),
+    container: Container = Depends(get_container),
+) -> None:
+    admin_api_key = container.settings.admin_api_key
+    if admin_api_key is None:
+        # the administration endpoints are disabled
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_key is None or not hmac.compare_digest(
+        x_admin_key.encode(), admin_api_key.get_secret_value().encode()
+    ):
+        raise HTTPException(status_code=401, detail="Invalid admin key")
+
 
 async def jwt_authentication_handler(
     credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
     auth_service: AuthService = Depends(get_auth_service),
-) -> User:
+) -> UserIdentity:
     return await auth_service.verify_jwt_token(credentials)
 
 
@@ -34,41 +112,118 @@ async def jwt_authentication_handler(
 async def register(
     request: RegisterUserRequest,
     auth_service: AuthService = Depends(get_auth_service),
+    admission: AdmissionController = Depends(get_login_admission),
+    deadline: Optional[float] = Depends(request_deadline),
 ):
     try:
-        user_id = await auth_service.register_user(
-            email=request.email,
-            password=request.password.get_secret_value(),
-            first_name=request.first_name,
-            last_name=request.last_name,
-            two_factor_enabled=request.two_factor_enabled,
-        )
+        async with admission.admit(deadline):
+            user_id = await auth_service.register_user(
+                email=request.email,
+                password=request.password.get_secret_value(),
+                first_name=request.first_name,
+                last_name=request.last_name,
+                two_factor_enabled=request.two_factor_enabled,
+            )
         return RegisterUserResponse(id=user_id)
     except UserAlreadyExistsError as e:
         raise HTTPException(status_code=409, detail=str(e))
+    except AdmissionRejectedError as e:
+        raise service_unavailable(e)
+    except HashingUnavailableError as e:
+        raise service_unavailable(e)
     # don't need to catch ValidationError because FastAPI does it for us
     # don't need to catch generic Exception because FastAPI does it for us
 
 
-@router.post("/login", status_code=200, response_model=LoginResponse, description="Login a user")
+@router.post(
+    "/register/bulk",
+    status_code=200,
+    response_model=BulkRegisterResponse,
+    description=(
+        "Register users in bulk from a JSON Lines (application/x-ndjson) or CSV (text/csv) body,"
+        " each row with a plaintext password or a bcrypt/argon2 password_hash."
+        " The existing emails are reported as conflicts, the other rows are still registered."
+    ),
+    dependencies=[Depends(require_admin_key)],
+)
+async def register_bulk(
+    request: Request,
+    container: Container = Depends(get_container),
+    user_repository: UserRepository = Depends(get_user_repository),
+):
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    format = BULK_CONTENT_TYPES.get(content_type)
+    if format is None:
+        raise HTTPException(
+            status_code=415, detail=f"Supported content types: {', '.join(BULK_CONTENT_TYPES)}"
+        )
+    importer = UserImporter(
+        user_repository, container.hasher, chunk_size=container.settings.user_import.chunk_size
+    )
+    max_rejected = container.settings.user_import.max_rejected
+    rejected = []
+    try:
+        async for results in importer.import_lines(iter_lines(request.stream()), format):
+            # bounded, the memory used mustn't grow with the input
+            rejected.extend(result for result in results if result.status != CREATED)
+            del rejected[max_rejected:]
+    except HashingUnavailableError as e:
+        # the chunks already inserted are reported as conflicts if the request is retried
+        raise service_unavailable(e)
+    stats = importer.stats
+    return BulkRegisterResponse(
+        rows=stats.rows,
+        created=stats.created,
+        conflicts=stats.conflicts,
+        invalid=stats.invalid,
+        rejected=rejected,
+        rejected_truncated=stats.conflicts + stats.invalid > len(rejected),
+    )
+
+
+@router.post(
+    "/login",
+    status_code=200,
+    response_model=LoginResponse,
+    description="Login a user",
+    dependencies=[Depends(limit_client_ip)],
+)
 async def login(
     request: LoginRequest,
     auth_service: AuthService = Depends(get_auth_service),
+    admission: AdmissionController = Depends(get_login_admission),
+    deadline: Optional[float] = Depends(request_deadline),
 ):
     try:
-        access_token = await auth_service.authenticate_user(
-            email=request.email,
-            password=request.password.get_secret_value(),
-        )
+        async with admission.admit(deadline):
+            access_token = await auth_service.authenticate_user(
+                email=request.email,
+                password=request.password.get_secret_value(),
+            )
+        LOGINS.labels("password", "success").inc()
         return LoginResponse(access_token=access_token)
     except InvalidCredentialsError:
+        LOGINS.labels("password", "invalid_credentials").inc()
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    except RateLimitExceededError as e:
+        LOGINS.labels("password", "rate_limited").inc()
+        raise too_many_requests(e)
+    except AdmissionRejectedError as e:
+        LOGINS.labels("password", "shed").inc()
+        raise service_unavailable(e)
+    except HashingUnavailableError as e:
+        LOGINS.labels("password", "hashing_unavailable").inc()
+        raise service_unavailable(e)
     # don't need to catch ValidationError because FastAPI does it for us
     # don't need to catch generic Exception because FastAPI does it for us
 
 
 @router.post(
-    "/login/otp", status_code=200, response_model=LoginResponse, description="Login a user with OTP"
+    "/login/otp",
+    status_code=200,
+    response_model=LoginResponse,
+    description="Login a user with OTP",
+    dependencies=[Depends(limit_client_ip)],
 )
 async def otp_validation(
     request: OtpRequest,
@@ -80,11 +235,19 @@ async def otp_validation(
             credentials=token,
             otp=request.otp,
         )
+        LOGINS.labels("otp", "success").inc()
         return LoginResponse(access_token=access_token)
     except InvalidCredentialsError:
+        LOGINS.labels("otp", "invalid_credentials").inc()
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    except RateLimitExceededError as e:
+        LOGINS.labels("otp", "rate_limited").inc()
+        raise too_many_requests(e)
+    except HashingUnavailableError as e:
+        LOGINS.labels("otp", "hashing_unavailable").inc()
+        raise service_unavailable(e)
 
 
 @router.get("/login/token/validate", description="Example of a protected endpoint")
-async def validate_token(user: User = Depends(jwt_authentication_handler)):
+async def validate_token(user: UserIdentity = Depends(jwt_authentication_handler)):
     return {"message": f"Token is valid! Welcome {user.first_name}"}
@@ -0,0 +1,86 @@
+from typing import List, Optional, Tuple
+from urllib.parse import quote
+
+from app.container import Container
+from app.model.user import UserIdentity
+from app.repository.postgres.user import UserRepository
+from app.service import InvalidCredentialsError
+from app.service.auth import AuthService
+
+USER_ID_HEADER = b"x-auth-user-id"
+USER_EMAIL_HEADER = b"x-auth-user-email"
+USER_FIRST_NAME_HEADER = b"x-auth-user-first-name"
+USER_LAST_NAME_HEADER = b"x-auth-user-last-name"
+USER_2FA_HEADER = b"x-auth-user-2fa"
+
+UNAUTHORIZED_HEADERS = [(b"www-authenticate", b"Bearer"), (b"content-length", b"0")]
+
+
+def _identity_headers(identity: UserIdentity) -> List[Tuple[bytes, bytes]]:
+    return [
+        (USER_ID_HEADER, identity.id.encode()),
+        # header values must be ASCII, the others are percent-encoded UTF-8
+        (USER_EMAIL_HEADER, quote(identity.email, safe="@+ ").encode()),
+        (USER_FIRST_NAME_HEADER, quote(identity.first_name, safe=" ").encode()),
+        (USER_LAST_NAME_HEADER, quote(identity.last_name, safe=" ").encode()),
+        (USER_2FA_HEADER, b"true" if identity.two_factor_enabled else b"false"),
+        (b"content-length", b"0"),
+    ]
+
+
+class AuthzApp:
+    """
+    Raw ASGI token check for reverse-proxy external authorization,
+    e.g. nginx `auth_request` or Envoy `ext_authz` HTTP service.
+
+    It bypasses the FastAPI routing, dependency injection and response serialization:
+    the bearer token is read from the `Authorization` header and the answer is an empty
+    200 with the user id and claims in `X-Auth-User-*` headers, or an empty 401.
+    Any method and sub path is accepted, as Envoy forwards the original ones.
+    """
+
+    def __init__(self):
+        self._auth_service: Optional[AuthService] = None
+
+    def get_user_repository(self, container: Container) -> UserRepository:
+        # it checks a connection out per query, only if the token needs a lookup
+        return container.user_repository
+
+    def get_auth_service(self, container: Container) -> AuthService:
+        user_repository = self.get_user_repository(container)
+        auth_service = self._auth_service
+        # built on the first request, again only when the container startup replaced the repository
+        if auth_service is None or auth_service.user_repository is not user_repository:
+            auth_service = self._auth_service = AuthService(
+                user_repository=user_repository,
+                app_settings=container.settings,
+                otp_service=container.otp_service,
+                hasher=container.hasher,
+                jwt_codec=container.jwt_codec,
+                otp_binder=container.otp_binder,
+            )
+        return auth_service
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            return
+        container: Container = scope["app"].state.container
+
+        token = None
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                scheme, _, credentials = value.decode("latin-1").partition(" ")
+                if scheme == "Bearer" and credentials:
+                    token = credentials
+                break
+
+        status, headers = 401, UNAUTHORIZED_HEADERS
+        if token is not None:
+            try:
+                identity = await self.get_auth_service(container).verify_access_token(token)
+                status, headers = 200, _identity_headers(identity)
+            except InvalidCredentialsError:
+                pass
+
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": b""})
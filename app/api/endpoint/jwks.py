@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Depends, Request, Response
+
+from app.container import Container, get_container
+
+router = APIRouter()
+
+
+@router.get(
+    "/.well-known/jwks.json",
+    status_code=200,
+    description="Public keys verifying the access tokens",
+)
+async def jwks(request: Request, container: Container = Depends(get_container)):
+    headers = {
+        "ETag": container.jwks_etag,
+        "Cache-Control": f"public, max-age={container.settings.jwt.jwks_max_age_seconds}",
+    }
+    if request.headers.get("if-none-match") == container.jwks_etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=container.jwks, media_type="application/json", headers=headers)
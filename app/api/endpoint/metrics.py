@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Response
+
+from app.metrics import render_metrics
+
+router = APIRouter()
+
+
+@router.get(
+    "/metrics",
+    status_code=200,
+    description="Prometheus metrics, summed over the workers",
+    include_in_schema=False,
+)
+async def metrics():
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
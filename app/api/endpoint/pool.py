@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Depends
+
+from app.api.endpoint.auth import require_admin_key
+from app.container import Container, get_container
+
+router = APIRouter()
+
+
+@router.get(
+    "/pool/stats",
+    status_code=200,
+    description="Connection pools statistics and resizing decisions",
+    dependencies=[Depends(require_admin_key)],
+)
+async def pool_stats(container: Container = Depends(get_container)):
+    replicas = container.replica_router.stats() if container.replica_router is not None else {}
+    return {"primary": container.pool_manager.stats(), "replicas": replicas}
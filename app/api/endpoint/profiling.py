@@ -0,0 +1,86 @@
+import time
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import PlainTextResponse
+
+from app.api.endpoint.auth import require_admin_key
+from app.container import Container, get_container
+from app.profiling import SamplingProfiler, sign_profile_token
+from app.schema.profiling import ProfileToken, ProfilingConfig
+
+router = APIRouter(prefix="/profiling", dependencies=[Depends(require_admin_key)])
+
+
+def get_profiler(container: Container = Depends(get_container)) -> SamplingProfiler:
+    if container.profiler is None:
+        # PROFILING_ENABLED isn't set
+        raise HTTPException(status_code=404, detail="Not Found")
+    return container.profiler
+
+
+@router.get(
+    "",
+    status_code=200,
+    description="Sampling ratio and profiled requests, samples and distinct stacks by route",
+)
+async def profiling_stats(profiler: SamplingProfiler = Depends(get_profiler)):
+    return profiler.stats()
+
+
+@router.put(
+    "",
+    status_code=200,
+    description="Change the share of the requests profiled by this worker",
+)
+async def configure_profiling(
+    config: ProfilingConfig, profiler: SamplingProfiler = Depends(get_profiler)
+):
+    profiler.sample_ratio = config.sample_ratio
+    return profiler.stats()
+
+
+@router.get(
+    "/stacks",
+    status_code=200,
+    response_class=PlainTextResponse,
+    description=(
+        "Collapsed stacks of the profiled requests, one `route;frame;frame count` line per distinct"
+        " stack, the input of flamegraph.pl and speedscope"
+    ),
+)
+async def profiling_stacks(
+    route: Optional[str] = Query(None, description="Only this route, e.g. `POST /api/v1/login`"),
+    profiler: SamplingProfiler = Depends(get_profiler),
+):
+    return PlainTextResponse(profiler.collapsed(route))
+
+
+@router.delete(
+    "/stacks",
+    status_code=204,
+    response_class=Response,
+    description="Discard the collected stacks",
+)
+async def reset_profiling_stacks(profiler: SamplingProfiler = Depends(get_profiler)):
+    profiler.reset()
+    return Response(status_code=204)
+
+
+@router.post(
+    "/token",
+    status_code=200,
+    response_model=ProfileToken,
+    description="Sign a token profiling the requests that send it, whatever the sampling ratio",
+)
+async def profile_token(
+    ttl_seconds: int = Query(300, ge=1, le=3600, description="Validity of the token"),
+    profiler: SamplingProfiler = Depends(get_profiler),
+):
+    # the profiler has a key whenever the admin key, required by this endpoint, is set
+    expires_at = int(time.time()) + ttl_seconds
+    return ProfileToken(
+        header="X-Profile-Token",
+        token=sign_profile_token(profiler.token_key, expires_at),
+        expires_at=expires_at,
+    )
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.container import Container, get_container
+from app.schema.token import IntrospectRequest, IntrospectResponse, TokenIntrospection
+from app.service.auth import AuthService, get_auth_service
+
+router = APIRouter()
+
+
+@router.post(
+    "/tokens/introspect",
+    status_code=200,
+    response_model=IntrospectResponse,
+    description="Validate a batch of access tokens",
+)
+async def introspect(
+    request: IntrospectRequest,
+    auth_service: AuthService = Depends(get_auth_service),
+    container: Container = Depends(get_container),
+):
+    max_tokens = container.settings.jwt.introspection_max_tokens
+    if len(request.tokens) > max_tokens:
+        raise HTTPException(status_code=422, detail=f"At most {max_tokens} tokens are allowed")
+    identities = await auth_service.introspect_tokens(request.tokens)
+    return IntrospectResponse(
+        results=[TokenIntrospection.from_identity(identity) for identity in identities]
+    )
@@ -0,0 +1,46 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from app.api.endpoint.auth import require_admin_key
+from app.container import Container, get_container
+from app.repository.postgres.user import UserRepository, get_user_repository
+from app.service.user_export import InvalidCursorError, UserExporter, decode_cursor
+
+router = APIRouter()
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+@router.get(
+    "/users/export",
+    status_code=200,
+    response_class=StreamingResponse,
+    description=(
+        "Stream all the users in id order, as NDJSON or CSV. In NDJSON each page of users is"
+        " followed by a cursor line, passing its token as `cursor` resumes the export after it."
+        " The CSV output has no cursor, an interrupted CSV export is started over."
+    ),
+    dependencies=[Depends(require_admin_key)],
+)
+async def export_users(
+    format: str = Query("ndjson", regex="^(ndjson|csv)$"),
+    cursor: Optional[str] = Query(None, description="Resume the export after this token"),
+    include_password_hash: bool = Query(False, description="Export the password hashes"),
+    container: Container = Depends(get_container),
+    user_repository: UserRepository = Depends(get_user_repository),
+):
+    if cursor is not None:
+        try:
+            decode_cursor(cursor)
+        except InvalidCursorError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    exporter = UserExporter(
+        user_repository,
+        page_size=container.settings.user_export.page_size,
+        include_password=include_password_hash,
+        # the clients can't see our progress, tell them where to resume
+        cursor_lines=True,
+    )
+    return StreamingResponse(exporter.export(format, cursor), media_type=MEDIA_TYPES[format])
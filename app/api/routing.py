@@ -0,0 +1,30 @@
+from typing import Any, Dict, List, Optional
+
+# requests not matching any route, labelled together so scanners don't create label values
+UNMATCHED_ROUTE = "unmatched"
+
+
+class RouteTemplates:
+    """
+    Template of the route matched by a request, e.g. `/api/v1/login`, read back from the
+    endpoint the router stores in the ASGI scope, so the path parameters and the unknown paths
+    don't create new metric series or span names.
+    """
+
+    def __init__(self, routes: List[Any]):
+        # the application routes, a live list also holding the routes added later
+        self.routes = routes
+        self._templates: Dict[Any, str] = {}
+
+    def __call__(self, endpoint: Optional[Any]) -> str:
+        if endpoint is None:
+            return UNMATCHED_ROUTE
+        template = self._templates.get(endpoint)
+        if template is None:
+            # the first request of each endpoint maps the routes again
+            for route in self.routes:
+                target = getattr(route, "endpoint", None) or getattr(route, "app", None)
+                if target is not None and hasattr(route, "path"):
+                    self._templates.setdefault(target, route.path)
+            template = self._templates.setdefault(endpoint, UNMATCHED_ROUTE)
+        return template
@@ -2,8 +2,18 @@ import os
 
 import uvicorn
 
-from app.main import app
+from app.config.settings import get_settings
+from app.main import get_app
 
 if __name__ == "__main__":
     port = os.environ.get("PORT", 5050)
-    uvicorn.run(app, host="0.0.0.0", port=port, access_log=False, log_level="warning")
+    uvicorn.run(
+        get_app(),
+        host="0.0.0.0",
+        port=port,
+        access_log=False,
+        log_level="warning",
+        # the client IP is read from X-Forwarded-For when sent by a trusted proxy
+        proxy_headers=True,
+        forwarded_allow_ips=get_settings().forwarded_allow_ips,
+    )
@@ -1,4 +1,8 @@
-from pydantic import BaseSettings, Field, SecretStr
+import os
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from pydantic import BaseSettings, Field, SecretStr, validator
 
 
 class PostgresSettings(BaseSettings):
@@ -6,31 +10,177 @@ class PostgresSettings(BaseSettings):
     database_name: str = Field("auth", env="DB_NAME")
     user: SecretStr = Field("postgres", env="DB_USER")
     password: SecretStr = Field("postgres", env="DB_PASSWORD")
+    # processes sharing the pool sizes below, set by the multi-worker launcher
+    pool_workers: int = Field(1, env="DB_POOL_WORKERS")
     min_size_pool: int = Field(2, env="DB_MIN_POOL_SIZE")
     max_size_pool: int = Field(10, env="DB_MAX_POOL_SIZE")
+    # resize the pool between the min and max sizes, according to the checkout waits
+    adaptive_pool: bool = Field(False, env="DB_ADAPTIVE_POOL")
+    pool_adjust_interval_seconds: float = Field(1.0, env="DB_POOL_ADJUST_INTERVAL_SECONDS")
+    pool_target_wait_ms: float = Field(5.0, env="DB_POOL_TARGET_WAIT_MS")
+    # the connections idle for longer are closed, down to the min size
+    pool_idle_seconds: float = Field(60.0, env="DB_POOL_IDLE_SECONDS")
+    # "databases" or "asyncpg", the latter queries the pool directly with prepared statements
+    backend: str = Field("databases", env="DB_BACKEND")
+    statement_cache_size: int = Field(100, env="DB_STATEMENT_CACHE_SIZE")
+    # comma separated `host[:port]` of the read replicas, the lookups are sent to them
+    replica_hosts: str = Field("", env="DB_REPLICA_HOSTS")
+    read_your_writes_seconds: float = Field(5.0, env="DB_READ_YOUR_WRITES_SECONDS")
+    replica_retry_seconds: float = Field(10.0, env="DB_REPLICA_RETRY_SECONDS")
+
+    @validator("min_size_pool", "max_size_pool")
+    def divide_pool_budget(cls, size: int, values: Dict) -> int:
+        # the sizes are the budget of the whole server, each worker gets its share
+        return max(1, size // values.get("pool_workers", 1))
+
+    @property
+    def replicas(self) -> List[str]:
+        return [host.strip() for host in self.replica_hosts.split(",") if host.strip()]
+
+
+class UserCacheSettings(BaseSettings):
+    # each worker has its own cache and a write only invalidates the cache of the worker serving it:
+    # the other workers can serve the previous user, and accept its revoked tokens or old password,
+    # for up to ttl_seconds
+    enabled: bool = Field(env="USER_CACHE_ENABLED", default=False)
+    max_size: int = Field(env="USER_CACHE_MAX_SIZE", default=10_000)
+    ttl_seconds: float = Field(env="USER_CACHE_TTL_SECONDS", default=30.0)
 
 
 class JWTSettings(BaseSettings):
     expiration_minutes: int = Field(env="JWT_EXPIRATION_MINUTES", default=60 * 24 * 3)
     secret_key: str = Field(env="JWT_SECRET_KEY", default="super-secret-key##")
     crypto_algorithm: str = Field(env="JWT_CRYPTO_ALGORITHM", default="HS256")
+    # PEM encoded private key of the RS256, ES256 and EdDSA algorithms
+    private_key: Optional[SecretStr] = Field(env="JWT_PRIVATE_KEY", default=None)
+    # directory of <kid>.pem keys, all of them verify tokens, the signing key id one signs them
+    keys_dir: Optional[str] = Field(env="JWT_KEYS_DIR", default=None)
+    signing_key_id: Optional[str] = Field(env="JWT_SIGNING_KEY_ID", default=None)
+    jwks_max_age_seconds: int = Field(env="JWT_JWKS_MAX_AGE_SECONDS", default=300)
+    introspection_max_tokens: int = Field(env="JWT_INTROSPECTION_MAX_TOKENS", default=100)
     otp_token_expiration_seconds: int = Field(env="JWT_OTP_TOKEN_EXPIRATION_SECONDS", default=300)
+    # validate access tokens from their claims only, without loading the user
+    stateless_validation: bool = Field(env="JWT_STATELESS_VALIDATION", default=False)
+    # in stateless mode, compare the user version with the database for tokens older than this
+    user_version_check_seconds: Optional[int] = Field(
+        env="JWT_USER_VERSION_CHECK_SECONDS", default=None
+    )
 
 
 class OTPSettings(BaseSettings):
     digits: str = Field(env="OTP_DIGITS", default="0123456789")
     length: int = Field(env="OTP_LENGTH", default=6)
+    # key of the HMAC binding the OTP to the temp token, derived from the JWT key if not set
+    hmac_key: Optional[SecretStr] = Field(env="OTP_HMAC_KEY", default=None)
+    hmac_algorithm: str = Field(env="OTP_HMAC_ALGORITHM", default="sha256")
+    # accept the temp tokens embedding a bcrypt hash of the OTP, issued by previous versions
+    accept_bcrypt_tokens: bool = Field(env="OTP_ACCEPT_BCRYPT_TOKENS", default=True)
+
+
+class HashSettings(BaseSettings):
+    executor: str = Field(env="HASH_EXECUTOR", default="thread")
+    workers: int = Field(env="HASH_WORKERS", default_factory=lambda: os.cpu_count() or 1)
+    max_queue_size: int = Field(env="HASH_MAX_QUEUE_SIZE", default=64)
+    timeout_seconds: float = Field(env="HASH_TIMEOUT_SECONDS", default=5.0)
+    # scheme of the new password hashes, "bcrypt" or "argon2" (argon2id)
+    scheme: str = Field(env="HASH_SCHEME", default="bcrypt")
+    # bcrypt cost, the passlib default if not set
+    bcrypt_rounds: Optional[int] = Field(env="HASH_BCRYPT_ROUNDS", default=None)
+    argon2_time_cost: int = Field(env="HASH_ARGON2_TIME_COST", default=2)
+    argon2_memory_kib: int = Field(env="HASH_ARGON2_MEMORY_KIB", default=19456)
+    argon2_parallelism: int = Field(env="HASH_ARGON2_PARALLELISM", default=1)
+    # calibrate the cost at startup for a hash to take about this long, instead of the above
+    target_ms: Optional[float] = Field(env="HASH_TARGET_MS", default=None)
+
+
+class AdmissionSettings(BaseSettings):
+    # concurrent logins and registrations, the others wait in the queue
+    max_concurrency: int = Field(
+        env="ADMISSION_MAX_CONCURRENCY", default_factory=lambda: (os.cpu_count() or 1) * 2
+    )
+    max_queue_size: int = Field(env="ADMISSION_MAX_QUEUE_SIZE", default=32)
+    max_wait_seconds: float = Field(env="ADMISSION_MAX_WAIT_SECONDS", default=2.0)
+
+
+class RateLimitSettings(BaseSettings):
+    enabled: bool = Field(env="RATE_LIMIT_ENABLED", default=True)
+    # "memory" limits each worker, "redis" shares the buckets through RATE_LIMIT_REDIS_URL
+    backend: str = Field(env="RATE_LIMIT_BACKEND", default="memory")
+    redis_url: str = Field(env="RATE_LIMIT_REDIS_URL", default="redis://localhost:6379/0")
+    max_keys: int = Field(env="RATE_LIMIT_MAX_KEYS", default=100_000)
+    # bursts of `capacity` attempts, then `refill_per_second` attempts per second
+    ip_capacity: int = Field(env="RATE_LIMIT_IP_CAPACITY", default=30, ge=1)
+    ip_refill_per_second: float = Field(env="RATE_LIMIT_IP_REFILL_PER_SECOND", default=0.5, gt=0)
+    email_capacity: int = Field(env="RATE_LIMIT_EMAIL_CAPACITY", default=10, ge=1)
+    email_refill_per_second: float = Field(
+        env="RATE_LIMIT_EMAIL_REFILL_PER_SECOND", default=0.05, gt=0
+    )
+    otp_capacity: int = Field(env="RATE_LIMIT_OTP_CAPACITY", default=5, ge=1)
+    otp_refill_per_second: float = Field(env="RATE_LIMIT_OTP_REFILL_PER_SECOND", default=0.02, gt=0)
+
+
+class ImportSettings(BaseSettings):
+    # users hashed and inserted together by the bulk registration and the import tool
+    chunk_size: int = Field(env="IMPORT_CHUNK_SIZE", default=1000)
+    # rejected rows listed in a bulk registration response, the counts include the others
+    max_rejected: int = Field(env="IMPORT_MAX_REJECTED", default=1000)
+
+
+class ExportSettings(BaseSettings):
+    # users read per query by the export endpoint and tool
+    page_size: int = Field(env="EXPORT_PAGE_SIZE", default=1000)
+
+
+class TracingSettings(BaseSettings):
+    # "none", "memory" (kept in memory, for the tests) or "file" (JSON lines)
+    exporter: str = Field(env="TRACING_EXPORTER", default="none")
+    file_path: str = Field(env="TRACING_FILE_PATH", default="spans.jsonl")
+    # share of the requests traced, the ones with a traceparent header follow its sampled flag
+    sample_ratio: float = Field(env="TRACING_SAMPLE_RATIO", default=1.0)
+    # spans kept in memory, or batches of spans waiting to be written to the file
+    max_spans: int = Field(env="TRACING_MAX_SPANS", default=10_000)
+
+
+class ProfilingSettings(BaseSettings):
+    # installs the profiling middleware and the administration endpoints
+    enabled: bool = Field(env="PROFILING_ENABLED", default=False)
+    # share of the requests profiled until the administrators change it
+    sample_ratio: float = Field(env="PROFILING_SAMPLE_RATIO", default=0.0)
+    interval_ms: float = Field(env="PROFILING_INTERVAL_MS", default=5.0)
+    # distinct stacks kept per route, the next ones are counted as truncated
+    max_stacks: int = Field(env="PROFILING_MAX_STACKS", default=2000)
 
 
 class Settings(BaseSettings):
     app_name: str = "app"
     debug_mode: bool = False
-    log_level: str = Field(env="LOG_LEVEL", default="DEBUG")
+    log_level: str = Field(env="LOG_LEVEL", default="INFO")
+    # "text" or "json", one object per line with the correlation id of the request
+    log_format: str = Field(env="LOG_FORMAT", default="text")
+    # records waiting for the logging thread before the next ones are dropped, 0 to log inline
+    log_queue_size: int = Field(env="LOG_QUEUE_SIZE", default=10_000)
+    # key of the administration endpoints, sent in the X-Admin-Key header, disabled if not set
+    admin_api_key: Optional[SecretStr] = Field(env="ADMIN_API_KEY", default=None)
+    # serve /metrics and observe the request latencies
+    metrics_enabled: bool = Field(env="METRICS_ENABLED", default=True)
+    # comma-separated IPs of the reverse proxies, "*" for any, whose X-Forwarded-For header gives
+    # the client IP, e.g. of the rate limits, the launchers pass it to uvicorn
+    forwarded_allow_ips: str = Field(env="FORWARDED_ALLOW_IPS", default="127.0.0.1")
 
-    postgres: PostgresSettings = PostgresSettings()
-    jwt: JWTSettings = JWTSettings()
-    otp: OTPSettings = OTPSettings()
+    # built with the Settings instance, so they read the environment at that time
+    postgres: PostgresSettings = Field(default_factory=PostgresSettings)
+    jwt: JWTSettings = Field(default_factory=JWTSettings)
+    otp: OTPSettings = Field(default_factory=OTPSettings)
+    hash: HashSettings = Field(default_factory=HashSettings)
+    user_cache: UserCacheSettings = Field(default_factory=UserCacheSettings)
+    admission: AdmissionSettings = Field(default_factory=AdmissionSettings)
+    rate_limit: RateLimitSettings = Field(default_factory=RateLimitSettings)
+    user_import: ImportSettings = Field(default_factory=ImportSettings)
+    user_export: ExportSettings = Field(default_factory=ExportSettings)
+    tracing: TracingSettings = Field(default_factory=TracingSettings)
+    profiling: ProfilingSettings = Field(default_factory=ProfilingSettings)
 
 
+@lru_cache()
 def get_settings() -> Settings:
     return Settings()
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import logging
+from typing import List, Optional
+
+from fastapi import Request
+
+from app.admission import AdmissionController
+from app.config.settings import Settings
+from app.hash import AsyncHasher, OTPBinder
+from app.jwt_codec import JWTCodec
+from app.profiling import SamplingProfiler
+from app.rate_limit import RateLimiter
+from app.repository.cache import TTLCache
+from app.repository.postgres import create_database_from_settings
+from app.repository.postgres.asyncpg_user import AsyncpgUserRepository, create_asyncpg_pool
+from app.repository.postgres.pool import (
+    MeteredAsyncpgPool,
+    MeteredDatabase,
+    PoolManager,
+    PoolMetrics,
+)
+from app.repository.postgres.replica import Replica, ReplicaRouter
+from app.repository.postgres.user import UserRepository
+from app.service.otp import OTPSenderService, LogOTPSenderService
+from app.tracing import Tracer
+
+
+class Container:
+    """
+    Application-scoped objects: validated settings, JWT keys and stateless services.
+
+    It's built once by `create_app` and stored on the application state,
+    so resolving a dependency is an attribute lookup instead of re-reading the environment.
+    """
+
+    def __init__(self, settings: Settings, otp_service: Optional[OTPSenderService] = None):
+        self.settings = settings
+        self.jwt_codec = JWTCodec.from_settings(settings.jwt)
+        # the key set only changes on restart, serialize it once
+        self.jwks = json.dumps(self.jwt_codec.jwks(), separators=(",", ":")).encode()
+        self.jwks_etag = f'"{hashlib.sha256(self.jwks).hexdigest()[:32]}"'
+        self.hasher = AsyncHasher.from_settings(settings.hash)
+        self.otp_binder = OTPBinder.from_settings(settings.otp, settings.jwt)
+        self.otp_service = otp_service or LogOTPSenderService()
+        # shared by the login and the registration, both bound by bcrypt
+        self.login_admission = AdmissionController.from_settings(settings.admission)
+        self.rate_limiter: Optional[RateLimiter] = RateLimiter.from_settings(settings.rate_limit)
+        # None when the tracing is disabled
+        self.tracer: Optional[Tracer] = Tracer.from_settings(settings.tracing)
+        # None when the profiling is disabled
+        self.profiler: Optional[SamplingProfiler] = SamplingProfiler.from_settings(
+            settings.profiling, settings.admin_api_key
+        )
+        self.user_cache: Optional[TTLCache] = None
+        if settings.user_cache.enabled:
+            self.user_cache = TTLCache(
+                max_size=settings.user_cache.max_size,
+                ttl_seconds=settings.user_cache.ttl_seconds,
+            )
+        self.pool_manager = PoolManager(
+            min_size=settings.postgres.min_size_pool,
+            max_size=settings.postgres.max_size_pool,
+            adaptive=settings.postgres.adaptive_pool,
+            interval_seconds=settings.postgres.pool_adjust_interval_seconds,
+            target_wait_ms=settings.postgres.pool_target_wait_ms,
+        )
+        self.database = None
+        self.db_pool = None
+        self.replica_pools: List = []
+        self.replica_router: Optional[ReplicaRouter] = None
+        # the repositories check a connection out per query, so they are application-scoped
+        self.user_repository: Optional[UserRepository] = None
+        if settings.postgres.backend != "asyncpg":
+            # not connected until the startup
+            self.database = create_database_from_settings(settings.postgres)
+            primary = MeteredDatabase(self.database, self.pool_manager)
+            self.replica_pools = [
+                create_database_from_settings(settings.postgres, host=host)
+                for host in settings.postgres.replicas
+            ]
+            self.replica_router = self._replica_router(primary, self.replica_pools, MeteredDatabase)
+            self.user_repository = UserRepository(
+                db_conn=primary, cache=self.user_cache, replicas=self.replica_router
+            )
+
+    def _replica_router(self, primary, pools: List, metered) -> Optional[ReplicaRouter]:
+        if not pools:
+            return None
+        replicas = []
+        for host, pool in zip(self.settings.postgres.replicas, pools):
+            metrics = PoolMetrics(name=host)
+            replicas.append(Replica(name=host, executor=metered(pool, metrics), metrics=metrics))
+        return ReplicaRouter(
+            primary=primary,
+            replicas=replicas,
+            read_your_writes_seconds=self.settings.postgres.read_your_writes_seconds,
+            retry_seconds=self.settings.postgres.replica_retry_seconds,
+        )
+
+    async def startup(self) -> None:
+        # startup the database connection pools
+        if self.settings.postgres.backend == "asyncpg":
+            self.db_pool = await create_asyncpg_pool(self.settings.postgres)
+            self.replica_pools = [
+                await create_asyncpg_pool(self.settings.postgres, host=host)
+                for host in self.settings.postgres.replicas
+            ]
+            primary = MeteredAsyncpgPool(self.db_pool, self.pool_manager)
+            self.replica_router = self._replica_router(
+                primary, self.replica_pools, MeteredAsyncpgPool
+            )
+            self.user_repository = AsyncpgUserRepository(
+                primary, cache=self.user_cache, replicas=self.replica_router
+            )
+        else:
+            await self.database.connect()
+            for replica_database in self.replica_pools:
+                await replica_database.connect()
+        await self.pool_manager.warm_up(self._checkout)
+        self.pool_manager.start()
+
+    def _checkout(self):
+        if self.db_pool is not None:
+            return self.db_pool.acquire()
+        return self.database.connection()
+
+    async def shutdown(self) -> None:
+        await self.pool_manager.stop()
+        logging.info("Connection pool statistics: %s", self.pool_manager.as_dict())
+        if self.replica_router is not None:
+            logging.info("Read replicas statistics: %s", self.replica_router.stats())
+        # shutdown the database connection pools
+        if self.db_pool is not None:
+            await self.db_pool.close()
+            for pool in self.replica_pools:
+                await pool.close()
+            self.db_pool = None
+            self.replica_pools = []
+            self.user_repository = None
+        else:
+            await self.database.disconnect()
+            for replica_database in self.replica_pools:
+                await replica_database.disconnect()
+        # stop the hashing workers
+        self.hasher.shutdown()
+        if self.tracer is not None:
+            self.tracer.shutdown()
+        if self.profiler is not None:
+            self.profiler.stop()
+
+
+def get_container(request: Request) -> Container:
+    return request.app.state.container
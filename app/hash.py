@@ -1,22 +1,381 @@
-from passlib.context import CryptContext
+import asyncio
+import hashlib
+import hmac
+import logging
+import math
+import secrets
+import statistics
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Tuple
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from app.config.settings import HashSettings, JWTSettings, OTPSettings
+from app.metrics import HASH_SECONDS, timed
+from app.tracing import span
 
+if TYPE_CHECKING:
+    from passlib.context import CryptContext
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+PASSWORD_SCHEMES = ("bcrypt", "argon2")
+# bounds of the calibrated costs, the lower ones are the minimum recommended whatever the hardware
+BCRYPT_MIN_ROUNDS = 10
+BCRYPT_MAX_ROUNDS = 16
+ARGON2_MIN_TIME_COST = 1
+ARGON2_MAX_TIME_COST = 10
 
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+@dataclass(frozen=True)
+class PasswordPolicy:
+    """
+    Scheme and cost of the new password hashes.
 
+    The hashes of the other scheme, or of a lower cost, are still verified and reported as
+    needing a rehash. A cost left to None is the passlib default.
+    """
 
-otp_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    scheme: str = "bcrypt"
+    bcrypt_rounds: Optional[int] = None
+    argon2_time_cost: int = 2
+    argon2_memory_kib: int = 19456
+    argon2_parallelism: int = 1
+
+    @classmethod
+    def from_settings(cls, settings: HashSettings) -> "PasswordPolicy":
+        if settings.scheme not in PASSWORD_SCHEMES:
+            raise ValueError(f"Unsupported password hashing scheme: {settings.scheme}")
+        return cls(
+            scheme=settings.scheme,
+            bcrypt_rounds=settings.bcrypt_rounds,
+            argon2_time_cost=settings.argon2_time_cost,
+            argon2_memory_kib=settings.argon2_memory_kib,
+            argon2_parallelism=settings.argon2_parallelism,
+        )
+
+    def context_options(self) -> Dict[str, Any]:
+        options: Dict[str, Any] = {
+            "schemes": [self.scheme, *(s for s in PASSWORD_SCHEMES if s != self.scheme)],
+            "deprecated": "auto",
+            "argon2__type": "ID",
+            "argon2__rounds": self.argon2_time_cost,
+            "argon2__min_rounds": self.argon2_time_cost,
+            "argon2__memory_cost": self.argon2_memory_kib,
+            "argon2__parallelism": self.argon2_parallelism,
+        }
+        if self.bcrypt_rounds is not None:
+            options["bcrypt__default_rounds"] = self.bcrypt_rounds
+            options["bcrypt__min_rounds"] = self.bcrypt_rounds
+        return options
+
+
+DEFAULT_PASSWORD_POLICY = PasswordPolicy()
+
+
+# passlib and its backends are loaded by the first hash, not when the app is imported
+def get_pwd_context(policy: PasswordPolicy = DEFAULT_PASSWORD_POLICY) -> "CryptContext":
+    return _create_pwd_context(policy)
+
+
+@lru_cache()
+def _create_pwd_context(policy: PasswordPolicy) -> "CryptContext":
+    from passlib.context import CryptContext
+
+    return CryptContext(**policy.context_options())
+
+
+@lru_cache()
+def get_otp_context() -> "CryptContext":
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def __getattr__(name: str):
+    # `pwd_context` and `otp_context` stay importable module attributes
+    if name == "pwd_context":
+        return get_pwd_context()
+    if name == "otp_context":
+        return get_otp_context()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_password_hash(password, policy: PasswordPolicy = DEFAULT_PASSWORD_POLICY):
+    return get_pwd_context(policy).hash(password)
+
+
+def verify_password(
+    plain_password, hashed_password, policy: PasswordPolicy = DEFAULT_PASSWORD_POLICY
+):
+    return get_pwd_context(policy).verify(plain_password, hashed_password)
+
+
+def password_needs_rehash(
+    hashed_password, policy: PasswordPolicy = DEFAULT_PASSWORD_POLICY
+) -> bool:
+    """
+    Tell if a password hash doesn't match the policy, by scheme or cost. Only parses the hash.
+
+    :param hashed_password: The stored hash.
+    :param policy: The policy of the new hashes.
+
+    :return: True if the hash should be replaced on the next successful login.
+    """
+    try:
+        return get_pwd_context(policy).needs_update(hashed_password)
+    except ValueError:
+        # not a hash of a known scheme, there's nothing it could be upgraded from
+        return False
+
+
+def is_password_hash(value: str, policy: PasswordPolicy = DEFAULT_PASSWORD_POLICY) -> bool:
+    """Tell if a value is a hash of one of the supported schemes, e.g. an imported one."""
+    return get_pwd_context(policy).identify(value) is not None
+
+
+def _measure_hash(policy: PasswordPolicy, samples: int = 3) -> float:
+    context = get_pwd_context(policy)
+    durations = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        context.hash("calibration-password")
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+def calibrate_password_policy(
+    policy: PasswordPolicy,
+    target_ms: float,
+    measure: Optional[Callable[[PasswordPolicy], float]] = None,
+) -> PasswordPolicy:
+    """
+    Pick the highest cost whose hash, and verification, takes at most `target_ms` on this machine.
+
+    A bcrypt round doubles the time, the argon2 time cost increases it linearly, so the time is
+    measured once at the minimum cost and extrapolated. The cost never goes below the minimum,
+    even when the machine is too slow to meet the target.
+
+    :param policy: The policy to calibrate, its scheme and argon2 memory are kept.
+    :param target_ms: The target hashing time.
+    :param measure: Returns the seconds a hash takes with a policy, measured by default.
+
+    :return: The calibrated policy.
+    """
+    measure = measure or _measure_hash
+    if policy.scheme == "argon2":
+        baseline_ms = measure(replace(policy, argon2_time_cost=ARGON2_MIN_TIME_COST)) * 1000
+        time_cost = ARGON2_MIN_TIME_COST * math.floor(target_ms / baseline_ms)
+        time_cost = min(ARGON2_MAX_TIME_COST, max(ARGON2_MIN_TIME_COST, time_cost))
+        calibrated = replace(policy, argon2_time_cost=time_cost)
+    else:
+        baseline_ms = measure(replace(policy, bcrypt_rounds=BCRYPT_MIN_ROUNDS)) * 1000
+        rounds = BCRYPT_MIN_ROUNDS + math.floor(math.log2(max(target_ms / baseline_ms, 1)))
+        calibrated = replace(policy, bcrypt_rounds=min(BCRYPT_MAX_ROUNDS, rounds))
+    logging.info(
+        "Password hashing calibrated for %sms: %s (minimum cost took %.1fms)",
+        target_ms,
+        calibrated,
+        baseline_ms,
+    )
+    return calibrated
 
 
 def get_otp_hash(otp):
-    return otp_context.hash(otp)
+    return get_otp_context().hash(otp)
 
 
 def verify_otp(plain_otp, hashed_otp):
-    return otp_context.verify(plain_otp, hashed_otp)
+    return get_otp_context().verify(plain_otp, hashed_otp)
+
+
+class OTPBinder:
+    """
+    Binds an OTP to a temp token with a keyed HMAC of the token subject, a random nonce and
+    the OTP, which replaces the bcrypt hash of the OTP embedded in the token.
+
+    The token is already signed and short-lived, the nonce makes every binding unique and the
+    server-side key prevents brute forcing the OTP from the token claims.
+    """
+
+    def __init__(self, key: bytes, algorithm: str = "sha256"):
+        if algorithm not in hashlib.algorithms_available:
+            raise ValueError(f"Unsupported OTP HMAC algorithm: {algorithm}")
+        self.key = key
+        self.algorithm = algorithm
+
+    @classmethod
+    def from_settings(cls, otp_settings: OTPSettings, jwt_settings: JWTSettings) -> "OTPBinder":
+        if otp_settings.hmac_key is not None:
+            key = otp_settings.hmac_key.get_secret_value().encode()
+        else:
+            # don't reuse the JWT signing key as is, derive a dedicated one
+            key = hmac.digest(jwt_settings.secret_key.encode(), b"otp-binding", "sha256")
+        return cls(key=key, algorithm=otp_settings.hmac_algorithm)
+
+    def _mac(self, subject: str, nonce: str, otp: str) -> str:
+        message = f"{subject}.{nonce}.{otp}".encode()
+        return hmac.new(self.key, message, self.algorithm).hexdigest()
+
+    def bind(self, subject: str, otp: str) -> Tuple[str, str]:
+        """
+        Bind an OTP to a token subject.
+
+        :param subject: The subject of the temp token.
+        :param otp: The generated OTP.
+
+        :return: The nonce and the MAC to embed in the temp token.
+        """
+        nonce = secrets.token_urlsafe(16)
+        return nonce, self._mac(subject, nonce, otp)
+
+    def verify(self, subject: str, otp: str, nonce: str, mac: str) -> bool:
+        return hmac.compare_digest(self._mac(subject, nonce, otp), mac)
+
+
+class HashingUnavailableError(Exception):
+    """Raised when a hashing job is rejected or timed out, the workers are overloaded."""
+
+    def __init__(self, message: str, retry_after_seconds: int = 1):
+        super().__init__(message)
+        self.retry_after_seconds = retry_after_seconds
+
+
+class HashingQueueFullError(HashingUnavailableError):
+    pass
+
+
+class HashingTimeoutError(HashingUnavailableError):
+    pass
+
+
+_HASH_PASSWORD_SECONDS = HASH_SECONDS.labels("get_password_hash")
+_VERIFY_PASSWORD_SECONDS = HASH_SECONDS.labels("verify_password")
+_HASH_OTP_SECONDS = HASH_SECONDS.labels("get_otp_hash")
+_VERIFY_OTP_SECONDS = HASH_SECONDS.labels("verify_otp")
+
+
+class AsyncHasher:
+    """
+    Runs the blocking hash functions above on a bounded executor, so that a bcrypt round
+    never blocks the event loop.
+
+    A thread pool is enough for bcrypt because it releases the GIL while hashing,
+    a process pool can be selected for hashing backends that don't.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        max_queue_size: int,
+        timeout_seconds: float,
+        executor: str = "thread",
+        policy: PasswordPolicy = DEFAULT_PASSWORD_POLICY,
+    ):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unsupported hashing executor: {executor}")
+        self.workers = workers
+        self.max_queue_size = max_queue_size
+        self.timeout_seconds = timeout_seconds
+        self.executor = executor
+        self.policy = policy
+        self._executor: Optional[Executor] = None
+        self._in_flight = 0
+
+    @classmethod
+    def from_settings(cls, settings: HashSettings) -> "AsyncHasher":
+        policy = PasswordPolicy.from_settings(settings)
+        if settings.target_ms is not None:
+            policy = calibrate_password_policy(policy, settings.target_ms)
+        return cls(
+            workers=settings.workers,
+            max_queue_size=settings.max_queue_size,
+            timeout_seconds=settings.timeout_seconds,
+            executor=settings.executor,
+            policy=policy,
+        )
+
+    @property
+    def in_flight(self) -> int:
+        """Number of hashing jobs running or waiting for a worker."""
+        return self._in_flight
+
+    def retry_after(self) -> int:
+        """Seconds for the jobs in flight to complete or time out, at least one."""
+        return max(1, math.ceil(self.timeout_seconds))
+
+    def _get_executor(self) -> Executor:
+        # the pool is created on first use, so importing or building the hasher is cheap
+        if self._executor is None:
+            if self.executor == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="hasher"
+                )
+        return self._executor
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run a hash function on the executor.
+
+        :param func: The blocking function to run, must be picklable for the process executor.
+        :param args: The positional arguments of the function.
+
+        :raises HashingQueueFullError: If the workers are busy and the wait queue is full.
+        :raises HashingTimeoutError: If the job didn't complete within the configured timeout.
+
+        :return: The result of the function.
+        """
+        if self._in_flight >= self.workers + self.max_queue_size:
+            raise HashingQueueFullError("Hashing queue is full", self.retry_after())
+        loop = asyncio.get_running_loop()
+        job = self._get_executor().submit(func, *args)
+        self._in_flight += 1
+        # released when the job is done, not when the caller gives up on it: a timed out job
+        # keeps a worker busy until it completes
+        job.add_done_callback(lambda _: self._release(loop))
+        try:
+            # cancelling the wrapping future on timeout drops the job if it's still queued
+            return await asyncio.wait_for(asyncio.wrap_future(job), timeout=self.timeout_seconds)
+        except asyncio.TimeoutError:
+            raise HashingTimeoutError("Hashing timed out", self.retry_after())
+
+    def _release(self, loop: asyncio.AbstractEventLoop) -> None:
+        # called from the worker thread, the count is only changed on the event loop
+        try:
+            loop.call_soon_threadsafe(self._decrement_in_flight)
+        except RuntimeError:
+            # the loop is closed
+            pass
+
+    def _decrement_in_flight(self) -> None:
+        self._in_flight -= 1
+
+    async def get_password_hash(self, password: str) -> str:
+        with span("hash.get_password_hash", {"hash.scheme": self.policy.scheme}):
+            return await timed(
+                _HASH_PASSWORD_SECONDS, self.run(get_password_hash, password, self.policy)
+            )
+
+    async def verify_password(self, plain_password: str, hashed_password: str) -> bool:
+        with span("hash.verify_password"):
+            return await timed(
+                _VERIFY_PASSWORD_SECONDS,
+                self.run(verify_password, plain_password, hashed_password, self.policy),
+            )
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        return password_needs_rehash(hashed_password, self.policy)
+
+    async def get_otp_hash(self, otp: str) -> str:
+        with span("hash.get_otp_hash"):
+            return await timed(_HASH_OTP_SECONDS, self.run(get_otp_hash, otp))
+
+    async def verify_otp(self, plain_otp: str, hashed_otp: str) -> bool:
+        with span("hash.verify_otp"):
+            return await timed(_VERIFY_OTP_SECONDS, self.run(verify_otp, plain_otp, hashed_otp))
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
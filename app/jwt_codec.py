@@ -0,0 +1,364 @@
+import base64
+import binascii
+import calendar
+import hashlib
+import hmac
+import json
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import (
+    decode_dss_signature,
+    encode_dss_signature,
+)
+from cryptography.hazmat.primitives.serialization import (
+    Encoding,
+    PublicFormat,
+    load_pem_private_key,
+    load_pem_public_key,
+)
+
+from app.config.settings import JWTSettings
+from app.metrics import JWT_SECONDS
+from app.tracing import span
+
+HMAC_ALGORITHMS = {
+    "HS256": hashlib.sha256,
+    "HS384": hashlib.sha384,
+    "HS512": hashlib.sha512,
+}
+RSA_ALGORITHM = "RS256"
+EC_ALGORITHM = "ES256"
+EDDSA_ALGORITHM = "EdDSA"
+ASYMMETRIC_ALGORITHMS = frozenset((RSA_ALGORITHM, EC_ALGORITHM, EDDSA_ALGORITHM))
+SUPPORTED_ALGORITHMS = frozenset((*HMAC_ALGORITHMS, *ASYMMETRIC_ALGORITHMS))
+# size in bytes of the P-256 coordinates and signature halves
+EC_COORDINATE_SIZE = 32
+
+_ENCODE_SECONDS = JWT_SECONDS.labels("encode")
+_DECODE_SECONDS = JWT_SECONDS.labels("decode")
+
+
+class TokenError(Exception):
+    pass
+
+
+def base64url_encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def base64url_decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+
+def _b64_uint(value: int, size: Optional[int] = None) -> str:
+    size = size or (value.bit_length() + 7) // 8
+    return base64url_encode(value.to_bytes(size, "big")).decode()
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return calendar.timegm(value.utctimetuple())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def algorithm_for_key(key: Any) -> str:
+    """
+    Get the JWS algorithm of an asymmetric key.
+
+    :param key: A private or public RSA, P-256 or Ed25519 key.
+
+    :raises ValueError: If the key type isn't supported.
+
+    :return: The JWS algorithm.
+    """
+    if isinstance(key, (rsa.RSAPrivateKey, rsa.RSAPublicKey)):
+        return RSA_ALGORITHM
+    if isinstance(key, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)):
+        if not isinstance(key.curve, ec.SECP256R1):
+            raise ValueError(f"Unsupported elliptic curve: {key.curve.name}")
+        return EC_ALGORITHM
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+        return EDDSA_ALGORITHM
+    raise ValueError(f"Unsupported key type: {type(key).__name__}")
+
+
+def load_pem_key(data: bytes) -> Any:
+    """Load a PEM encoded private or public key."""
+    if b"PRIVATE KEY" in data:
+        return load_pem_private_key(data, None)
+    return load_pem_public_key(data)
+
+
+class JWTKey:
+    """
+    A signing or verification key with its JWS algorithm and key id.
+
+    HMAC keys are bytes secrets, asymmetric keys are `cryptography` key objects,
+    private keys can sign and verify, public keys can only verify.
+    """
+
+    def __init__(self, algorithm: str, key: Any, kid: Optional[str] = None):
+        if algorithm not in SUPPORTED_ALGORITHMS:
+            raise ValueError(f"Unsupported JWT algorithm: {algorithm}")
+        self.algorithm = algorithm
+        if algorithm in HMAC_ALGORITHMS:
+            self._digest = HMAC_ALGORITHMS[algorithm]
+            self._secret = key.encode() if isinstance(key, str) else key
+            self._private_key = None
+            self.can_sign = True
+        else:
+            if isinstance(key, (str, bytes)) or algorithm_for_key(key) != algorithm:
+                raise ValueError(f"The key doesn't match the {algorithm} algorithm")
+            self.can_sign = hasattr(key, "public_key")
+            self._private_key = key if self.can_sign else None
+            self._public_key = key.public_key() if self.can_sign else key
+        self.kid = kid or (self.thumbprint() if algorithm in ASYMMETRIC_ALGORITHMS else None)
+
+    @property
+    def private_key(self) -> Any:
+        return self._private_key
+
+    def sign(self, signing_input: bytes) -> bytes:
+        if self.algorithm in HMAC_ALGORITHMS:
+            return hmac.new(self._secret, signing_input, self._digest).digest()
+        if not self.can_sign:
+            raise ValueError("A public key can't sign tokens")
+        if self.algorithm == RSA_ALGORITHM:
+            return self._private_key.sign(signing_input, padding.PKCS1v15(), hashes.SHA256())
+        if self.algorithm == EC_ALGORITHM:
+            # JWS uses the raw r || s encoding instead of DER
+            r, s = decode_dss_signature(
+                self._private_key.sign(signing_input, ec.ECDSA(hashes.SHA256()))
+            )
+            return r.to_bytes(EC_COORDINATE_SIZE, "big") + s.to_bytes(EC_COORDINATE_SIZE, "big")
+        return self._private_key.sign(signing_input)
+
+    def verify(self, signing_input: bytes, signature: bytes) -> bool:
+        if self.algorithm in HMAC_ALGORITHMS:
+            expected = hmac.new(self._secret, signing_input, self._digest).digest()
+            return hmac.compare_digest(expected, signature)
+        try:
+            if self.algorithm == RSA_ALGORITHM:
+                self._public_key.verify(
+                    signature, signing_input, padding.PKCS1v15(), hashes.SHA256()
+                )
+            elif self.algorithm == EC_ALGORITHM:
+                if len(signature) != 2 * EC_COORDINATE_SIZE:
+                    return False
+                der_signature = encode_dss_signature(
+                    int.from_bytes(signature[:EC_COORDINATE_SIZE], "big"),
+                    int.from_bytes(signature[EC_COORDINATE_SIZE:], "big"),
+                )
+                self._public_key.verify(der_signature, signing_input, ec.ECDSA(hashes.SHA256()))
+            else:
+                self._public_key.verify(signature, signing_input)
+            return True
+        except InvalidSignature:
+            return False
+
+    def _public_jwk_members(self) -> Dict[str, str]:
+        # the required members of the public JWK, RFC 7638 section 3.2
+        if self.algorithm == RSA_ALGORITHM:
+            numbers = self._public_key.public_numbers()
+            return {"e": _b64_uint(numbers.e), "kty": "RSA", "n": _b64_uint(numbers.n)}
+        if self.algorithm == EC_ALGORITHM:
+            numbers = self._public_key.public_numbers()
+            return {
+                "crv": "P-256",
+                "kty": "EC",
+                "x": _b64_uint(numbers.x, EC_COORDINATE_SIZE),
+                "y": _b64_uint(numbers.y, EC_COORDINATE_SIZE),
+            }
+        raw = self._public_key.public_bytes(Encoding.Raw, PublicFormat.Raw)
+        return {"crv": "Ed25519", "kty": "OKP", "x": base64url_encode(raw).decode()}
+
+    def thumbprint(self) -> str:
+        """RFC 7638 SHA-256 thumbprint of the public key, used as default key id."""
+        members = json.dumps(self._public_jwk_members(), separators=(",", ":"), sort_keys=True)
+        return base64url_encode(hashlib.sha256(members.encode()).digest()).decode()
+
+    def to_public_jwk(self) -> Optional[Dict[str, str]]:
+        """
+        The public JWK of the key.
+
+        :return: The JWK, None for HMAC secrets which must never be published.
+        """
+        if self.algorithm in HMAC_ALGORITHMS:
+            return None
+        return {**self._public_jwk_members(), "kid": self.kid, "alg": self.algorithm, "use": "sig"}
+
+
+class JWTCodec:
+    """
+    Compact JWS codec for the algorithms used by the application.
+
+    Unlike `jose.jwt`, the key objects and the encoded header are built once, the claims are
+    serialized with compact JSON and decoding only validates the claims we rely on:
+    the signature, the algorithm, `exp` and `sub`. Tokens are interchangeable with `jose.jwt`.
+
+    Tokens are signed with a single key and verified with any of the verification keys,
+    selected by the `kid` header, which allows rotating asymmetric keys.
+    """
+
+    def __init__(
+        self,
+        algorithm: str,
+        key: Any,
+        kid: Optional[str] = None,
+        verification_keys: Iterable[JWTKey] = (),
+    ):
+        """
+        :param algorithm: One of the supported JWS algorithms.
+        :param key: The HMAC secret for the HS algorithms, a private key for the others.
+        :param kid: The id of the signing key, the key thumbprint by default for private keys.
+        :param verification_keys: Additional keys accepted when decoding, e.g. rotated keys.
+        """
+        self.signing_key = JWTKey(algorithm, key, kid)
+        if not self.signing_key.can_sign:
+            raise ValueError(f"{algorithm} requires a private key to sign tokens")
+        self.algorithm = algorithm
+        self.verification_keys: Dict[Optional[str], JWTKey] = {
+            verification_key.kid: verification_key for verification_key in verification_keys
+        }
+        self.verification_keys[self.signing_key.kid] = self.signing_key
+        header = {"alg": algorithm, "typ": "JWT"}
+        if self.signing_key.kid is not None:
+            header["kid"] = self.signing_key.kid
+        self._header = base64url_encode(json.dumps(header, separators=(",", ":")).encode())
+
+    @classmethod
+    def from_settings(cls, settings: JWTSettings) -> "JWTCodec":
+        """
+        Build the codec from the settings.
+
+        HS algorithms sign with `JWT_SECRET_KEY`. The other algorithms sign with the private key
+        `JWT_PRIVATE_KEY` or `<JWT_SIGNING_KEY_ID>.pem` in `JWT_KEYS_DIR`, and verify with every
+        `<kid>.pem` key of the directory, so that tokens signed by a rotated key stay valid.
+        """
+        algorithm = settings.crypto_algorithm
+        if algorithm in HMAC_ALGORITHMS:
+            return cls(algorithm, settings.secret_key)
+
+        keys = load_keys_dir(settings.keys_dir) if settings.keys_dir else []
+        if settings.private_key is not None:
+            key = load_pem_key(settings.private_key.get_secret_value().encode())
+        elif settings.signing_key_id is not None:
+            matching = [k for k in keys if k.kid == settings.signing_key_id and k.can_sign]
+            if not matching:
+                raise ValueError(f"No private key found for kid {settings.signing_key_id}")
+            key = matching[0].private_key
+        else:
+            raise ValueError(f"JWT_PRIVATE_KEY or JWT_SIGNING_KEY_ID is required by {algorithm}")
+        return cls(algorithm, key, kid=settings.signing_key_id, verification_keys=keys)
+
+    def jwks(self) -> Dict[str, List[Dict[str, str]]]:
+        """The JWK set of the public verification keys."""
+        jwks = [key.to_public_jwk() for key in self.verification_keys.values()]
+        return {"keys": [jwk for jwk in jwks if jwk is not None]}
+
+    def _get_verification_key(self, header: bytes) -> JWTKey:
+        # our own tokens share the precomputed header, only parse the others
+        if header == self._header:
+            return self.signing_key
+        header = json.loads(base64url_decode(header))
+        if not isinstance(header, dict):
+            raise TokenError("Invalid header")
+        kid = header.get("kid")
+        # a forged header can hold any JSON value, unhashable ones can't be looked up
+        if kid is not None and not isinstance(kid, str):
+            raise TokenError("Invalid key id")
+        key = self.verification_keys.get(kid)
+        if key is None:
+            raise TokenError("Unknown key id")
+        if header.get("alg") != key.algorithm:
+            raise TokenError("The specified alg value is not allowed")
+        return key
+
+    def encode(self, claims: Dict) -> str:
+        """
+        Encode and sign the claims, datetime values are converted to timestamps.
+
+        :param claims: The token claims.
+
+        :return: The compact serialized token.
+        """
+        with span("jwt.encode", {"jwt.alg": self.signing_key.algorithm}):
+            start = time.perf_counter()
+            payload = base64url_encode(
+                json.dumps(claims, separators=(",", ":"), default=_json_default).encode()
+            )
+            signing_input = self._header + b"." + payload
+            signature = self.signing_key.sign(signing_input)
+            token = (signing_input + b"." + base64url_encode(signature)).decode()
+            _ENCODE_SECONDS.observe(time.perf_counter() - start)
+            return token
+
+    def decode(self, token: str) -> Dict:
+        """
+        Verify a token and decode its claims.
+
+        :param token: The compact serialized token.
+
+        :raises TokenError: If the token is malformed, the signature, the key id or the
+            algorithm don't match, it's expired or its subject isn't a string.
+
+        :return: The token claims.
+        """
+        with span("jwt.decode"):
+            start = time.perf_counter()
+            try:
+                return self._decode(token)
+            finally:
+                _DECODE_SECONDS.observe(time.perf_counter() - start)
+
+    def _decode(self, token: str) -> Dict:
+        try:
+            raw = token.encode("ascii")
+            signing_input, signature = raw.rsplit(b".", 1)
+            header, payload = signing_input.split(b".", 1)
+            key = self._get_verification_key(header)
+            if not key.verify(signing_input, base64url_decode(signature)):
+                raise TokenError("Signature verification failed")
+            claims = json.loads(base64url_decode(payload))
+        except TokenError:
+            raise
+        except (ValueError, AttributeError, binascii.Error, UnicodeError, RecursionError):
+            # RecursionError: a header or payload nested too deep for the JSON decoder
+            raise TokenError("Malformed token")
+
+        if not isinstance(claims, dict):
+            raise TokenError("Invalid payload")
+        exp = claims.get("exp")
+        if exp is not None:
+            if not isinstance(exp, (int, float)):
+                raise TokenError("Expiration Time claim (exp) must be an integer")
+            if exp < time.time():
+                raise TokenError("Signature has expired")
+        if "sub" in claims and not isinstance(claims["sub"], str):
+            raise TokenError("Subject must be a string")
+        return claims
+
+
+def load_keys_dir(path: str) -> List[JWTKey]:
+    """
+    Load the `<kid>.pem` private or public keys of a directory.
+
+    :param path: The keys directory.
+
+    :return: The keys, with the file name as key id.
+    """
+    keys = []
+    for file_name in sorted(os.listdir(path)):
+        kid, extension = os.path.splitext(file_name)
+        if extension != ".pem":
+            continue
+        with open(os.path.join(path, file_name), "rb") as key_file:
+            key = load_pem_key(key_file.read())
+        keys.append(JWTKey(algorithm_for_key(key), key, kid))
+    return keys
@@ -1,25 +1,166 @@
+import copy
+import json
 import logging
-from typing import Dict
+import os
+import queue
+import time
+from logging.handlers import QueueListener
+from typing import Dict, Optional, TextIO
 
 from asgi_correlation_id.log_filters import CorrelationIdFilter
 
 from app.config.settings import Settings
 
+# requests not worth a log line
+EXCLUDED_PATHS = ("/healthz", "/docs", "/openapi.json", "/metrics")
+
 
 class EndpointFilter(logging.Filter):
     def filter(self, record: logging.LogRecord) -> bool:
         """
-        Filter out the health check endpoints.
+        Filter out the health check, documentation and metrics endpoints.
 
         :param record: The log record to filter.
 
         :return: True if the record should be logged, False otherwise.
         """
-        return (
-            record.getMessage().find("/healthz") == -1
-            and record.getMessage().find("/docs") == -1
-            and record.getMessage().find("/openapi.json") == -1
-        )
+        # merged once, the queue handler and the formatters reuse it
+        record.message = message = record.getMessage()
+        return not any(path in message for path in EXCLUDED_PATHS)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as a single line JSON object, with the correlation id of its request.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "correlation_id": getattr(record, "correlation_id", None),
+            "process": record.process,
+            "module": record.module,
+            "function": record.funcName,
+            "line": record.lineno,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+    def formatTime(self, record: logging.LogRecord, datefmt: Optional[str] = None) -> str:
+        # ISO 8601 in UTC, with milliseconds
+        created = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+        return f"{created}.{int(record.msecs):03d}Z"
+
+
+class QueueLoggingHandler(logging.Handler):
+    """
+    Writes the records to a stream from a background thread, so that the formatting and the
+    I/O don't block the event loop.
+
+    The filters run in the thread logging the record, where the correlation id of the request
+    is known, and the message arguments are merged there, the rest is left to the listener.
+    Until `start` is called, and in the processes forked since, the records are written
+    synchronously: a thread doesn't survive a fork, so the launcher leaves the listeners to the
+    workers, which start theirs with the application.
+    When `queue_size` records are waiting the next ones are dropped instead of blocking.
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None, queue_size: int = 10_000):
+        super().__init__()
+        self.target = logging.StreamHandler(stream)
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        self._listener: Optional[QueueListener] = None
+        self._pid: Optional[int] = None
+
+    def setFormatter(self, fmt: Optional[logging.Formatter]) -> None:
+        super().setFormatter(fmt)
+        self.target.setFormatter(fmt)
+
+    @property
+    def started(self) -> bool:
+        return self._listener is not None and self._pid == os.getpid()
+
+    def start(self) -> None:
+        if self.started:
+            return
+        self._queue = queue.SimpleQueue()
+        self._listener = QueueListener(self._queue, self.target)
+        self._pid = os.getpid()
+        self._listener.start()
+
+    def stop(self) -> None:
+        """Write the pending records and stop the listener thread."""
+        if not self.started:
+            return
+        self._listener.stop()
+        self._listener = None
+        if self.dropped:
+            self.target.handle(
+                logging.makeLogRecord(
+                    {
+                        "levelno": logging.WARNING,
+                        "levelname": "WARNING",
+                        "msg": "%d log records dropped, the logging queue was full",
+                        "args": (self.dropped,),
+                        "correlation_id": None,
+                    }
+                )
+            )
+            self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the arguments may change or be released once the call returns, unlike the
+        # QueueHandler of the standard library the traceback is formatted by the listener
+        record = copy.copy(record)
+        message = record.__dict__.get("message")
+        record.msg = message if message is not None else record.getMessage()
+        record.args = None
+        return record
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if not self.started:
+            self.target.handle(record)
+            return
+        if self._queue.qsize() >= self.queue_size:
+            self.dropped += 1
+            return
+        try:
+            self._queue.put_nowait(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+    def close(self) -> None:
+        # called by logging.shutdown at exit
+        self.stop()
+        super().close()
+
+
+def _queue_handlers():
+    return [
+        handler
+        for handler in logging.getLogger().handlers
+        if isinstance(handler, QueueLoggingHandler)
+    ]
+
+
+def start_log_listener() -> None:
+    """Move the log writes of the current process to the background thread."""
+    for handler in _queue_handlers():
+        handler.start()
+
+
+def stop_log_listener() -> None:
+    """Flush the queued records and write the next ones synchronously."""
+    for handler in _queue_handlers():
+        handler.stop()
 
 
 def get_logging_config(settings: Settings) -> Dict:
@@ -31,7 +172,16 @@ def get_logging_config(settings: Settings) -> Dict:
     :return: The logging configuration.
     """
     log_level = settings.log_level
-    formatter = logging.Formatter
+    console = {
+        "level": "DEBUG",
+        "filters": ["correlation_id", "endpoint_filter"],
+        "formatter": "json_formatter" if settings.log_format == "json" else "stdout_formatter",
+        "stream": "ext://sys.stdout",
+    }
+    if settings.log_queue_size > 0:
+        console.update({"()": QueueLoggingHandler, "queue_size": settings.log_queue_size})
+    else:
+        console["class"] = "logging.StreamHandler"
 
     return {
         "version": 1,
@@ -42,22 +192,15 @@ def get_logging_config(settings: Settings) -> Dict:
         },
         "formatters": {
             "stdout_formatter": {
-                "()": formatter,
+                "()": logging.Formatter,
                 "fmt": (
                     "%(asctime)s | %(name)s | [%(correlation_id)s] | %(process)d | %(module)s |"
                     " %(funcName)s | %(levelname)s | %(lineno)d | %(message)s"
                 ),
-            }
-        },
-        "handlers": {
-            "console": {
-                "class": "logging.StreamHandler",
-                "level": "DEBUG",
-                "filters": ["correlation_id", "endpoint_filter"],
-                "formatter": "stdout_formatter",
-                "stream": "ext://sys.stdout",
-            }
+            },
+            "json_formatter": {"()": JsonFormatter},
         },
+        "handlers": {"console": console},
         "loggers": {
             "root": {
                 "handlers": ["console"],
@@ -1,43 +1,104 @@
+import logging
 import logging.config
+from typing import Optional
 
 from asgi_correlation_id import CorrelationIdMiddleware
 from fastapi import FastAPI
-from app.config.settings import Settings
+from app.config.settings import Settings, get_settings
+from app.api.endpoint import jwks, metrics
+from app.api.endpoint.authz import AuthzApp
 from app.api.endpoint.api import router
-from app.log.logging_conf import get_logging_config
-from app.repository.postgres import database
+from app.container import Container
+from app.log.logging_conf import get_logging_config, start_log_listener, stop_log_listener
+from app.api.routing import RouteTemplates
+from app.metrics import RequestMetricsMiddleware
+from app.profiling import ProfilingMiddleware
+from app.tracing import TracingMiddleware, trace_route_handlers
 
 __version__ = "1.0.1"
-logging.config.dictConfig(get_logging_config(settings=Settings()))
 
 
-def create_app() -> FastAPI:
-    settings = Settings()
+def configure_logging(settings: Optional[Settings] = None) -> None:
+    logging.config.dictConfig(get_logging_config(settings=settings or get_settings()))
+
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """
+    Build the application. Nothing is configured nor connected when this module is imported,
+    the database pools are opened by the startup handler and closed by the shutdown one.
+
+    :param settings: The application settings, read from the environment by default.
+
+    :return: The application.
+    """
+    settings = settings or get_settings()
     application = FastAPI(title="app", debug=settings.debug_mode, version=__version__)
+    # application-scoped settings, keys and services, shared by all the requests
+    container = Container(settings)
+    application.state.container = container
     application.include_router(router)
+    # served at the root, where the clients look for it
+    application.include_router(jwks.router, tags=["jwks"])
+    # raw ASGI token check for the reverse proxies, skips the FastAPI request handling
+    application.mount("/authz", AuthzApp())
+    route_templates = RouteTemplates(application.routes)
+    if container.profiler is not None:
+        # innermost, the stacks start at the routing
+        application.add_middleware(
+            ProfilingMiddleware, profiler=container.profiler, route_templates=route_templates
+        )
     # add middleware to read or set correlation id
     # useful for tracing requests on logs
     application.add_middleware(
         CorrelationIdMiddleware,
         header_name="Request-ID",
     )
+    if settings.metrics_enabled:
+        application.include_router(metrics.router, tags=["metrics"])
+    if container.tracer is not None:
+        trace_route_handlers(application.routes)
+        # outside the correlation id middleware, the root span reads the request id
+        application.add_middleware(
+            TracingMiddleware, tracer=container.tracer, route_templates=route_templates
+        )
+    if settings.metrics_enabled:
+        # outermost, the latency includes the other middlewares
+        application.add_middleware(RequestMetricsMiddleware, route_templates=route_templates)
+
+    async def startup_event():
+        # in the worker process, the launcher forks the workers after importing the application
+        start_log_listener()
+        logging.info("Application version: %s", __version__)
+        await container.startup()
+        logging.info("Application Ready!")
+
+    async def shutdown_event():
+        logging.info("Shutting down")
+        await container.shutdown()
+        logging.info("Application shutdown complete!")
+        stop_log_listener()
+
+    application.add_event_handler("startup", startup_event)
+    application.add_event_handler("shutdown", shutdown_event)
     return application
 
 
-app = create_app()
+_app: Optional[FastAPI] = None
 
 
-@app.on_event("startup")
-async def startup_event():
-    logging.info(f"Application version: {__version__}")
-    # startup the database connection pool
-    await database.connect()
-    logging.info("Application Ready!")
+def get_app() -> FastAPI:
+    """
+    The default application, configured from the environment on first use and then reused.
+    """
+    global _app
+    if _app is None:
+        configure_logging()
+        _app = create_app()
+    return _app
 
 
-@app.on_event("shutdown")
-async def shutdown_event():
-    logging.info("Shutting down")
-    # shutdown the database connection pool
-    await database.disconnect()
-    logging.info("Application shutdown complete!")
+def __getattr__(name: str):
+    # `app.main:app`, as loaded by uvicorn and the launchers, is built on first access
+    if name == "app":
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
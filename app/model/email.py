@@ -0,0 +1,25 @@
+from typing import Any, Callable, Dict, Iterator
+
+from pydantic.validators import str_validator
+
+
+class EmailStr(str):
+    """
+    Email address validated like `pydantic.EmailStr`, but loading `email_validator` on the first
+    validation instead of when the models are defined.
+    """
+
+    @classmethod
+    def __modify_schema__(cls, field_schema: Dict[str, Any]) -> None:
+        field_schema.update(type="string", format="email")
+
+    @classmethod
+    def __get_validators__(cls) -> Iterator[Callable[..., Any]]:
+        yield str_validator
+        yield cls.validate
+
+    @classmethod
+    def validate(cls, value: str) -> str:
+        from pydantic.networks import validate_email
+
+        return validate_email(value)[1]
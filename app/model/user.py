@@ -1,17 +1,59 @@
-from pydantic import BaseModel, Field, EmailStr, SecretStr
+from typing import Dict
 
+from pydantic import BaseModel, Field, SecretStr
 
-class User(BaseModel):
+from app.model.email import EmailStr
+
+
+class UserIdentity(BaseModel):
     id: str = Field(..., description="Id of the user", example="1234567890")
     email: EmailStr = Field(..., description="Email of the user", example="joe.doe@email.com")
-    password: SecretStr = Field(
-        ..., description="Password of the user", example="supersecret@#password"
-    )
     first_name: str = Field(..., description="First name of the user", example="Joe")
     last_name: str = Field(..., description="Last name of the user", example="Doe")
     two_factor_enabled: bool = Field(
         False, description="Two factor authentication enabled", example=True
     )
+    version: int = Field(
+        1, description="Version of the user, bumped to revoke issued tokens", example=1
+    )
+
+    def to_claims(self) -> Dict:
+        return {
+            "email": self.email,
+            "given_name": self.first_name,
+            "family_name": self.last_name,
+            "2fa": self.two_factor_enabled,
+            "ver": self.version,
+        }
+
+    @classmethod
+    def from_db(cls, row) -> "UserIdentity":
+        return cls(
+            id=str(row["id"]),
+            email=row["email"],
+            first_name=row["first_name"],
+            last_name=row["last_name"],
+            two_factor_enabled=row["two_factor_enabled"],
+            version=row["version"],
+        )
+
+    @classmethod
+    def from_claims(cls, claims: Dict) -> "UserIdentity":
+        # claims come from a token we signed, skip the validation
+        return cls.construct(
+            id=claims["sub"],
+            email=claims["email"],
+            first_name=claims["given_name"],
+            last_name=claims["family_name"],
+            two_factor_enabled=claims["2fa"],
+            version=claims["ver"],
+        )
+
+
+class User(UserIdentity):
+    password: SecretStr = Field(
+        ..., description="Password of the user", example="supersecret@#password"
+    )
 
     @classmethod
     def from_db(cls, row) -> "User":
@@ -22,4 +64,5 @@ class User(BaseModel):
             first_name=row["first_name"],
             last_name=row["last_name"],
             two_factor_enabled=row["two_factor_enabled"],
+            version=row["version"],
         )
@@ -0,0 +1,248 @@
+"""
+Opt-in sampling profiler of the requests, to find where the CPU goes in a running server.
+
+A background thread samples the stack of the event loop thread every `interval_seconds`, a sample
+taken while a profiled request is running is attributed to it, from its middleware down, and the
+samples of a request are added to the collapsed stacks of its route once it completes. The
+collapsed stacks are the input of flamegraph.pl and speedscope, a `frame;frame;frame count` line
+per distinct stack, rooted at the method and route template.
+Only the time on the event loop is seen: a request waiting for a query, or for a password hash
+computed by the hashing workers, isn't on the stack.
+
+A request is profiled when it's sampled, at a ratio set by the administrators at runtime, or when
+it carries a valid `X-Profile-Token` header, signed with the admin key. Nothing is installed
+without PROFILING_ENABLED, and the sampling thread only runs while profiled requests are in flight.
+"""
+import hashlib
+import hmac
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from pydantic import SecretStr
+
+from app.api.routing import RouteTemplates
+from app.config.settings import ProfilingSettings
+
+PROFILE_TOKEN_HEADER = b"x-profile-token"
+# counts the distinct stacks past the limit of a route
+TRUNCATED_STACK = "[truncated]"
+
+
+def sign_profile_token(key: bytes, expires_at: int) -> str:
+    """
+    Sign a profile token, valid until `expires_at`.
+
+    :param key: The signing key.
+    :param expires_at: The expiration, in seconds since the epoch.
+
+    :return: The token, the expiration and its HMAC.
+    """
+    signature = hmac.new(key, str(expires_at).encode(), hashlib.sha256).hexdigest()
+    return f"{expires_at}.{signature}"
+
+
+def verify_profile_token(key: bytes, token: str, now: Optional[float] = None) -> bool:
+    """
+    Check the signature and the expiration of a profile token.
+
+    :param key: The signing key.
+    :param token: The token.
+    :param now: The current time, in seconds since the epoch.
+
+    :return: True if the token is valid.
+    """
+    expires_at, _, signature = token.partition(".")
+    if not expires_at.isdigit():
+        return False
+    if int(expires_at) < (time.time() if now is None else now):
+        return False
+    return hmac.compare_digest(signature, sign_profile_token(key, int(expires_at)).split(".")[1])
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of the profiled requests and aggregates them by route.
+    """
+
+    def __init__(
+        self,
+        interval_seconds: float = 0.005,
+        sample_ratio: float = 0.0,
+        max_stacks: int = 2000,
+        token_key: Optional[bytes] = None,
+    ):
+        self.interval_seconds = interval_seconds
+        self.sample_ratio = sample_ratio
+        self.max_stacks = max_stacks
+        self.token_key = token_key
+        # middleware frame id -> (thread id, samples of the request)
+        self._requests: Dict[int, Tuple[int, Counter]] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self._labels: Dict[Any, str] = {}
+        self._stacks: Dict[str, Counter] = {}
+        self._profiled: Counter = Counter()
+
+    @classmethod
+    def from_settings(
+        cls, settings: ProfilingSettings, admin_api_key: Optional[SecretStr] = None
+    ) -> Optional["SamplingProfiler"]:
+        if not settings.enabled:
+            return None
+        return cls(
+            interval_seconds=settings.interval_ms / 1000,
+            sample_ratio=settings.sample_ratio,
+            max_stacks=settings.max_stacks,
+            # without an admin key nobody can sign a token
+            token_key=admin_api_key.get_secret_value().encode() if admin_api_key else None,
+        )
+
+    def should_profile(self, token: Optional[str]) -> bool:
+        if token is not None and self.token_key is not None:
+            if verify_profile_token(self.token_key, token):
+                return True
+        return self.sample_ratio > 0 and random.random() < self.sample_ratio
+
+    def start_request(self, frame: Any) -> Counter:
+        """
+        Sample the stacks below a frame, until `end_request`.
+
+        :param frame: The frame of the coroutine running the request.
+
+        :return: The samples of the request.
+        """
+        samples: Counter = Counter()
+        with self._lock:
+            self._requests[id(frame)] = (threading.get_ident(), samples)
+            if self._thread is None:
+                # started by the first profiled request, after the workers are forked
+                self._thread = threading.Thread(
+                    target=self._run, name="request-profiler", daemon=True
+                )
+                self._thread.start()
+        self._wake.set()
+        return samples
+
+    def end_request(self, frame: Any, samples: Counter, route: str) -> None:
+        with self._lock:
+            self._requests.pop(id(frame), None)
+        self._profiled[route] += 1
+        stacks = self._stacks.setdefault(route, Counter())
+        for stack, count in samples.items():
+            if stack not in stacks and len(stacks) >= self.max_stacks:
+                stack = TRUNCATED_STACK
+            stacks[stack] += count
+
+    def _run(self) -> None:
+        while not self._stopped:
+            if not self._requests:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            self._sample()
+            time.sleep(self.interval_seconds)
+
+    def _sample(self) -> None:
+        frames = sys._current_frames()
+        with self._lock:
+            for thread_id in {thread_id for thread_id, _ in self._requests.values()}:
+                stack = []
+                frame = frames.get(thread_id)
+                while frame is not None:
+                    request = self._requests.get(id(frame))
+                    if request is not None:
+                        stack.reverse()
+                        request[1][";".join(stack)] += 1
+                        break
+                    stack.append(self._label(frame.f_code, frame.f_globals))
+                    frame = frame.f_back
+
+    def _label(self, code: Any, module_globals: Dict) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            # co_qualname is new in Python 3.11
+            name = getattr(code, "co_qualname", code.co_name)
+            label = self._labels[code] = f"{module_globals.get('__name__', '?')}:{name}"
+        return label
+
+    def collapsed(self, route: Optional[str] = None) -> str:
+        """
+        The collapsed stacks, rooted at their route.
+
+        :param route: Only the stacks of this route, all the routes by default.
+
+        :return: One `route;frame;frame count` line per distinct stack.
+        """
+        routes = [route] if route is not None else sorted(self._stacks)
+        lines = []
+        for name in routes:
+            for stack, count in self._stacks.get(name, Counter()).most_common():
+                lines.append(f"{name};{stack} {count}" if stack else f"{name} {count}")
+        return "".join(f"{line}\n" for line in lines)
+
+    def reset(self) -> None:
+        self._stacks = {}
+        self._profiled = Counter()
+
+    def stats(self) -> Dict:
+        return {
+            "sample_ratio": self.sample_ratio,
+            "interval_ms": self.interval_seconds * 1000,
+            "token_enabled": self.token_key is not None,
+            "in_flight": len(self._requests),
+            "routes": {
+                route: {
+                    "requests": self._profiled[route],
+                    "samples": sum(stacks.values()),
+                    "stacks": len(stacks),
+                }
+                for route, stacks in sorted(self._stacks.items())
+            },
+        }
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._stopped = False
+
+
+class ProfilingMiddleware:
+    """
+    Raw ASGI middleware profiling the sampled requests and the ones with a profile token.
+    """
+
+    def __init__(self, app: Callable, profiler: SamplingProfiler, route_templates: RouteTemplates):
+        self.app = app
+        self.profiler = profiler
+        self.route_templates = route_templates
+
+    async def __call__(self, scope: Dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = None
+        if self.profiler.token_key is not None:
+            for name, value in scope["headers"]:
+                if name == PROFILE_TOKEN_HEADER:
+                    token = value.decode("latin-1")
+                    break
+        if not self.profiler.should_profile(token):
+            await self.app(scope, receive, send)
+            return
+        # the frame of this coroutine is on the stack whenever the request is running
+        frame = sys._getframe()
+        samples = self.profiler.start_request(frame)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route = f"{scope['method']} {self.route_templates(scope.get('endpoint'))}"
+            self.profiler.end_request(frame, samples, route)
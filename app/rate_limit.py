@@ -0,0 +1,180 @@
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.config.settings import RateLimitSettings
+from app.repository.cache import TTLCache
+
+IP_SCOPE = "ip"
+EMAIL_SCOPE = "email"
+OTP_SCOPE = "otp"
+
+
+class RateLimitExceededError(Exception):
+    def __init__(self, message: str, retry_after_seconds: int):
+        super().__init__(message)
+        self.retry_after_seconds = retry_after_seconds
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    capacity: int
+    refill_per_second: float
+
+    @property
+    def idle_seconds(self) -> float:
+        """Time for an empty bucket to refill, after which it's the same as a new one."""
+        return self.capacity / self.refill_per_second
+
+
+class MemoryRateLimitBackend:
+    """
+    Token buckets of the current process.
+
+    A bucket is stored as its tokens and last update time, refilled lazily when it's hit,
+    so an update is O(1). The buckets idle for longer than their refill time expire,
+    and at most `max_keys` per limit are kept, the least recently hit are evicted first.
+    """
+
+    def __init__(self, max_keys: int, clock: Callable[[], float] = time.monotonic):
+        self.max_keys = max_keys
+        self._clock = clock
+        self._buckets: Dict[RateLimit, TTLCache] = {}
+
+    async def hit(self, key: str, limit: RateLimit) -> Tuple[bool, float]:
+        buckets = self._buckets.get(limit)
+        if buckets is None:
+            buckets = TTLCache(self.max_keys, limit.idle_seconds, clock=self._clock)
+            self._buckets[limit] = buckets
+
+        now = self._clock()
+        tokens = limit.capacity
+        bucket = buckets.get(key)
+        if bucket is not None:
+            tokens, updated_at = bucket
+            tokens = min(limit.capacity, tokens + (now - updated_at) * limit.refill_per_second)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        buckets.set(key, (tokens, now))
+        return allowed, tokens
+
+
+# token bucket updated atomically on the server, the bucket expires once fully refilled
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil then
+    tokens = capacity
+    ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * refill)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], ARGV[4])
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisRateLimitBackend:
+    """
+    Token buckets shared by the workers and the instances, stored on a Redis-compatible server.
+
+    The client must provide the `eval` coroutine of `redis.asyncio.Redis`.
+    When the server can't be reached the requests are allowed, the limits are a protection
+    that mustn't take the logins down.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        prefix: str = "rate-limit:",
+        unavailable_errors: Tuple[type, ...] = (OSError,),
+    ):
+        self.client = client
+        self.prefix = prefix
+        self.unavailable_errors = unavailable_errors
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisRateLimitBackend":
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("The redis rate limit backend requires the redis package")
+        return cls(
+            redis.from_url(url),
+            unavailable_errors=(OSError, redis.ConnectionError, redis.TimeoutError),
+        )
+
+    async def hit(self, key: str, limit: RateLimit) -> Tuple[bool, float]:
+        try:
+            allowed, tokens = await self.client.eval(
+                TOKEN_BUCKET_SCRIPT,
+                1,
+                self.prefix + key,
+                limit.capacity,
+                limit.refill_per_second,
+                time.time(),
+                math.ceil(limit.idle_seconds * 1000),
+            )
+        except self.unavailable_errors as e:
+            logging.warning("Rate limit backend unavailable, request allowed: %r", e)
+            return True, limit.capacity
+        return bool(int(allowed)), float(tokens)
+
+
+class RateLimiter:
+    """
+    Token bucket rate limits of the authentication attempts, per client IP, email and OTP token
+    subject. A request over any of its limits is rejected before any lookup or hashing.
+    """
+
+    def __init__(self, backend: Any, limits: Dict[str, RateLimit]):
+        self.backend = backend
+        self.limits = limits
+        self.rejected: Dict[str, int] = {scope: 0 for scope in limits}
+
+    @classmethod
+    def from_settings(cls, settings: RateLimitSettings) -> Optional["RateLimiter"]:
+        if not settings.enabled:
+            return None
+        if settings.backend == "redis":
+            backend = RedisRateLimitBackend.from_url(settings.redis_url)
+        elif settings.backend == "memory":
+            backend = MemoryRateLimitBackend(max_keys=settings.max_keys)
+        else:
+            raise ValueError(f"Unsupported rate limit backend: {settings.backend}")
+        return cls(
+            backend,
+            {
+                IP_SCOPE: RateLimit(settings.ip_capacity, settings.ip_refill_per_second),
+                EMAIL_SCOPE: RateLimit(settings.email_capacity, settings.email_refill_per_second),
+                OTP_SCOPE: RateLimit(settings.otp_capacity, settings.otp_refill_per_second),
+            },
+        )
+
+    async def hit(self, scope: str, key: str) -> None:
+        """
+        Take a token from the bucket of a key.
+
+        :param scope: The limit to apply, one of ip, email or otp.
+        :param key: The client IP, email or token subject.
+
+        :raises RateLimitExceededError: If the bucket is empty.
+        """
+        limit = self.limits[scope]
+        allowed, tokens = await self.backend.hit(f"{scope}:{key}", limit)
+        if not allowed:
+            self.rejected[scope] += 1
+            retry_after = math.ceil((1 - tokens) / limit.refill_per_second)
+            raise RateLimitExceededError("Too many attempts", max(1, retry_after))
@@ -0,0 +1,125 @@
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+    coalesced: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class TTLCache:
+    """
+    In-process LRU cache whose entries also expire after a fixed time to live.
+
+    Concurrent misses for the same key are coalesced: the first caller runs the loader,
+    the others wait for its result, so a burst of lookups results in a single query.
+    Exceptions raised by the loader are propagated to the waiters and never cached.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.stats = CacheStats()
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._loading: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (self._clock() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        # dropping the pending load too, so a value read before the write isn't stored
+        self._loading.pop(key, None)
+        if self._entries.pop(key, None) is not None:
+            self.stats.invalidations += 1
+
+    def clear(self) -> None:
+        self._loading.clear()
+        self._entries.clear()
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Get a value from the cache, loading it on a miss.
+
+        :param key: The cache key.
+        :param loader: Coroutine function loading the value, called at most once per miss.
+
+        :return: The cached or loaded value.
+        """
+        while True:
+            value = self.get(key)
+            if value is not None:
+                return value
+
+            pending = self._loading.get(key)
+            if pending is None:
+                break
+            self.stats.coalesced += 1
+            try:
+                # shield the shared future, a cancelled waiter must not cancel the others
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    # this waiter was cancelled
+                    raise
+                # the loading task was cancelled, e.g. its client disconnected, not this one:
+                # load again, or wait for the waiter loading it first
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # mark the exception as retrieved, there may be no other waiter
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            if self._loading.get(key) is future:
+                self.set(key, value)
+            return value
+        finally:
+            if self._loading.get(key) is future:
+                del self._loading[key]
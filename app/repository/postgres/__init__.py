@@ -1,10 +1,12 @@
 import logging
+from typing import TYPE_CHECKING, Optional
 
-import databases
-from databases.core import Connection
 from pydantic import SecretStr
 
-from app.config.settings import Settings
+from app.config.settings import PostgresSettings
+
+if TYPE_CHECKING:
+    import databases
 
 
 def create_db_url(user: str, password: str, host: str, database: str) -> str:
@@ -18,7 +20,11 @@ def create_database(
     password: SecretStr,
     min_size_pool: int,
     max_size_pool: int,
-) -> databases.Database:
+    idle_seconds: float = 300.0,
+) -> "databases.Database":
+    # imported on first use, the asyncpg backend and the tools don't need it nor SQLAlchemy
+    import databases
+
     logging.info("Creating database connection")
     db_url = create_db_url(
         user.get_secret_value(),
@@ -30,21 +36,28 @@ def create_database(
         url=db_url,
         min_size=min_size_pool,
         max_size=max_size_pool,
+        max_inactive_connection_lifetime=idle_seconds,
     )
     return database
 
 
-settings = Settings()
-database = create_database(
-    host=settings.postgres.host,
-    database=settings.postgres.database_name,
-    user=settings.postgres.user,
-    password=settings.postgres.password,
-    min_size_pool=settings.postgres.min_size_pool,
-    max_size_pool=settings.postgres.max_size_pool,
-)
-
-
-async def get_db_connection() -> Connection:
-    async with database.connection() as connection:
-        yield connection
+def create_database_from_settings(
+    settings: PostgresSettings, host: Optional[str] = None
+) -> "databases.Database":
+    """
+    Create the connection pool of the primary, or of a replica, from the settings.
+
+    :param settings: The Postgres settings.
+    :param host: The replica host, the primary one by default.
+
+    :return: The database, not connected yet.
+    """
+    return create_database(
+        host=host or settings.host,
+        database=settings.database_name,
+        user=settings.user,
+        password=settings.password,
+        min_size_pool=settings.min_size_pool,
+        max_size_pool=settings.max_size_pool,
+        idle_seconds=settings.pool_idle_seconds,
+    )
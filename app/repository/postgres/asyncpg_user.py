@@ -0,0 +1,124 @@
+from typing import Any, Dict, List, Optional
+
+import asyncpg
+
+from app.config.settings import PostgresSettings
+from app.model.user import User, UserIdentity
+from app.repository import UserNotFoundError
+from app.repository.cache import TTLCache
+from app.repository.postgres import asyncpg_user_query
+from app.repository.postgres.replica import ReplicaRouter
+from app.repository.postgres.user import UserRepository
+
+
+async def create_asyncpg_pool(
+    settings: PostgresSettings, host: Optional[str] = None
+) -> asyncpg.Pool:
+    host = host or settings.host
+    return await asyncpg.create_pool(
+        host=host.split(":")[0],
+        port=int(host.split(":")[1]) if ":" in host else 5432,
+        database=settings.database_name,
+        user=settings.user.get_secret_value(),
+        password=settings.password.get_secret_value(),
+        min_size=settings.min_size_pool,
+        max_size=settings.max_size_pool,
+        # every connection keeps the queries it ran as prepared statements
+        statement_cache_size=settings.statement_cache_size,
+        max_inactive_connection_lifetime=settings.pool_idle_seconds,
+    )
+
+
+class AsyncpgUserRepository(UserRepository):
+    """
+    Users stored on Postgres, queried directly through an asyncpg pool.
+
+    It skips the `databases` query compilation and record wrapping: the positional queries
+    are sent as they are and each pooled connection prepares them once, in its statement cache.
+    A connection is checked out of the pool only for the duration of each query.
+    """
+
+    def __init__(
+        self,
+        pool: asyncpg.Pool,
+        cache: Optional[TTLCache] = None,
+        replicas: Optional[ReplicaRouter] = None,
+    ):
+        super().__init__(db_conn=pool, cache=cache, replicas=replicas)
+        self.pool = pool
+
+    async def _insert_user(self, values: Dict) -> str:
+        return await self.pool.fetchval(
+            asyncpg_user_query.insert_user,
+            values["email"],
+            values["password"],
+            values["first_name"],
+            values["last_name"],
+            values["two_factor_enabled"],
+        )
+
+    async def _insert_users(self, users: List[Dict]) -> Dict[str, str]:
+        # COPY is the fastest way in, ON CONFLICT then skips the existing emails
+        columns = asyncpg_user_query.import_columns
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                await connection.execute(asyncpg_user_query.create_import_table)
+                await connection.copy_records_to_table(
+                    "users_import",
+                    records=[tuple(user[column] for column in columns) for user in users],
+                    columns=columns,
+                )
+                rows = await connection.fetch(asyncpg_user_query.insert_imported_users)
+        return {row["email"]: str(row["id"]) for row in rows}
+
+    async def _fetch_users_page(
+        self, after_id: str, page_size: int, include_password: bool
+    ) -> List[Any]:
+        query = (
+            asyncpg_user_query.export_users
+            if include_password
+            else asyncpg_user_query.export_identities
+        )
+        rows = await self._read([], lambda conn: conn.fetch(query, after_id, page_size))
+        return [dict(row) for row in rows]
+
+    async def _update_password(
+        self, user_id: str, password: str, previous_password: str
+    ) -> Optional[str]:
+        return await self.pool.fetchval(
+            asyncpg_user_query.update_password, user_id, password, previous_password
+        )
+
+    async def _fetch_user_by_email(self, email: str) -> User:
+        user = await self._read(
+            [("email", email)],
+            lambda conn: conn.fetchrow(asyncpg_user_query.get_user_by_email, email),
+        )
+        if user is None:
+            raise UserNotFoundError("User not found")
+        return User.from_db(user)
+
+    async def _fetch_user_by_id(self, user_id: str) -> User:
+        user = await self._read(
+            [("id", user_id)],
+            lambda conn: conn.fetchrow(asyncpg_user_query.get_user_by_id, user_id),
+        )
+        if user is None:
+            raise UserNotFoundError("User not found")
+        return User.from_db(user)
+
+    async def _fetch_identity_by_id(self, user_id: str) -> UserIdentity:
+        user = await self._read(
+            [("id", user_id)],
+            lambda conn: conn.fetchrow(asyncpg_user_query.get_identity_by_id, user_id),
+        )
+        if user is None:
+            raise UserNotFoundError("User not found")
+        return UserIdentity.from_db(user)
+
+    async def _fetch_identities_by_ids(self, user_ids: List[str]) -> List[UserIdentity]:
+        rows = await self._read(
+            [("id", user_id) for user_id in user_ids],
+            lambda conn: conn.fetch(asyncpg_user_query.get_identities_by_ids, user_ids),
+        )
+        return [UserIdentity.from_db(row) for row in rows]
@@ -0,0 +1,73 @@
+# same queries of user_query with positional parameters, sent to asyncpg as they are
+
+insert_user = """
+insert into users (email, password, first_name, last_name, two_factor_enabled)
+    values ($1, $2, $3, $4, $5)
+returning id
+"""
+
+# the batches are copied to a temporary table, then moved to users skipping the existing emails
+create_import_table = """
+create temporary table users_import (
+    email varchar(254),
+    password varchar(255),
+    first_name varchar(255),
+    last_name varchar(255),
+    two_factor_enabled boolean
+) on commit drop
+"""
+
+import_columns = ("email", "password", "first_name", "last_name", "two_factor_enabled")
+
+insert_imported_users = """
+insert into users (email, password, first_name, last_name, two_factor_enabled)
+    select email, password, first_name, last_name, two_factor_enabled from users_import
+on conflict (email) do nothing
+returning id, email
+"""
+
+update_password = """
+update users set password = $2
+    where id = $1 and password = $3
+returning email
+"""
+
+get_user_by_email = """
+select id, email, password, first_name, last_name, two_factor_enabled, version
+    from users
+    where email = $1
+"""
+
+get_user_by_id = """
+select id, email, password, first_name, last_name, two_factor_enabled, version
+    from users
+    where id = $1
+"""
+
+get_identity_by_id = """
+select id, email, first_name, last_name, two_factor_enabled, version
+    from users
+    where id = $1
+"""
+
+get_identities_by_ids = """
+select id, email, first_name, last_name, two_factor_enabled, version
+    from users
+    where id = any($1::uuid[])
+"""
+
+export_identities = """
+select id, email, first_name, last_name, two_factor_enabled, version
+    from users
+    where id > $1
+    order by id
+    limit $2
+"""
+
+export_users = """
+select id, email, password, first_name, last_name, two_factor_enabled, version
+    from users
+    where id > $1
+    order by id
+    limit $2
+"""
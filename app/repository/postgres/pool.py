@@ -0,0 +1,340 @@
+import asyncio
+import contextlib
+import logging
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass
+from typing import (
+    Any,
+    AsyncContextManager,
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    TYPE_CHECKING,
+    Tuple,
+)
+
+import asyncpg
+
+from app.metrics import POOL_ACQUIRE_SECONDS
+from app.tracing import STATUS_ERROR, start_span
+
+if TYPE_CHECKING:
+    import databases
+
+
+class PoolMetrics:
+    """
+    Connection checkout statistics of a pool: how long the queries waited for a connection
+    and how many connections were in use or awaited at the same time.
+
+    The wait percentiles are computed over the last `window` checkouts, the waits are also
+    exported to the `auth_db_pool_acquire_duration_seconds` histogram, labelled with `name`.
+    The waits since the previous `take_window` are only kept with `collect_window`, for an
+    adaptive manager consuming them, otherwise nothing would ever release them.
+    """
+
+    def __init__(self, window: int = 1024, name: str = "primary", collect_window: bool = False):
+        self.name = name
+        self.collect_window = collect_window
+        self.acquisitions = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self._recent_waits: Deque[float] = deque(maxlen=window)
+        self._window_waits: List[float] = []
+        self._window_max_in_use = 0
+        self._acquire_seconds = POOL_ACQUIRE_SECONDS.labels(name)
+
+    @asynccontextmanager
+    async def acquire(self, checkout: AsyncContextManager) -> AsyncIterator[Any]:
+        """
+        Enter the checkout of a pool connection, measuring the time spent waiting for it.
+
+        :param checkout: The context manager acquiring and releasing the connection.
+
+        :return: The acquired connection.
+        """
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        start = time.perf_counter()
+        # ends once the connection is acquired, the query isn't part of it
+        wait_span = start_span("db.pool.acquire", {"db.pool": self.name})
+        acquired = False
+        try:
+            async with checkout as connection:
+                acquired = True
+                self.waiting -= 1
+                self._record_wait(time.perf_counter() - start)
+                if wait_span is not None:
+                    wait_span.end()
+                self.in_use += 1
+                self.max_in_use = max(self.max_in_use, self.in_use)
+                self._window_max_in_use = max(self._window_max_in_use, self.in_use)
+                try:
+                    yield connection
+                finally:
+                    self.in_use -= 1
+        finally:
+            if not acquired:
+                self.waiting -= 1
+                if wait_span is not None:
+                    wait_span.status = STATUS_ERROR
+                    wait_span.end()
+
+    def _record_wait(self, wait_seconds: float) -> None:
+        self.acquisitions += 1
+        self.total_wait_seconds += wait_seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+        self._recent_waits.append(wait_seconds)
+        if self.collect_window:
+            self._window_waits.append(wait_seconds)
+        self._acquire_seconds.observe(wait_seconds)
+
+    def take_window(self) -> Tuple[List[float], int]:
+        """
+        Collect the statistics since the previous call.
+
+        :return: The waits of the checkouts and the peak of connections in use.
+        """
+        waits, max_in_use = self._window_waits, self._window_max_in_use
+        self._window_waits = []
+        self._window_max_in_use = self.in_use
+        return waits, max_in_use
+
+    def as_dict(self) -> Dict[str, float]:
+        recent = sorted(self._recent_waits)
+        return {
+            "acquisitions": self.acquisitions,
+            "in_use": self.in_use,
+            "max_in_use": self.max_in_use,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "mean_wait_ms": round(self.total_wait_seconds / max(self.acquisitions, 1) * 1000, 3),
+            "p50_wait_ms": round(_percentile(recent, 50) * 1000, 3),
+            "p95_wait_ms": round(_percentile(recent, 95) * 1000, 3),
+            "p99_wait_ms": round(_percentile(recent, 99) * 1000, 3),
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 3),
+        }
+
+
+@dataclass
+class PoolDecision:
+    at: float
+    action: str
+    from_size: int
+    to_size: int
+    p95_wait_ms: float
+    max_in_use: int
+
+
+class PoolManager(PoolMetrics):
+    """
+    Adaptive size of a connection pool, on top of its checkout statistics.
+
+    The underlying pool is created with `max_size` connections at most, the manager limits the
+    connections checked out at the same time to its current size, between `min_size` and `max_size`.
+    Every `interval_seconds` the size is doubled if the p95 wait of the interval exceeded
+    `target_wait_ms`, or decreased by one when less than half of the connections were used.
+    The pool closes the connections idle for longer than its inactivity lifetime,
+    so shrinking the size also releases the server connections.
+    When not `adaptive` the size stays at `max_size` and only the statistics are collected.
+    """
+
+    def __init__(
+        self,
+        min_size: int,
+        max_size: int,
+        adaptive: bool = False,
+        interval_seconds: float = 1.0,
+        target_wait_ms: float = 5.0,
+        history: int = 50,
+    ):
+        # the adjust task takes the waits of each interval
+        super().__init__(collect_window=adaptive)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.adaptive = adaptive
+        self.interval_seconds = interval_seconds
+        self.target_wait_ms = target_wait_ms
+        self.size = min_size if adaptive else max_size
+        self.decisions: Deque[PoolDecision] = deque(maxlen=history)
+        self.warm_up_ms: Optional[float] = None
+        self._checked_out = 0
+        self._slots = asyncio.Condition()
+        self._task: Optional[asyncio.Task] = None
+
+    @asynccontextmanager
+    async def acquire(self, checkout: AsyncContextManager) -> AsyncIterator[Any]:
+        if not self.adaptive:
+            async with super().acquire(checkout) as connection:
+                yield connection
+            return
+        async with super().acquire(self._slot(checkout)) as connection:
+            yield connection
+
+    @asynccontextmanager
+    async def _slot(self, checkout: AsyncContextManager) -> AsyncIterator[Any]:
+        async with self._slots:
+            await self._slots.wait_for(lambda: self._checked_out < self.size)
+            self._checked_out += 1
+        try:
+            async with checkout as connection:
+                yield connection
+        finally:
+            async with self._slots:
+                self._checked_out -= 1
+                self._slots.notify()
+
+    async def warm_up(self, checkout: Callable[[], AsyncContextManager]) -> None:
+        """
+        Open `min_size` connections before serving the first requests.
+
+        :param checkout: Returns a context manager checking a connection out of the pool.
+        """
+        start = time.perf_counter()
+        release = asyncio.Event()
+        acquired = 0
+
+        async def hold():
+            nonlocal acquired
+            async with checkout():
+                acquired += 1
+                if acquired == self.min_size:
+                    release.set()
+                await release.wait()
+
+        await asyncio.gather(*(hold() for _ in range(self.min_size)))
+        self.warm_up_ms = round((time.perf_counter() - start) * 1000, 3)
+
+    async def adjust(self) -> Optional[PoolDecision]:
+        """
+        Resize the pool according to the statistics of the last interval.
+
+        :return: The decision taken, None if the size didn't change.
+        """
+        waits, max_in_use = self.take_window()
+        if not self.adaptive:
+            return None
+        p95_wait_ms = _percentile(sorted(waits), 95) * 1000
+        size = self.size
+        if p95_wait_ms > self.target_wait_ms and size < self.max_size:
+            action, new_size = "grow", min(self.max_size, size * 2)
+        elif (
+            p95_wait_ms <= self.target_wait_ms / 2
+            and max_in_use < size / 2
+            and size > self.min_size
+        ):
+            action, new_size = "shrink", size - 1
+        else:
+            return None
+
+        decision = PoolDecision(
+            at=time.time(),
+            action=action,
+            from_size=size,
+            to_size=new_size,
+            p95_wait_ms=round(p95_wait_ms, 3),
+            max_in_use=max_in_use,
+        )
+        self.decisions.append(decision)
+        logging.info("Connection pool %s from %d to %d", action, size, new_size)
+        async with self._slots:
+            self.size = new_size
+            self._slots.notify(max(0, new_size - size))
+        return decision
+
+    def start(self) -> None:
+        if self.adaptive and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            await self.adjust()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "adaptive": self.adaptive,
+            "size": self.size,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "warm_up_ms": self.warm_up_ms,
+            **self.as_dict(),
+            "decisions": [asdict(decision) for decision in self.decisions],
+        }
+
+
+def _percentile(ordered: List[float], pct: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[max(1, math.ceil(pct / 100 * len(ordered))) - 1]
+
+
+class MeteredDatabase:
+    """
+    Query interface of a `databases.Database` checking a connection out of the pool per query.
+
+    The connection is released as soon as the query completes, so the requests don't hold it
+    while they hash passwords or sign tokens.
+    """
+
+    def __init__(self, database: "databases.Database", metrics: PoolMetrics):
+        self.database = database
+        self.metrics = metrics
+
+    async def execute(self, query: str, values: Optional[dict] = None) -> Any:
+        async with self.metrics.acquire(self.database.connection()) as connection:
+            return await connection.execute(query, values)
+
+    async def fetch_one(self, query: str, values: Optional[dict] = None) -> Optional[Any]:
+        async with self.metrics.acquire(self.database.connection()) as connection:
+            return await connection.fetch_one(query, values)
+
+    async def fetch_all(self, query: str, values: Optional[dict] = None) -> List[Any]:
+        async with self.metrics.acquire(self.database.connection()) as connection:
+            return await connection.fetch_all(query, values)
+
+
+class MeteredAsyncpgPool:
+    """
+    Query interface of an asyncpg pool measuring the checkout of the connection of each query.
+    """
+
+    def __init__(self, pool: asyncpg.Pool, metrics: PoolMetrics):
+        self.pool = pool
+        self.metrics = metrics
+
+    def acquire(self) -> AsyncContextManager:
+        """Check a connection out for several queries, e.g. a transaction."""
+        return self.metrics.acquire(self.pool.acquire())
+
+    async def fetchval(self, query: str, *args) -> Any:
+        async with self.metrics.acquire(self.pool.acquire()) as connection:
+            return await connection.fetchval(query, *args)
+
+    async def fetchrow(self, query: str, *args) -> Optional[asyncpg.Record]:
+        async with self.metrics.acquire(self.pool.acquire()) as connection:
+            return await connection.fetchrow(query, *args)
+
+    async def fetch(self, query: str, *args) -> List[asyncpg.Record]:
+        async with self.metrics.acquire(self.pool.acquire()) as connection:
+            return await connection.fetch(query, *args)
+
+    async def close(self) -> None:
+        await self.pool.close()
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, TypeVar
+
+import asyncpg
+
+from app.repository.postgres.pool import PoolMetrics
+
+T = TypeVar("T")
+
+# errors meaning the replica can't be reached, any other error is raised to the caller
+REPLICA_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+    asyncpg.CannotConnectNowError,
+)
+
+
+class Replica:
+    def __init__(self, name: str, executor: Any, metrics: PoolMetrics):
+        self.name = name
+        self.executor = executor
+        self.metrics = metrics
+        self.failures = 0
+        self.unhealthy_until = 0.0
+
+
+class ReplicaRouter:
+    """
+    Routes the reads to the read replicas in round-robin, and the writes to the primary.
+
+    A replica failing with a connection error is skipped for `retry_seconds`, its reads are
+    retried on the primary. The keys written by this process are read from the primary for
+    `read_your_writes_seconds`, so a client doesn't miss its own writes because of the
+    replication lag.
+    """
+
+    def __init__(
+        self,
+        primary: Any,
+        replicas: List[Replica],
+        read_your_writes_seconds: float,
+        retry_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.primary = primary
+        self.replicas = replicas
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self.retry_seconds = retry_seconds
+        self._clock = clock
+        self._next = 0
+        self._pinned: Dict[Hashable, float] = {}
+
+    def pin(self, *keys: Hashable) -> None:
+        """
+        Send the reads of the keys to the primary for the read-your-writes window.
+
+        :param keys: The written keys, e.g. the user id and email.
+        """
+        now = self._clock()
+        # drop the expired pins, the window is short so the dict stays small
+        self._pinned = {key: until for key, until in self._pinned.items() if until > now}
+        for key in keys:
+            self._pinned[key] = now + self.read_your_writes_seconds
+
+    def is_pinned(self, key: Hashable) -> bool:
+        until = self._pinned.get(key)
+        return until is not None and until > self._clock()
+
+    def select(self, keys: Iterable[Hashable]) -> Optional[Replica]:
+        """
+        Select the replica serving a read of the keys.
+
+        :param keys: The keys read by the query.
+
+        :return: The next healthy replica, None if the read must go to the primary.
+        """
+        if any(self.is_pinned(key) for key in keys):
+            return None
+        now = self._clock()
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[self._next % len(self.replicas)]
+            self._next += 1
+            if replica.unhealthy_until <= now:
+                return replica
+        return None
+
+    async def read(self, keys: Iterable[Hashable], run: Callable[[Any], Awaitable[T]]) -> T:
+        """
+        Run a read query on a replica, or on the primary.
+
+        :param keys: The keys read by the query.
+        :param run: Runs the query on the given executor.
+
+        :return: The query result.
+        """
+        replica = self.select(keys)
+        if replica is None:
+            return await run(self.primary)
+        try:
+            result = await run(replica.executor)
+        except REPLICA_ERRORS as e:
+            replica.failures += 1
+            replica.unhealthy_until = self._clock() + self.retry_seconds
+            logging.warning(
+                "Read replica %s unavailable, reading from primary: %r", replica.name, e
+            )
+            return await run(self.primary)
+        replica.failures = 0
+        return result
+
+    def stats(self) -> Dict[str, Dict]:
+        now = self._clock()
+        return {
+            replica.name: {
+                "healthy": replica.unhealthy_until <= now,
+                "failures": replica.failures,
+                **replica.metrics.as_dict(),
+            }
+            for replica in self.replicas
+        }
@@ -1,22 +1,80 @@
 import logging
+import uuid
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+)
 
 from asyncpg import UniqueViolationError
-from databases.core import Connection
-from fastapi import Depends
+from fastapi import Request
 
-from app.model.user import User
+from app.metrics import DB_QUERY_SECONDS, timed
+from app.tracing import span
+from app.model.user import User, UserIdentity
 from app.repository import UserAlreadyExistsError, UserNotFoundError
-from app.repository.postgres import user_query, get_db_connection
+from app.repository.cache import TTLCache
+from app.repository.postgres import user_query
+from app.repository.postgres.replica import ReplicaRouter
+
+if TYPE_CHECKING:
+    from databases.core import Connection
+
+
+# smaller than any user id, where the exports start
+NIL_UUID = "00000000-0000-0000-0000-000000000000"
+
+# query latency histograms by public method, iter_users observes each page
+_QUERY_SECONDS = {
+    method: DB_QUERY_SECONDS.labels(method)
+    for method in (
+        "insert_user",
+        "insert_users",
+        "update_password",
+        "get_user_by_email",
+        "get_user_by_id",
+        "get_identity_by_id",
+        "get_users_by_ids",
+        "iter_users",
+    )
+}
+
+
+async def _query(method: str, awaitable: Awaitable[Any]) -> Any:
+    with span(f"UserRepository.{method}"):
+        return await timed(_QUERY_SECONDS[method], awaitable)
 
 
 class UserRepository:
-    def __init__(self, db_conn: Connection):
+    """
+    Users stored on Postgres through the `databases` library.
+
+    The public methods handle the cache, time and trace the queries, the `_fetch` and `_insert`
+    methods run the queries and are overridden by the other backends.
+    Logins use the projections including the password hash, token validation the identity
+    ones which exclude it.
+    With a replica router the lookups go to the read replicas, the writes to `db_conn`.
+    """
+
+    def __init__(
+        self,
+        db_conn: "Connection",
+        cache: Optional[TTLCache] = None,
+        replicas: Optional[ReplicaRouter] = None,
+    ):
         self.db_conn = db_conn
+        self.cache = cache
+        self.replicas = replicas
 
     async def insert_user(
         self, email: str, password: str, first_name: str, last_name: str, two_factor_enabled: bool
     ) -> str:
-        query = user_query.insert_user
         values = {
             "email": email,
             "password": password,
@@ -25,28 +83,246 @@ class UserRepository:
             "two_factor_enabled": two_factor_enabled,
         }
         try:
-            user_uuid = await self.db_conn.execute(query=query, values=values)
-            return str(user_uuid)
+            user_uuid = await _query("insert_user", self._insert_user(values))
         except UniqueViolationError as e:
             logging.exception(e)
             raise UserAlreadyExistsError("User already exists")
+        self.invalidate_user(user_id=str(user_uuid), email=email)
+        if self.replicas is not None:
+            # the replicas may not have the user yet
+            self.replicas.pin(("id", str(user_uuid)), ("email", email))
+        return str(user_uuid)
+
+    async def insert_users(self, users: List[Dict]) -> Dict[str, str]:
+        """
+        Insert a batch of users with a single query, skipping the ones whose email exists.
+
+        :param users: The users, with the insert_user arguments and a hashed password.
+
+        :return: The id of the inserted users by email, the skipped emails are missing.
+        """
+        if not users:
+            return {}
+        inserted = await _query("insert_users", self._insert_users(users))
+        for email, user_id in inserted.items():
+            self.invalidate_user(user_id=user_id, email=email)
+        if self.replicas is not None:
+            self.replicas.pin(
+                *(
+                    key
+                    for email, user_id in inserted.items()
+                    for key in (("id", user_id), ("email", email))
+                )
+            )
+        return inserted
+
+    async def update_password(self, user_id: str, password: str, previous_password: str) -> bool:
+        """
+        Replace the password hash of a user, e.g. with a stronger hash of the same password.
+
+        :param user_id: The id of the user.
+        :param password: The new password hash.
+        :param previous_password: The hash being replaced, the user isn't updated if it changed.
+
+        :return: True if the hash was replaced.
+        """
+        email = await _query(
+            "update_password",
+            self._update_password(user_id, password, previous_password),
+        )
+        self.invalidate_user(user_id=user_id, email=email)
+        if email is None:
+            return False
+        if self.replicas is not None:
+            self.replicas.pin(("id", user_id), ("email", email))
+        return True
 
     async def get_user_by_email(self, email: str) -> User:
+        def load():
+            return _query("get_user_by_email", self._fetch_user_by_email(email))
+
+        if self.cache is None:
+            return await load()
+        return await self.cache.get_or_load(("email", email), load)
+
+    async def get_user_by_id(self, user_id: str) -> User:
+        def load():
+            return _query("get_user_by_id", self._fetch_user_by_id(user_id))
+
+        if self.cache is None:
+            return await load()
+        return await self.cache.get_or_load(("id", user_id), load)
+
+    async def get_identity_by_id(self, user_id: str) -> UserIdentity:
+        """
+        Get a user without the password hash, for the token validation.
+
+        :param user_id: The id of the user.
+
+        :raises UserNotFoundError: If the user doesn't exist.
+
+        :return: The user identity.
+        """
+
+        def load():
+            return _query("get_identity_by_id", self._fetch_identity_by_id(user_id))
+
+        if self.cache is None:
+            return await load()
+        return await self.cache.get_or_load(("identity", user_id), load)
+
+    async def get_users_by_ids(self, user_ids: List[str]) -> Dict[str, UserIdentity]:
+        """
+        Get many users without the password hash with a single query,
+        the cached ones aren't queried.
+
+        :param user_ids: The ids of the users.
+
+        :return: The found users by id, the unknown ids are omitted.
+        """
+        users = {}
+        missing = []
+        for user_id in user_ids:
+            user = self.cache.get(("identity", user_id)) if self.cache is not None else None
+            if user is not None:
+                users[user_id] = user
+                continue
+            try:
+                # an id that isn't a uuid can't exist, and would fail the whole query
+                uuid.UUID(user_id)
+            except ValueError:
+                continue
+            missing.append(user_id)
+        if not missing:
+            return users
+
+        rows = await _query("get_users_by_ids", self._fetch_identities_by_ids(missing))
+        for user in rows:
+            users[user.id] = user
+            if self.cache is not None:
+                self.cache.set(("identity", user.id), user)
+        return users
+
+    async def iter_users(
+        self, after_id: Optional[str] = None, page_size: int = 1000, include_password: bool = False
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Page through all the users in id order, e.g. to export them.
+
+        Each page is a keyset query on the primary key, so the cost of a page doesn't depend on
+        its position and no connection is held between the pages. Read from the replicas if any.
+
+        :param after_id: The id of the last user already read, None to start from the first one.
+        :param page_size: The users per page.
+        :param include_password: Include the password hashes.
+
+        :return: The pages of users, as rows of plain values, not cached nor validated.
+        """
+        after_id = after_id or NIL_UUID
+        while True:
+            rows = await _query(
+                "iter_users",
+                self._fetch_users_page(after_id, page_size, include_password),
+            )
+            if not rows:
+                return
+            page = [{**row, "id": str(row["id"])} for row in rows]
+            yield page
+            if len(page) < page_size:
+                return
+            after_id = page[-1]["id"]
+
+    def invalidate_user(self, user_id: Optional[str] = None, email: Optional[str] = None) -> None:
+        """
+        Drop a user from the cache, must be called by every method writing a user.
+
+        :param user_id: The id of the written user.
+        :param email: The email of the written user.
+        """
+        if self.cache is None:
+            return
+        if user_id is not None:
+            self.cache.invalidate(("id", user_id))
+            self.cache.invalidate(("identity", user_id))
+        if email is not None:
+            self.cache.invalidate(("email", email))
+
+    async def _read(self, keys: List[Hashable], run: Callable[[Any], Awaitable[Any]]) -> Any:
+        if self.replicas is None:
+            return await run(self.db_conn)
+        return await self.replicas.read(keys, run)
+
+    async def _insert_user(self, values: Dict) -> str:
+        query = user_query.insert_user
+        return await self.db_conn.execute(query=query, values=values)
+
+    async def _insert_users(self, users: List[Dict]) -> Dict[str, str]:
+        query = user_query.insert_users
+        values = {
+            "emails": [user["email"] for user in users],
+            "passwords": [user["password"] for user in users],
+            "first_names": [user["first_name"] for user in users],
+            "last_names": [user["last_name"] for user in users],
+            "two_factor_enabled": [user["two_factor_enabled"] for user in users],
+        }
+        rows = await self.db_conn.fetch_all(query=query, values=values)
+        return {row["email"]: str(row["id"]) for row in rows}
+
+    async def _update_password(
+        self, user_id: str, password: str, previous_password: str
+    ) -> Optional[str]:
+        query = user_query.update_password
+        values = {"id": user_id, "password": password, "previous_password": previous_password}
+        return await self.db_conn.execute(query=query, values=values)
+
+    async def _fetch_users_page(
+        self, after_id: str, page_size: int, include_password: bool
+    ) -> List[Any]:
+        query = user_query.export_users if include_password else user_query.export_identities
+        values = {"after_id": after_id, "page_size": page_size}
+        rows = await self._read([], lambda conn: conn.fetch_all(query=query, values=values))
+        return [dict(row) for row in rows]
+
+    async def _fetch_user_by_email(self, email: str) -> User:
         query = user_query.get_user_by_email
         values = {"email": email}
-        user = await self.db_conn.fetch_one(query=query, values=values)
+        user = await self._read(
+            [("email", email)], lambda conn: conn.fetch_one(query=query, values=values)
+        )
         if user is None:
             raise UserNotFoundError("User not found")
         return User.from_db(user)
 
-    async def get_user_by_id(self, user_id: str) -> User:
+    async def _fetch_user_by_id(self, user_id: str) -> User:
         query = user_query.get_user_by_id
         values = {"id": user_id}
-        user = await self.db_conn.fetch_one(query=query, values=values)
+        user = await self._read(
+            [("id", user_id)], lambda conn: conn.fetch_one(query=query, values=values)
+        )
         if user is None:
             raise UserNotFoundError("User not found")
         return User.from_db(user)
 
+    async def _fetch_identity_by_id(self, user_id: str) -> UserIdentity:
+        query = user_query.get_identity_by_id
+        values = {"id": user_id}
+        user = await self._read(
+            [("id", user_id)], lambda conn: conn.fetch_one(query=query, values=values)
+        )
+        if user is None:
+            raise UserNotFoundError("User not found")
+        return UserIdentity.from_db(user)
+
+    async def _fetch_identities_by_ids(self, user_ids: List[str]) -> List[UserIdentity]:
+        query = user_query.get_identities_by_ids
+        values = {"ids": user_ids}
+        rows = await self._read(
+            [("id", user_id) for user_id in user_ids],
+            lambda conn: conn.fetch_all(query=query, values=values),
+        )
+        return [UserIdentity.from_db(row) for row in rows]
+
 
-def get_user_repository(db_conn: Connection = Depends(get_db_connection)) -> UserRepository:
-    return UserRepository(db_conn=db_conn)
+def get_user_repository(request: Request) -> UserRepository:
+    # application-scoped, the connections are checked out per query instead of per request
+    return request.app.state.container.user_repository
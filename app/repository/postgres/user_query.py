@@ -4,14 +4,64 @@ insert into users (email, password, first_name, last_name, two_factor_enabled)
 returning id
 """
 
+# a batch of users in a single statement, the existing emails are skipped
+insert_users = """
+insert into users (email, password, first_name, last_name, two_factor_enabled)
+    select * from unnest(
+        cast(:emails as varchar[]),
+        cast(:passwords as varchar[]),
+        cast(:first_names as varchar[]),
+        cast(:last_names as varchar[]),
+        cast(:two_factor_enabled as boolean[])
+    )
+on conflict (email) do nothing
+returning id, email
+"""
+
+# only replaces the hash it was computed from, a concurrent password change wins
+update_password = """
+update users set password = :password
+    where id = :id and password = :previous_password
+returning email
+"""
+
 get_user_by_email = """
-select id, email, password, first_name, last_name, two_factor_enabled
+select id, email, password, first_name, last_name, two_factor_enabled, version
     from users
     where email = :email
 """
 
 get_user_by_id = """
-select id, email, password, first_name, last_name, two_factor_enabled
+select id, email, password, first_name, last_name, two_factor_enabled, version
+    from users
+    where id = :id
+"""
+
+get_identity_by_id = """
+select id, email, first_name, last_name, two_factor_enabled, version
     from users
     where id = :id
 """
+
+get_identities_by_ids = """
+select id, email, first_name, last_name, two_factor_enabled, version
+    from users
+    where id = any(:ids)
+"""
+
+# keyset pages in primary key order, the first one starts after the nil uuid
+export_identities = """
+select id, email, first_name, last_name, two_factor_enabled, version
+    from users
+    where id > :after_id
+    order by id
+    limit :page_size
+"""
+
+export_users = """
+select id, email, password, first_name, last_name, two_factor_enabled, version
+    from users
+    where id > :after_id
+    order by id
+    limit :page_size
+"""
@@ -0,0 +1,15 @@
+from pydantic import BaseModel, Field
+
+
+class ProfilingConfig(BaseModel):
+    sample_ratio: float = Field(
+        ..., description="Share of the requests profiled, 0 to stop", ge=0, le=1, example=0.01
+    )
+
+
+class ProfileToken(BaseModel):
+    header: str = Field(
+        ..., description="Request header to send the token in", example="X-Profile-Token"
+    )
+    token: str = Field(..., description="Signed token, profiles the requests sending it")
+    expires_at: int = Field(..., description="Expiration, in seconds since the epoch")
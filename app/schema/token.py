@@ -0,0 +1,39 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+from app.model.user import UserIdentity
+
+
+class IntrospectRequest(BaseModel):
+    tokens: List[str] = Field(..., description="Access tokens to validate", min_items=1)
+
+
+class TokenIntrospection(BaseModel):
+    active: bool = Field(..., description="Whether the token is valid", example=True)
+    sub: Optional[str] = Field(None, description="Id of the user", example="1234567890")
+    email: Optional[str] = Field(None, description="Email of the user", example="joe.doe@email.com")
+    first_name: Optional[str] = Field(None, description="First name of the user", example="Joe")
+    last_name: Optional[str] = Field(None, description="Last name of the user", example="Doe")
+    two_factor_enabled: Optional[bool] = Field(
+        None, description="Two factor authentication enabled", example=True
+    )
+
+    @classmethod
+    def from_identity(cls, identity: Optional[UserIdentity]) -> "TokenIntrospection":
+        if identity is None:
+            return cls(active=False)
+        return cls(
+            active=True,
+            sub=identity.id,
+            email=identity.email,
+            first_name=identity.first_name,
+            last_name=identity.last_name,
+            two_factor_enabled=identity.two_factor_enabled,
+        )
+
+
+class IntrospectResponse(BaseModel):
+    results: List[TokenIntrospection] = Field(
+        ..., description="Introspection of each token, in the request order"
+    )
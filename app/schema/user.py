@@ -1,4 +1,8 @@
-from pydantic import BaseModel, Field, EmailStr, SecretStr
+from typing import List, Optional
+
+from pydantic import BaseModel, Field, SecretStr, root_validator, validator
+
+from app.model.email import EmailStr
 
 
 class RegisterUserRequest(BaseModel):
@@ -30,3 +34,49 @@ class LoginResponse(BaseModel):
 
 class OtpRequest(BaseModel):
     otp: str = Field(..., description="OTP of the user", example="123456")
+
+
+class BulkRegisterUserRow(BaseModel):
+    email: EmailStr = Field(..., description="Email of the user", example="joe.doe@email.com")
+    password: Optional[SecretStr] = Field(
+        None, description="Password of the user, hashed on import", example="supersecret@#password"
+    )
+    password_hash: Optional[str] = Field(
+        None, description="bcrypt or argon2 hash of the password, stored as is"
+    )
+    first_name: str = Field(..., description="First name of the user", example="Joe")
+    last_name: str = Field(..., description="Last name of the user", example="Doe")
+    two_factor_enabled: bool = Field(
+        False, description="Two factor authentication enabled", example=True
+    )
+
+    @validator("password", "password_hash", pre=True)
+    def empty_as_missing(cls, value):
+        # empty CSV cells
+        return value or None
+
+    @root_validator(skip_on_failure=True)
+    def one_password(cls, values):
+        if (values.get("password") is None) == (values.get("password_hash") is None):
+            raise ValueError("Exactly one of password and password_hash is required")
+        return values
+
+
+class BulkRegisterRowResult(BaseModel):
+    line: int = Field(..., description="Line of the row in the input", example=2)
+    email: Optional[str] = Field(None, description="Email of the row", example="joe.doe@email.com")
+    status: str = Field(..., description="created, conflict or invalid", example="conflict")
+    error: Optional[str] = Field(None, description="Why the row was rejected")
+
+
+class BulkRegisterResponse(BaseModel):
+    rows: int = Field(..., description="Rows read", example=1000)
+    created: int = Field(..., description="Users created", example=998)
+    conflicts: int = Field(..., description="Rows whose email already exists", example=1)
+    invalid: int = Field(..., description="Rows that couldn't be parsed or validated", example=1)
+    rejected: List[BulkRegisterRowResult] = Field(
+        ..., description="The first rows not created, in the input order"
+    )
+    rejected_truncated: bool = Field(
+        False, description="More rows were not created than listed in rejected"
+    )
@@ -0,0 +1,227 @@
+"""
+Production entry point running the application on pre-forked uvicorn workers.
+
+    python -m app.server --workers 4 --port 5050
+
+The application is imported once by the master process, then the heap is frozen with
+`gc.freeze()` so the forked workers share its memory pages instead of copying them when the
+garbage collector touches the objects. Each worker listens on its own `SO_REUSEPORT` socket,
+letting the kernel balance the connections, or on a socket shared by all of them where
+`SO_REUSEPORT` isn't available. The workers that die are restarted.
+The workers write their metrics to a shared PROMETHEUS_MULTIPROC_DIR, a temporary directory
+unless it's set, so /metrics reports the whole server whichever worker serves it.
+The client IP is read from X-Forwarded-For when the request comes from a proxy listed in
+--forwarded-allow-ips, FORWARDED_ALLOW_IPS by default.
+"""
+import argparse
+import gc
+import importlib
+import logging
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+from typing import Dict, Optional
+
+from app.config.settings import get_settings
+
+# a worker dying sooner than this after its start is restarted with a delay
+MIN_WORKER_UPTIME_SECONDS = 1.0
+# read by prometheus_client when it's imported, see app.metrics
+METRICS_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+
+def create_socket(host: str, port: int, reuse_port: bool, backlog: int = 2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def prepare_metrics_dir() -> Optional[str]:
+    """
+    Set up the directory the workers share their metrics through, before the application and
+    prometheus_client are imported.
+
+    :return: The temporary directory created, to remove on exit, None if the directory was set.
+    """
+    path = os.environ.get(METRICS_DIR_ENV)
+    if not path:
+        path = tempfile.mkdtemp(prefix="auth-metrics-")
+        os.environ[METRICS_DIR_ENV] = path
+        return path
+    os.makedirs(path, exist_ok=True)
+    # the values of a previous run would be added to the new ones
+    for name in os.listdir(path):
+        if name.endswith(".db"):
+            os.remove(os.path.join(path, name))
+    return None
+
+
+def load_app(path: str):
+    module_name, _, attribute = path.partition(":")
+    return getattr(importlib.import_module(module_name), attribute or "app")
+
+
+def worker_config(app, forwarded_allow_ips: str):
+    import uvicorn
+
+    # the client IP is read from X-Forwarded-For when sent by a trusted proxy
+    return uvicorn.Config(
+        app,
+        access_log=False,
+        log_level="warning",
+        proxy_headers=True,
+        forwarded_allow_ips=forwarded_allow_ips,
+    )
+
+
+def run_worker(
+    app, sock: Optional[socket.socket], host: str, port: int, forwarded_allow_ips: str
+) -> None:
+    import uvicorn
+
+    # the master signal handlers are replaced by the uvicorn ones
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if sock is None:
+        sock = create_socket(host, port, reuse_port=True)
+    server = uvicorn.Server(worker_config(app, forwarded_allow_ips))
+    server.run(sockets=[sock])
+
+
+class Master:
+    """
+    Forks the workers and keeps their number, until it's asked to stop.
+    """
+
+    def __init__(
+        self,
+        app,
+        workers: int,
+        host: str,
+        port: int,
+        reuse_port: bool,
+        forwarded_allow_ips: str = "127.0.0.1",
+    ):
+        self.app = app
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.reuse_port = reuse_port
+        self.forwarded_allow_ips = forwarded_allow_ips
+        self.shared_socket: Optional[socket.socket] = None
+        # started worker pids and their start time
+        self.children: Dict[int, float] = {}
+        self.stopping = False
+
+    def spawn(self) -> None:
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                run_worker(
+                    self.app, self.shared_socket, self.host, self.port, self.forwarded_allow_ips
+                )
+            except BaseException:
+                logging.exception("Worker %d failed", os.getpid())
+                status = 1
+            finally:
+                # os._exit skips the exit handlers, write the pending log records first
+                logging.shutdown()
+                os._exit(status)
+        self.children[pid] = time.monotonic()
+
+    def stop(self, signum, frame) -> None:
+        self.stopping = True
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> int:
+        if not self.reuse_port:
+            self.shared_socket = create_socket(self.host, self.port, reuse_port=False)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        logging.warning(
+            "Starting %d workers on %s:%d (%s)",
+            self.workers,
+            self.host,
+            self.port,
+            "SO_REUSEPORT" if self.reuse_port else "shared socket",
+        )
+        for _ in range(self.workers):
+            self.spawn()
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            started_at = self.children.pop(pid, None)
+            if self.stopping or started_at is None:
+                continue
+            logging.warning(
+                "Worker %d exited with status %d, restarting it",
+                pid,
+                os.waitstatus_to_exitcode(status),
+            )
+            if time.monotonic() - started_at < MIN_WORKER_UPTIME_SECONDS:
+                # don't spin on a worker failing at startup
+                time.sleep(MIN_WORKER_UPTIME_SECONDS)
+            self.spawn()
+        return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--app", default="app.main:app", help="application, as module:attribute")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 5050)))
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        help="worker processes, the CPU count by default",
+    )
+    parser.add_argument(
+        "--no-reuse-port", action="store_true", help="share a single socket between the workers"
+    )
+    parser.add_argument(
+        "--forwarded-allow-ips",
+        help="proxies trusted with X-Forwarded-For, FORWARDED_ALLOW_IPS by default",
+    )
+    args = parser.parse_args(argv)
+
+    # before importing the application, so each worker pool gets its share of the connections
+    os.environ["DB_POOL_WORKERS"] = str(args.workers)
+    metrics_dir = prepare_metrics_dir()
+    try:
+        app = load_app(args.app)
+        # the objects created so far are never collected, the workers share their pages
+        gc.collect()
+        gc.freeze()
+
+        reuse_port = not args.no_reuse_port and hasattr(socket, "SO_REUSEPORT")
+        forwarded_allow_ips = args.forwarded_allow_ips or get_settings().forwarded_allow_ips
+        return Master(
+            app, args.workers, args.host, args.port, reuse_port, forwarded_allow_ips
+        ).run()
+    finally:
+        if metrics_dir is not None:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,38 +1,60 @@
+import asyncio
 import logging
 import math
 import random
-from datetime import timedelta, datetime
-from typing import Optional, Dict
+import time
+from datetime import timedelta
+from typing import Optional, Dict, List
 
 from fastapi import Depends
 from fastapi.security import HTTPAuthorizationCredentials
-from jose import jwt
 
-from app.config.settings import Settings, get_settings
-from app.hash import get_password_hash, verify_password, get_otp_hash, verify_otp
-from app.model.user import User
+from app.config.settings import Settings
+from app.container import Container, get_container
+from app.hash import AsyncHasher, HashingUnavailableError, OTPBinder
+from app.jwt_codec import JWTCodec, TokenError
+from app.model.user import User, UserIdentity
+from app.rate_limit import EMAIL_SCOPE, OTP_SCOPE, RateLimiter
 from app.repository import UserNotFoundError
 from app.repository.postgres.user import UserRepository, get_user_repository
 from app.service import InvalidCredentialsError
-from app.service.otp import OTPSenderService, LogOTPSenderService
+from app.service.otp import OTPSenderService
+from app.tracing import span, traced
 
 OTP_TOKEN_TYPE = "otp_temp_token"
 ACCESS_TOKEN_TYPE = "access_token"
+# claims carried by the tokens when stateless validation is enabled
+IDENTITY_CLAIMS = frozenset(("email", "given_name", "family_name", "2fa", "ver"))
+
+# running password rehashes by user id, they outlive the login request that started them
+_rehash_tasks: Dict[str, asyncio.Task] = {}
 
 
 class AuthService:
     def __init__(
-        self, user_repository: UserRepository, app_settings: Settings, otp_service: OTPSenderService
+        self,
+        user_repository: UserRepository,
+        app_settings: Settings,
+        otp_service: OTPSenderService,
+        hasher: Optional[AsyncHasher] = None,
+        jwt_codec: Optional[JWTCodec] = None,
+        otp_binder: Optional[OTPBinder] = None,
+        rate_limiter: Optional[RateLimiter] = None,
     ):
         self.user_repository = user_repository
         self.app_settings = app_settings
         self.otp_service = otp_service
+        self.hasher = hasher or AsyncHasher.from_settings(app_settings.hash)
+        self.jwt_codec = jwt_codec or JWTCodec.from_settings(app_settings.jwt)
+        self.otp_binder = otp_binder or OTPBinder.from_settings(app_settings.otp, app_settings.jwt)
+        self.rate_limiter = rate_limiter
 
+    @traced("AuthService.register_user")
     async def register_user(
         self, email: str, password: str, first_name: str, last_name: str, two_factor_enabled: bool
     ) -> str:
-        # hash the password before storing it
-        hashed_pass = get_password_hash(password)
+        # hash the password before storing it, off the event loop
+        hashed_pass = await self.hasher.get_password_hash(password)
         return await self.user_repository.insert_user(
             email=email,
             password=hashed_pass,
@@ -41,27 +63,45 @@ class AuthService:
             two_factor_enabled=two_factor_enabled,
         )
 
+    @traced("AuthService.authenticate_user")
     async def authenticate_user(self, email: str, password: str) -> Optional[str]:
+        if self.rate_limiter is not None:
+            # before the lookup and the hashing, the attempts on an account cost nothing
+            await self.rate_limiter.hit(EMAIL_SCOPE, email.lower())
         # try to get the user from the database
         try:
             user = await self.user_repository.get_user_by_email(email=email)
-            logging.debug(f"User found: {user}")
+            logging.debug("User found: %s", user)
         except UserNotFoundError:
             raise InvalidCredentialsError("Invalid credentials")
         # verify the password against the stored hash
-        if verify_password(password, user.password.get_secret_value()):
+        hashed_password = user.password.get_secret_value()
+        if await self.hasher.verify_password(password, hashed_password):
             logging.debug("Password verified")
+            if self.hasher.needs_rehash(hashed_password):
+                self.schedule_rehash(user, password)
             if not user.two_factor_enabled:
                 logging.debug("2FA not enabled, returning access token")
-                return self.generate_jwt_token(data={"sub": user.id, "type": ACCESS_TOKEN_TYPE})
+                return self.generate_jwt_token(
+                    data={"sub": user.id, "type": ACCESS_TOKEN_TYPE, **self.identity_claims(user)}
+                )
             else:
                 logging.debug("2FA enabled, sending OTP")
                 random_otp = self.generate_otp()
-                self.otp_service.send_otp(user.email, random_otp)
-                # after generating the OTP, we return a temporary token that contains the OTP hash
+                with span("OTPSenderService.send_otp"):
+                    self.otp_service.send_otp(user.email, random_otp)
+                # after generating the OTP, we return a temporary token bound to the OTP
+                otp_nonce, otp_mac = self.otp_binder.bind(user.id, random_otp)
                 logging.debug("Returning temporary token")
                 return self.generate_jwt_token(
-                    data={"sub": user.id, "type": OTP_TOKEN_TYPE, "otp": get_otp_hash(random_otp)},
+                    data={
+                        "sub": user.id,
+                        "type": OTP_TOKEN_TYPE,
+                        "otp_nonce": otp_nonce,
+                        "otp_mac": otp_mac,
+                        # carried over to the access token, so verify_otp doesn't load the user
+                        **self.identity_claims(user),
+                    },
                     expires_delta=timedelta(
                         seconds=self.app_settings.jwt.otp_token_expiration_seconds
                     ),
@@ -69,6 +109,40 @@ class AuthService:
         else:
             raise InvalidCredentialsError("Invalid credentials")
 
+    def schedule_rehash(self, user: User, password: str) -> Optional[asyncio.Task]:
+        """
+        Replace the hash of a verified password with one of the current scheme and cost,
+        in the background so the login doesn't wait for a second hash.
+
+        :param user: The user logging in, with the stored hash.
+        :param password: The verified password.
+
+        :return: The rehash task, None if one is already running for the user.
+        """
+        if user.id in _rehash_tasks:
+            return None
+        task = asyncio.create_task(self._rehash(user, password))
+        _rehash_tasks[user.id] = task
+        task.add_done_callback(lambda _: _rehash_tasks.pop(user.id, None))
+        return task
+
+    async def _rehash(self, user: User, password: str) -> None:
+        try:
+            new_hash = await self.hasher.get_password_hash(password)
+            updated = await self.user_repository.update_password(
+                user.id, new_hash, user.password.get_secret_value()
+            )
+        except HashingUnavailableError:
+            # retried on the next login
+            logging.warning("Password rehash of user %s skipped, hashing is busy", user.id)
+            return
+        except Exception:
+            logging.exception("Password rehash of user %s failed", user.id)
+            return
+        if updated:
+            logging.info("Password hash of user %s upgraded", user.id)
+
+    @traced("AuthService.verify_otp")
     async def verify_otp(
         self, credentials: HTTPAuthorizationCredentials, otp: str
     ) -> Optional[str]:
@@ -79,60 +153,155 @@ class AuthService:
         jwt_token = credentials.credentials
         try:
             logging.debug("Decoding JWT token")
-            payload = jwt.decode(
-                jwt_token,
-                self.app_settings.jwt.secret_key,
-                algorithms=[self.app_settings.jwt.crypto_algorithm],
-            )
-            logging.debug(f"Valid signed JWT, payload: {payload}")
-            if payload["type"] == OTP_TOKEN_TYPE and verify_otp(otp, payload["otp"]):
+            payload = self.jwt_codec.decode(jwt_token)
+            logging.debug("Valid signed JWT, payload: %s", payload)
+            if payload["type"] != OTP_TOKEN_TYPE:
+                raise InvalidCredentialsError("Invalid credentials")
+            if self.rate_limiter is not None:
+                # the OTP can be guessed for as long as the temp token lives
+                await self.rate_limiter.hit(OTP_SCOPE, payload["sub"])
+            if await self.check_otp(payload, otp):
                 logging.debug("OTP verified, returning access token")
+                identity_claims = {k: v for k, v in payload.items() if k in IDENTITY_CLAIMS}
                 return self.generate_jwt_token(
-                    data={"sub": payload["sub"], "type": ACCESS_TOKEN_TYPE}
+                    data={"sub": payload["sub"], "type": ACCESS_TOKEN_TYPE, **identity_claims}
                 )
             else:
                 raise InvalidCredentialsError("Invalid credentials")
-        except jwt.JWTError:
+        except TokenError:
             raise InvalidCredentialsError("Invalid credentials")
 
+    async def check_otp(self, payload: Dict, otp: str) -> bool:
+        """
+        Check an OTP against the binding embedded in a temp token.
+
+        :param payload: The decoded temp token.
+        :param otp: The OTP sent by the user.
+
+        :return: True if the OTP matches the token.
+        """
+        if "otp_mac" in payload:
+            return self.otp_binder.verify(
+                payload["sub"], otp, payload["otp_nonce"], payload["otp_mac"]
+            )
+        if "otp" in payload and self.app_settings.otp.accept_bcrypt_tokens:
+            # temp token issued before the HMAC binding, valid until it expires
+            return await self.hasher.verify_otp(otp, payload["otp"])
+        return False
+
     def generate_jwt_token(self, data: Dict, expires_delta: Optional[timedelta] = None) -> str:
         jwt_settings = self.app_settings.jwt
         to_encode = data.copy()
+        issued_at = int(time.time())
         if expires_delta:
-            expire = datetime.utcnow() + expires_delta
+            expire = issued_at + int(expires_delta.total_seconds())
         else:
-            expire = datetime.utcnow() + timedelta(minutes=jwt_settings.expiration_minutes)
-        to_encode.update({"exp": expire})
-        encoded_jwt = jwt.encode(
-            to_encode, jwt_settings.secret_key, algorithm=jwt_settings.crypto_algorithm
-        )
+            expire = issued_at + jwt_settings.expiration_minutes * 60
+        to_encode.update({"exp": expire, "iat": issued_at})
+        encoded_jwt = self.jwt_codec.encode(to_encode)
         return encoded_jwt
 
     def decode_jwt_token(self, jwt_token: str) -> Dict:
-        jwt_settings = self.app_settings.jwt
-        decoded_jwt = jwt.decode(
-            jwt_token, jwt_settings.secret_key, algorithms=[jwt_settings.crypto_algorithm]
-        )
+        decoded_jwt = self.jwt_codec.decode(jwt_token)
         return decoded_jwt
 
-    async def verify_jwt_token(self, credentials: HTTPAuthorizationCredentials) -> User:
+    def identity_claims(self, user: UserIdentity) -> Dict:
+        """
+        Claims needed to validate an access token without loading the user,
+        only issued when stateless validation is enabled.
+
+        :param user: The user the token is issued to.
+
+        :return: The identity claims, empty if stateless validation is disabled.
+        """
+        if not self.app_settings.jwt.stateless_validation:
+            return {}
+        return user.to_claims()
+
+    def requires_user_lookup(self, payload: Dict) -> bool:
+        """
+        Tell if an access token must be checked against the stored user.
+
+        Tokens without identity claims always are, in stateless mode the others are only
+        when they are older than the user version check interval.
+
+        :param payload: The decoded access token.
+
+        :return: True if the user must be loaded from the repository.
+        """
+        jwt_settings = self.app_settings.jwt
+        if not jwt_settings.stateless_validation or not IDENTITY_CLAIMS.issubset(payload):
+            return True
+        if jwt_settings.user_version_check_seconds is None:
+            return False
+        return time.time() - payload.get("iat", 0) > jwt_settings.user_version_check_seconds
+
+    @staticmethod
+    def is_user_version_valid(payload: Dict, user: UserIdentity) -> bool:
+        # a bumped user version revokes the tokens issued before it
+        return "ver" not in payload or payload["ver"] == user.version
+
+    @traced("AuthService.introspect_tokens")
+    async def introspect_tokens(self, tokens: List[str]) -> List[Optional[UserIdentity]]:
+        """
+        Validate a batch of access tokens, loading all the users they need with a single query.
+
+        :param tokens: The access tokens.
+
+        :return: The identity of each token, in the same order, None for the invalid ones.
+        """
+        payloads = []
+        for token in tokens:
+            try:
+                payload = self.jwt_codec.decode(token)
+            except TokenError:
+                payloads.append(None)
+                continue
+            if payload.get("type") != ACCESS_TOKEN_TYPE or "sub" not in payload:
+                payloads.append(None)
+                continue
+            payloads.append((payload, self.requires_user_lookup(payload)))
+
+        user_ids = {entry[0]["sub"] for entry in payloads if entry is not None and entry[1]}
+        users = await self.user_repository.get_users_by_ids(list(user_ids)) if user_ids else {}
+
+        identities = []
+        for entry in payloads:
+            if entry is None:
+                identities.append(None)
+                continue
+            payload, requires_user_lookup = entry
+            if not requires_user_lookup:
+                identities.append(UserIdentity.from_claims(payload))
+                continue
+            user = users.get(payload["sub"])
+            if user is None or not self.is_user_version_valid(payload, user):
+                identities.append(None)
+            else:
+                identities.append(user)
+        return identities
+
+    @traced("AuthService.verify_jwt_token")
+    async def verify_jwt_token(self, credentials: HTTPAuthorizationCredentials) -> UserIdentity:
         if credentials.scheme != "Bearer":
             raise InvalidCredentialsError("Invalid authentication scheme")
 
-        jwt_token = credentials.credentials
+        return await self.verify_access_token(credentials.credentials)
+
+    async def verify_access_token(self, jwt_token: str) -> UserIdentity:
         try:
-            payload = jwt.decode(
-                jwt_token,
-                self.app_settings.jwt.secret_key,
-                algorithms=[self.app_settings.jwt.crypto_algorithm],
-            )
-            if payload["type"] == ACCESS_TOKEN_TYPE and payload:
-                return await self.user_repository.get_user_by_id(payload["sub"])
-            else:
+            payload = self.jwt_codec.decode(jwt_token)
+            if payload["type"] != ACCESS_TOKEN_TYPE:
+                raise InvalidCredentialsError("Invalid credentials")
+            if not self.requires_user_lookup(payload):
+                return UserIdentity.from_claims(payload)
+            user = await self.user_repository.get_identity_by_id(payload["sub"])
+            if not self.is_user_version_valid(payload, user):
                 raise InvalidCredentialsError("Invalid credentials")
+            return user
         except InvalidCredentialsError:
             raise
-        except jwt.JWTError:
+        except TokenError:
             raise InvalidCredentialsError("Invalid credentials")
         except UserNotFoundError:
             raise InvalidCredentialsError("Invalid credentials")
@@ -154,9 +323,14 @@ class AuthService:
 
 def get_auth_service(
     user_repository: UserRepository = Depends(get_user_repository),
-    app_settings: Settings = Depends(get_settings),
-    otp_service: OTPSenderService = Depends(LogOTPSenderService),
+    container: Container = Depends(get_container),
 ) -> AuthService:
     return AuthService(
-        user_repository=user_repository, app_settings=app_settings, otp_service=otp_service
+        user_repository=user_repository,
+        app_settings=container.settings,
+        otp_service=container.otp_service,
+        hasher=container.hasher,
+        jwt_codec=container.jwt_codec,
+        otp_binder=container.otp_binder,
+        rate_limiter=container.rate_limiter,
     )
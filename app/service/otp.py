@@ -10,4 +10,4 @@ class OTPSenderService(ABC):
 
 class LogOTPSenderService(OTPSenderService):
     def send_otp(self, email: str, otp: str) -> None:
-        logging.info(f"Sending OTP {otp} to {email}")
+        logging.info("Sending OTP %s to %s", otp, email)
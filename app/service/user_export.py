@@ -0,0 +1,131 @@
+import base64
+import binascii
+import csv
+import io
+import json
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.repository.postgres.user import UserRepository
+
+EXPORT_FORMATS = ("ndjson", "csv")
+EXPORT_FIELDS = ("id", "email", "first_name", "last_name", "two_factor_enabled", "version")
+# named as in the bulk registration, so an export can be imported back
+PASSWORD_FIELD = "password_hash"
+# the only field of the NDJSON cursor lines, skipped by the import
+CURSOR_FIELD = "cursor"
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+def encode_cursor(after_id: str) -> str:
+    """
+    Opaque token of a position in the export, resuming after the given user.
+
+    :param after_id: The id of the last exported user.
+
+    :return: The cursor token.
+    """
+    payload = json.dumps({"after": after_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).rstrip(b"=").decode()
+
+
+def decode_cursor(token: str) -> str:
+    """
+    Decode a cursor token.
+
+    :param token: The token returned by a previous export.
+
+    :raises InvalidCursorError: If the token is malformed.
+
+    :return: The id of the last exported user.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        return str(uuid.UUID(payload["after"]))
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise InvalidCursorError("Invalid export cursor")
+
+
+class UserExporter:
+    """
+    Streams all the users as NDJSON or CSV, a page of `page_size` users at a time,
+    so the memory used doesn't depend on the number of users.
+
+    The password hashes are only exported with `include_password`.
+    With `cursor_lines` every NDJSON page is followed by a `{"cursor": ...}` line, the token
+    resuming the export after that page when passed back as `cursor`, else the token of the last
+    page is only kept in `last_cursor`. The CSV output never has cursor lines.
+    """
+
+    def __init__(
+        self,
+        user_repository: UserRepository,
+        page_size: int,
+        include_password: bool = False,
+        cursor_lines: bool = False,
+    ):
+        self.user_repository = user_repository
+        self.page_size = page_size
+        self.include_password = include_password
+        self.cursor_lines = cursor_lines
+        self.fields = EXPORT_FIELDS + ((PASSWORD_FIELD,) if include_password else ())
+        self.exported = 0
+        self.last_cursor: Optional[str] = None
+
+    async def pages(self, cursor: Optional[str] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Read the users in pages.
+
+        :param cursor: The token to resume from, None to start from the first user.
+
+        :raises InvalidCursorError: If the cursor is malformed.
+
+        :return: The pages of users, `last_cursor` resumes after the last one yielded.
+        """
+        after_id = decode_cursor(cursor) if cursor is not None else None
+        async for page in self.user_repository.iter_users(
+            after_id=after_id, page_size=self.page_size, include_password=self.include_password
+        ):
+            self.exported += len(page)
+            self.last_cursor = encode_cursor(page[-1]["id"])
+            if self.include_password:
+                for user in page:
+                    user[PASSWORD_FIELD] = user.pop("password")
+            yield [{field: user[field] for field in self.fields} for user in page]
+
+    async def export(self, format: str, cursor: Optional[str] = None) -> AsyncIterator[bytes]:
+        """
+        Serialize the users.
+
+        :param format: ndjson or csv.
+        :param cursor: The token to resume from, None to start from the first user.
+
+        :raises InvalidCursorError: If the cursor is malformed.
+
+        :return: The encoded output, a chunk per page.
+        """
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {format}")
+        # validate before the first chunk is sent
+        if cursor is not None:
+            decode_cursor(cursor)
+        if format == "csv" and cursor is None:
+            # a resumed export continues the previous output
+            yield _csv_rows([self.fields])
+        async for page in self.pages(cursor):
+            if format == "csv":
+                yield _csv_rows([[user[field] for field in self.fields] for user in page])
+                continue
+            lines = [json.dumps(user, separators=(",", ":")) for user in page]
+            if self.cursor_lines:
+                lines.append(json.dumps({CURSOR_FIELD: self.last_cursor}))
+            yield ("\n".join(lines) + "\n").encode()
+
+
+def _csv_rows(rows: List) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    return buffer.getvalue().encode()
@@ -0,0 +1,225 @@
+import asyncio
+import codecs
+import csv
+import json
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterable, AsyncIterator, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from app.hash import AsyncHasher, is_password_hash
+from app.repository.postgres.user import UserRepository
+from app.schema.user import BulkRegisterRowResult, BulkRegisterUserRow
+from app.service.user_export import CURSOR_FIELD
+
+IMPORT_FORMATS = ("jsonl", "csv")
+CREATED = "created"
+CONFLICT = "conflict"
+INVALID = "invalid"
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    """
+    Split a stream of UTF-8 bytes, e.g. a request body, into lines.
+
+    :param chunks: The bytes, cut anywhere.
+
+    :return: The lines, without their line break.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+class RowParser:
+    """
+    Parses the input one line at a time, so the input is never held in memory.
+
+    JSON Lines rows are objects, the `{"cursor": ...}` lines of an NDJSON export are skipped.
+    CSV rows are mapped to the columns of the header line, values spanning several lines aren't
+    supported.
+    """
+
+    def __init__(self, format: str):
+        if format not in IMPORT_FORMATS:
+            raise ValueError(f"Unsupported import format: {format}")
+        self.format = format
+        self.header: Optional[List[str]] = None
+
+    def parse(self, line: str) -> Optional[Dict]:
+        """
+        Parse a line of the input.
+
+        :param line: The line, with or without its line break.
+
+        :raises ValueError: If the line isn't a valid row.
+
+        :return: The row fields, None for the blank lines, the export cursors and the CSV header.
+        """
+        if not line.strip():
+            return None
+        if self.format == "jsonl":
+            row = json.loads(line)
+            if not isinstance(row, dict):
+                raise ValueError("A row must be a JSON object")
+            if row.keys() == {CURSOR_FIELD}:
+                return None
+            return row
+        values = next(csv.reader([line]))
+        if self.header is None:
+            self.header = [name.strip() for name in values]
+            return None
+        if len(values) != len(self.header):
+            raise ValueError(f"Expected {len(self.header)} columns, got {len(values)}")
+        return dict(zip(self.header, values))
+
+
+@dataclass
+class ImportStats:
+    rows: int = 0
+    created: int = 0
+    conflicts: int = 0
+    invalid: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    def add(self, results: List[BulkRegisterRowResult]) -> None:
+        self.rows += len(results)
+        for result in results:
+            if result.status == CREATED:
+                self.created += 1
+            elif result.status == CONFLICT:
+                self.conflicts += 1
+            else:
+                self.invalid += 1
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / max(time.monotonic() - self.started_at, 1e-9)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "rows": self.rows,
+            "created": self.created,
+            "conflicts": self.conflicts,
+            "invalid": self.invalid,
+            "seconds": round(time.monotonic() - self.started_at, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+        }
+
+
+class UserImporter:
+    """
+    Registers users in chunks of `chunk_size` rows: the plaintext passwords of a chunk are hashed
+    in parallel on the hasher workers, then the chunk is inserted with a single query.
+
+    A row whose email already exists, or appears earlier in the input, is reported as a conflict,
+    a row failing the validation as invalid, the other rows of the chunk are still inserted.
+    """
+
+    def __init__(self, user_repository: UserRepository, hasher: AsyncHasher, chunk_size: int):
+        self.user_repository = user_repository
+        self.hasher = hasher
+        self.chunk_size = chunk_size
+        self.stats = ImportStats()
+        # at most a hash per worker in flight, the queue is left to the logins
+        self._hashing = asyncio.Semaphore(hasher.workers)
+
+    async def import_lines(
+        self, lines: AsyncIterable[str], format: str
+    ) -> AsyncIterator[List[BulkRegisterRowResult]]:
+        """
+        Import the users of a JSON Lines or CSV input.
+
+        :param lines: The lines of the input.
+        :param format: The input format, jsonl or csv.
+
+        :return: The results of the rows, a list per chunk in the input order.
+        """
+        parser = RowParser(format)
+        chunk: List[Tuple[int, Dict]] = []
+        invalid: List[BulkRegisterRowResult] = []
+        line_number = 0
+        async for line in lines:
+            line_number += 1
+            try:
+                row = parser.parse(line)
+            except ValueError as e:
+                invalid.append(_invalid(line_number, None, str(e)))
+                continue
+            if row is not None:
+                chunk.append((line_number, row))
+            if len(chunk) >= self.chunk_size:
+                yield await self._import_chunk(chunk, invalid)
+                chunk, invalid = [], []
+        if chunk or invalid:
+            yield await self._import_chunk(chunk, invalid)
+
+    async def _import_chunk(
+        self, chunk: List[Tuple[int, Dict]], results: List[BulkRegisterRowResult]
+    ) -> List[BulkRegisterRowResult]:
+        valid: List[Tuple[int, BulkRegisterUserRow]] = []
+        for line, fields in chunk:
+            try:
+                row = BulkRegisterUserRow(**fields)
+            except ValidationError as e:
+                results.append(_invalid(line, fields.get("email"), _validation_message(e)))
+                continue
+            if row.password_hash is not None and not is_password_hash(
+                row.password_hash, self.hasher.policy
+            ):
+                results.append(_invalid(line, row.email, "Unsupported password hash"))
+                continue
+            valid.append((line, row))
+
+        hashes = await asyncio.gather(*(self._password_hash(row) for _, row in valid))
+        users = [
+            {
+                "email": row.email,
+                "password": password,
+                "first_name": row.first_name,
+                "last_name": row.last_name,
+                "two_factor_enabled": row.two_factor_enabled,
+            }
+            for (_, row), password in zip(valid, hashes)
+        ]
+        inserted = await self.user_repository.insert_users(users) if users else {}
+
+        for line, row in valid:
+            # the first row of an email gets it, the next ones conflict
+            if inserted.pop(row.email, None) is not None:
+                results.append(BulkRegisterRowResult(line=line, email=row.email, status=CREATED))
+            else:
+                results.append(
+                    BulkRegisterRowResult(
+                        line=line, email=row.email, status=CONFLICT, error="User already exists"
+                    )
+                )
+        results.sort(key=lambda result: result.line)
+        self.stats.add(results)
+        return results
+
+    async def _password_hash(self, row: BulkRegisterUserRow) -> str:
+        if row.password_hash is not None:
+            return row.password_hash
+        async with self._hashing:
+            return await self.hasher.get_password_hash(row.password.get_secret_value())
+
+
+def _invalid(line: int, email: Optional[str], error: str) -> BulkRegisterRowResult:
+    return BulkRegisterRowResult(
+        line=line, email=email if isinstance(email, str) else None, status=INVALID, error=error
+    )
+
+
+def _validation_message(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}" for error in e.errors()
+    )
@@ -0,0 +1,29 @@
+from typing import Awaitable, Callable, Tuple
+
+from app.config.settings import Settings
+from app.repository.postgres.user import UserRepository
+
+
+async def connect_repository(
+    settings: Settings,
+) -> Tuple[UserRepository, Callable[[], Awaitable[None]]]:
+    """
+    Connect to the primary with the configured backend.
+
+    :param settings: The application settings.
+
+    :return: The repository and the function closing its connections.
+    """
+    if settings.postgres.backend == "asyncpg":
+        from app.repository.postgres.asyncpg_user import (
+            AsyncpgUserRepository,
+            create_asyncpg_pool,
+        )
+
+        pool = await create_asyncpg_pool(settings.postgres)
+        return AsyncpgUserRepository(pool), pool.close
+    from app.repository.postgres import create_database_from_settings
+
+    database = create_database_from_settings(settings.postgres)
+    await database.connect()
+    return UserRepository(db_conn=database), database.disconnect
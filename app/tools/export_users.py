@@ -0,0 +1,76 @@
+"""
+Export the users to a NDJSON or CSV file, in constant memory.
+
+The users are read in id order, a page of EXPORT_PAGE_SIZE users per query, without the password
+hashes unless --include-password-hash is given. The progress is written to stderr with the cursor
+token of the last exported page, passing it to --cursor appends the rest of an interrupted export.
+Point DB_HOST to a read replica to keep the export off the primary.
+
+    python -m app.tools.export_users --output users.ndjson
+    python -m app.tools.export_users --output users.csv --cursor eyJhZnRlciI6Ii4uLiJ9
+"""
+import argparse
+import asyncio
+import json
+import sys
+from typing import BinaryIO, Optional
+
+from app.config.settings import Settings
+from app.service.user_export import EXPORT_FORMATS, InvalidCursorError, UserExporter
+from app.tools.common import connect_repository
+
+
+async def run(
+    output: BinaryIO,
+    format: str,
+    cursor: Optional[str],
+    include_password: bool,
+    page_size: int,
+    settings: Settings,
+) -> int:
+    repository, close = await connect_repository(settings)
+    exporter = UserExporter(repository, page_size=page_size, include_password=include_password)
+    try:
+        async for chunk in exporter.export(format, cursor):
+            output.write(chunk)
+            if exporter.last_cursor is not None:
+                print(f"{exporter.exported} users, cursor {exporter.last_cursor}", file=sys.stderr)
+        output.flush()
+    finally:
+        await close()
+    print(
+        json.dumps({"exported": exporter.exported, "cursor": exporter.last_cursor}),
+        file=sys.stderr,
+    )
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--output", help="file to write, stdout by default")
+    parser.add_argument(
+        "--format", choices=EXPORT_FORMATS, help="output format, guessed from the file extension"
+    )
+    parser.add_argument("--cursor", help="resume the export after this cursor token")
+    parser.add_argument("--include-password-hash", action="store_true")
+    parser.add_argument("--page-size", type=int, help="users per query, EXPORT_PAGE_SIZE")
+    args = parser.parse_args(argv)
+
+    format = args.format or ("csv" if (args.output or "").endswith(".csv") else "ndjson")
+    settings = Settings()
+    page_size = args.page_size or settings.user_export.page_size
+    # a resumed export is appended to the same file
+    output = open(args.output, "ab" if args.cursor else "wb") if args.output else sys.stdout.buffer
+    try:
+        return asyncio.run(
+            run(output, format, args.cursor, args.include_password_hash, page_size, settings)
+        )
+    except InvalidCursorError as e:
+        parser.error(str(e))
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
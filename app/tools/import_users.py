@@ -0,0 +1,91 @@
+"""
+Import users from a JSON Lines or CSV file into the users table.
+
+Each row has the email, first_name, last_name and optional two_factor_enabled fields, with either
+a plaintext password, hashed on all the cores, or an existing bcrypt/argon2 password_hash.
+The rows are inserted in chunks, with COPY on the asyncpg backend. The rows not created are
+written to stdout as JSON lines, the progress and the final statistics to stderr.
+
+    python -m app.tools.import_users users.csv --chunk-size 5000
+    cat users.jsonl | python -m app.tools.import_users - --format jsonl
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from typing import AsyncIterator, Iterable, Optional
+
+from app.config.settings import Settings
+from app.hash import AsyncHasher
+from app.service.user_import import CREATED, IMPORT_FORMATS, UserImporter
+from app.tools.common import connect_repository
+
+
+async def read_lines(lines: Iterable[str]) -> AsyncIterator[str]:
+    for line in lines:
+        yield line
+
+
+async def run(path: str, format: str, chunk_size: int, settings: Settings) -> int:
+    hasher = AsyncHasher.from_settings(settings.hash)
+    repository, close = await connect_repository(settings)
+    importer = UserImporter(repository, hasher, chunk_size=chunk_size)
+    source = sys.stdin if path == "-" else open(path, encoding="utf-8", newline="")
+    try:
+        async for results in importer.import_lines(read_lines(source), format):
+            for result in results:
+                if result.status != CREATED:
+                    print(result.json())
+            stats = importer.stats
+            print(
+                (
+                    f"{stats.rows} rows, {stats.created} created, {stats.conflicts} conflicts,"
+                    f" {stats.invalid} invalid, {stats.rows_per_second:.0f} rows/s"
+                ),
+                file=sys.stderr,
+            )
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        hasher.shutdown()
+        await close()
+    print(json.dumps(importer.stats.as_dict()), file=sys.stderr)
+    return 0
+
+
+def guess_format(path: str) -> Optional[str]:
+    if path.endswith(".csv"):
+        return "csv"
+    if path.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    return None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("path", help="file to import, - for stdin")
+    parser.add_argument(
+        "--format", choices=IMPORT_FORMATS, help="input format, guessed from the file extension"
+    )
+    parser.add_argument("--chunk-size", type=int, help="rows per insert, IMPORT_CHUNK_SIZE")
+    parser.add_argument(
+        "--hash-workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="plaintext passwords hashed in parallel, the CPU count by default",
+    )
+    args = parser.parse_args(argv)
+
+    format = args.format or guess_format(args.path)
+    if format is None:
+        parser.error("--format is required when it can't be guessed from the file extension")
+    settings = Settings()
+    # the whole machine hashes for the import
+    settings.hash.workers = args.hash_workers
+    chunk_size = args.chunk_size or settings.user_import.chunk_size
+    return asyncio.run(run(args.path, format, chunk_size, settings))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
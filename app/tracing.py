@@ -0,0 +1,483 @@
+"""
+Request tracing: a span per request, with child spans around the route handler, the services,
+the queries, the pool checkouts, the hashing and the token work.
+
+The model follows OpenTelemetry, trace and span ids, parent links, attributes and status, and the
+context is propagated with the W3C `traceparent` header, but the exporters are local: in memory
+for the tests, JSON lines in a file otherwise. The sampling is decided once per request, at its
+start: an incoming `traceparent` is followed, the other requests are sampled at the configured
+ratio. When a request isn't sampled no span is created and `span` costs a context variable lookup.
+"""
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from asgi_correlation_id.context import correlation_id
+
+from app.api.routing import RouteTemplates
+from app.config.settings import TracingSettings
+
+TRACEPARENT_HEADER = b"traceparent"
+# version 00: trace id, parent span id, flags, lowercase hex
+TRACEPARENT_PATTERN = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+INVALID_TRACE_ID = "0" * 32
+INVALID_SPAN_ID = "0" * 16
+SAMPLED_FLAG = 0x01
+TRACING_EXPORTERS = ("none", "memory", "file")
+
+STATUS_UNSET = "unset"
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+def parse_traceparent(value: str) -> Optional[Tuple[str, str, bool]]:
+    """
+    Parse a W3C `traceparent` header.
+
+    :param value: The header value.
+
+    :return: The trace id, the parent span id and the sampled flag, None if it isn't valid.
+    """
+    match = TRACEPARENT_PATTERN.match(value.strip())
+    if match is None:
+        return None
+    trace_id, span_id, flags = match.groups()
+    if trace_id == INVALID_TRACE_ID or span_id == INVALID_SPAN_ID:
+        return None
+    return trace_id, span_id, bool(int(flags, 16) & SAMPLED_FLAG)
+
+
+def format_traceparent(trace_id: str, span_id: str, sampled: bool = True) -> str:
+    return f"00-{trace_id}-{span_id}-{SAMPLED_FLAG if sampled else 0:02x}"
+
+
+class Span:
+    """
+    A timed operation of a trace, created by `Tracer.start_trace` or `span`.
+    """
+
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_span_id",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "status",
+        "_trace",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        trace: "_Trace",
+        trace_id: str,
+        parent_span_id: Optional[str],
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_span_id = parent_span_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = dict(attributes) if attributes else {}
+        self.status = STATUS_UNSET
+        self._trace = trace
+
+    @property
+    def traceparent(self) -> str:
+        return format_traceparent(self.trace_id, self.span_id)
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        if self.end_ns is None:
+            return None
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_exception(self, exception: BaseException) -> None:
+        self.status = STATUS_ERROR
+        self.attributes["exception.type"] = type(exception).__name__
+
+    def end(self) -> None:
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self._trace.finish(self)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "name": self.name,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+            "status": self.status,
+        }
+
+
+class _Trace:
+    """
+    The spans of a sampled request, exported together when its root span ends.
+
+    The spans ending later, e.g. of a background task started by the request, are exported
+    on their own.
+    """
+
+    __slots__ = ("exporter", "root", "spans")
+
+    def __init__(self, exporter: "SpanExporter"):
+        self.exporter = exporter
+        self.root: Optional[Span] = None
+        self.spans: List[Span] = []
+
+    def finish(self, span: Span) -> None:
+        if self.root is None or (self.root.end_ns is not None and span is not self.root):
+            self.exporter.export([span])
+            return
+        self.spans.append(span)
+        if span is self.root:
+            spans, self.spans = self.spans, []
+            self.exporter.export(spans)
+
+
+class SpanExporter(ABC):
+    @abstractmethod
+    def export(self, spans: List[Span]) -> None:
+        """
+        Export finished spans, called from the event loop so it must not block.
+
+        :param spans: The spans, the spans of a request are exported together.
+        """
+
+    def shutdown(self) -> None:
+        pass
+
+
+class InMemorySpanExporter(SpanExporter):
+    """
+    Keeps the last `max_spans` finished spans, for the tests and the local debugging.
+    """
+
+    def __init__(self, max_spans: int = 10_000):
+        self.spans: Deque[Span] = deque(maxlen=max_spans)
+
+    def export(self, spans: List[Span]) -> None:
+        self.spans.extend(spans)
+
+    def find(self, name: str) -> List[Span]:
+        return [span for span in self.spans if span.name == name]
+
+    def clear(self) -> None:
+        self.spans.clear()
+
+
+class FileSpanExporter(SpanExporter):
+    """
+    Appends the finished spans to a file, a JSON object per line.
+
+    The spans are serialized and written by a background thread, started by the first export of
+    each process, so the event loop only puts them in a queue. When `max_pending` batches are
+    waiting the next ones are dropped and counted. The spans of a request are appended with a
+    single write, so the workers sharing the file don't interleave their lines.
+    """
+
+    def __init__(self, path: str, max_pending: int = 10_000):
+        self.path = path
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[List[Span]]]" = queue.Queue(max_pending)
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def export(self, spans: List[Span]) -> None:
+        if self._thread is None or self._pid != os.getpid():
+            # a thread doesn't survive a fork, each worker starts its own
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._write, name="span-exporter", daemon=True)
+            self._thread.start()
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += len(spans)
+
+    def _write(self) -> None:
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            while True:
+                spans = self._queue.get()
+                if spans is None:
+                    return
+                lines = "".join(json.dumps(span.as_dict(), default=str) + "\n" for span in spans)
+                os.write(fd, lines.encode())
+        finally:
+            os.close(fd)
+
+    def shutdown(self) -> None:
+        """Write the pending spans and stop the thread."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        if self.dropped:
+            logging.warning("%d spans dropped, the span export queue was full", self.dropped)
+            self.dropped = 0
+
+
+class Tracer:
+    """
+    Starts the traces of the sampled requests and hands their spans to the exporter.
+    """
+
+    def __init__(self, exporter: SpanExporter, sample_ratio: float = 1.0):
+        self.exporter = exporter
+        self.sample_ratio = sample_ratio
+
+    @classmethod
+    def from_settings(cls, settings: TracingSettings) -> Optional["Tracer"]:
+        if settings.exporter not in TRACING_EXPORTERS:
+            raise ValueError(f"Unsupported tracing exporter: {settings.exporter}")
+        if settings.exporter == "none":
+            return None
+        if settings.exporter == "file":
+            exporter: SpanExporter = FileSpanExporter(settings.file_path, settings.max_spans)
+        else:
+            exporter = InMemorySpanExporter(settings.max_spans)
+        return cls(exporter, sample_ratio=settings.sample_ratio)
+
+    def should_sample(self, parent: Optional[Tuple[str, str, bool]]) -> bool:
+        if parent is not None:
+            # the upstream service already decided
+            return parent[2]
+        return self.sample_ratio >= 1.0 or random.random() < self.sample_ratio
+
+    def start_trace(
+        self,
+        name: str,
+        traceparent: Optional[str] = None,
+        attributes: Optional[Dict[str, Any]] = None,
+    ) -> Optional[Span]:
+        """
+        Start the root span of a request, if it's sampled.
+
+        :param name: The span name.
+        :param traceparent: The `traceparent` header of the request, continued if valid.
+        :param attributes: The span attributes.
+
+        :return: The root span, not made current, None if the request isn't sampled.
+        """
+        parent = parse_traceparent(traceparent) if traceparent else None
+        if not self.should_sample(parent):
+            return None
+        trace = _Trace(self.exporter)
+        if parent is not None:
+            root = Span(name, trace, trace_id=parent[0], parent_span_id=parent[1])
+        else:
+            root = Span(
+                name, trace, trace_id=f"{random.getrandbits(128):032x}", parent_span_id=None
+            )
+        if attributes:
+            root.attributes.update(attributes)
+        trace.root = root
+        return root
+
+    def shutdown(self) -> None:
+        self.exporter.shutdown()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+class _ActiveSpan:
+    __slots__ = ("span", "_token")
+
+    def __init__(self, span: Span):
+        self.span = span
+
+    def __enter__(self) -> Span:
+        self._token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        _current_span.reset(self._token)
+        if exc is not None:
+            self.span.record_exception(exc)
+        elif self.span.status == STATUS_UNSET:
+            self.span.status = STATUS_OK
+        self.span.end()
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        return None
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def start_span(name: str, attributes: Optional[Dict[str, Any]] = None) -> Optional[Span]:
+    """
+    Start a child of the current span, without making it current, e.g. to time the enter of
+    a context manager.
+
+    :param name: The span name.
+    :param attributes: The span attributes.
+
+    :return: The span, to end, None if the request isn't traced.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    return Span(name, parent._trace, parent.trace_id, parent.span_id, attributes)
+
+
+def span(name: str, attributes: Optional[Dict[str, Any]] = None):
+    """
+    Context manager running its block in a child span of the current one.
+
+    :param name: The span name.
+    :param attributes: The span attributes.
+
+    :return: The context manager, entering it returns the span, None if the request isn't traced.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return _NOOP_SPAN
+    return _ActiveSpan(Span(name, parent._trace, parent.trace_id, parent.span_id, attributes))
+
+
+def activate(root: Span) -> _ActiveSpan:
+    """Make a root span current for the block, and end it."""
+    return _ActiveSpan(root)
+
+
+def traced(name: str) -> Callable:
+    """
+    Decorator running each call of a function or a coroutine function in a span.
+
+    :param name: The span name.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if _current_span.get() is None:
+                    return await func(*args, **kwargs)
+                with span(name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class TracingMiddleware:
+    """
+    Raw ASGI middleware starting the trace of the sampled requests.
+
+    The root span is named after the method and the route template once the request is routed,
+    and its `traceparent` is sent back in the response headers, so a client can find the trace.
+    """
+
+    def __init__(self, app: Callable, tracer: Tracer, route_templates: RouteTemplates):
+        self.app = app
+        self.tracer = tracer
+        self.route_templates = route_templates
+
+    async def __call__(self, scope: Dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        traceparent = None
+        for name, value in scope["headers"]:
+            if name == TRACEPARENT_HEADER:
+                traceparent = value.decode("latin-1")
+                break
+        root = self.tracer.start_trace(
+            scope["method"],
+            traceparent,
+            {"http.method": scope["method"], "http.target": scope["path"]},
+        )
+        if root is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_traceparent(message: Dict) -> None:
+            if message["type"] == "http.response.start":
+                root.set_attribute("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    root.status = STATUS_ERROR
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (TRACEPARENT_HEADER, root.traceparent.encode()),
+                ]
+            await send(message)
+
+        with activate(root):
+            try:
+                await self.app(scope, receive, send_with_traceparent)
+            finally:
+                route = self.route_templates(scope.get("endpoint"))
+                root.name = f"{scope['method']} {route}"
+                root.set_attribute("http.route", route)
+                # set by the correlation id middleware, inside this one
+                root.set_attribute("request.id", correlation_id.get())
+
+
+def trace_route_handlers(routes: List[Any]) -> None:
+    """
+    Run the handler of each route, its dependencies, endpoint and response serialization,
+    in a `handler <path>` span.
+
+    :param routes: The application routes, wrapped in place.
+    """
+    for route in routes:
+        if hasattr(route, "app") and hasattr(route, "path"):
+            route.app = _traced_handler(route.app, f"handler {route.path}")
+
+
+def _traced_handler(app: Callable, name: str) -> Callable:
+    async def handler(scope: Dict, receive: Callable, send: Callable) -> None:
+        if _current_span.get() is None:
+            await app(scope, receive, send)
+            return
+        with span(name):
+            await app(scope, receive, send)
+
+    return handler
@@ -0,0 +1,81 @@
+"""
+Per-request overhead of the raw ASGI /authz check against /api/v1/login/token/validate.
+
+Drives the application in-process with an in-memory user repository, so the numbers
+measure the request handling and token validation overhead only.
+
+    python -m benchmarks.authz --requests 5000
+    python -m benchmarks.authz --requests 5000 --stateless
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.common import InMemoryUserRepository, summarize
+from app.api.endpoint.authz import AuthzApp
+from app.config.settings import JWTSettings, Settings
+from app.main import create_app
+from app.repository.postgres.user import get_user_repository
+from app.service.auth import ACCESS_TOKEN_TYPE, AuthService
+
+
+async def measure(client: httpx.AsyncClient, path: str, headers: dict, requests: int) -> dict:
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(requests):
+        request_start = time.perf_counter()
+        response = await client.get(path, headers=headers)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - request_start)
+    elapsed = time.perf_counter() - start
+    return {"requests_per_second": round(requests / elapsed), **summarize(latencies)}
+
+
+async def run(requests: int, stateless: bool) -> dict:
+    settings = Settings(jwt=JWTSettings(stateless_validation=stateless))
+    application = create_app(settings)
+    container = application.state.container
+
+    repository = InMemoryUserRepository()
+    user_id = await repository.insert_user(
+        email="bench.user@email.com",
+        password="not-used",
+        first_name="Bench",
+        last_name="User",
+        two_factor_enabled=False,
+    )
+    user = await repository.get_user_by_id(user_id)
+    application.dependency_overrides[get_user_repository] = lambda: repository
+    AuthzApp.get_user_repository = lambda self, container: repository
+
+    auth_service = AuthService(repository, settings, None, jwt_codec=container.jwt_codec)
+    token = auth_service.generate_jwt_token(
+        data={"sub": user_id, "type": ACCESS_TOKEN_TYPE, **auth_service.identity_claims(user)}
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async with httpx.AsyncClient(app=application, base_url="http://bench") as client:
+        # warm up both paths
+        await measure(client, "/api/v1/login/token/validate", headers, 100)
+        await measure(client, "/authz/", headers, 100)
+        return {
+            "validate": await measure(client, "/api/v1/login/token/validate", headers, requests),
+            "authz": await measure(client, "/authz/", headers, requests),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--stateless", action="store_true", help="stateless token validation")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.requests, args.stateless))
+    print(json.dumps({"stateless": args.stateless, **result}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
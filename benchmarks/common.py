@@ -0,0 +1,108 @@
+import math
+import os
+import uuid
+from typing import Dict, List
+
+from pydantic import SecretStr
+
+from app.model.user import User
+from app.repository import UserAlreadyExistsError, UserNotFoundError
+
+# keep the application logs out of the benchmark output
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+class InMemoryUserRepository:
+    """
+    Drop-in replacement of UserRepository used to drive the application in-process
+    without a Postgres instance.
+    """
+
+    def __init__(self):
+        self.users_by_id: Dict[str, User] = {}
+        self.users_by_email: Dict[str, User] = {}
+
+    async def insert_user(
+        self, email: str, password: str, first_name: str, last_name: str, two_factor_enabled: bool
+    ) -> str:
+        return self.add_user(email, password, first_name, last_name, two_factor_enabled)
+
+    def add_user(
+        self, email: str, password: str, first_name: str, last_name: str, two_factor_enabled: bool
+    ) -> str:
+        """Insert a user outside of the event loop, e.g. to seed the repository."""
+        if email in self.users_by_email:
+            raise UserAlreadyExistsError("User already exists")
+        user = User(
+            id=str(uuid.uuid4()),
+            email=email,
+            password=SecretStr(password),
+            first_name=first_name,
+            last_name=last_name,
+            two_factor_enabled=two_factor_enabled,
+        )
+        self.users_by_id[user.id] = user
+        self.users_by_email[user.email] = user
+        return user.id
+
+    async def update_password(self, user_id: str, password: str, previous_password: str) -> bool:
+        user = self.users_by_id.get(user_id)
+        if user is None or user.password.get_secret_value() != previous_password:
+            return False
+        user.password = SecretStr(password)
+        return True
+
+    async def get_user_by_email(self, email: str) -> User:
+        try:
+            return self.users_by_email[email]
+        except KeyError:
+            raise UserNotFoundError("User not found")
+
+    async def get_user_by_id(self, user_id: str) -> User:
+        try:
+            return self.users_by_id[user_id]
+        except KeyError:
+            raise UserNotFoundError("User not found")
+
+    async def get_identity_by_id(self, user_id: str) -> User:
+        return await self.get_user_by_id(user_id)
+
+    async def get_users_by_ids(self, user_ids: List[str]) -> Dict[str, User]:
+        return {
+            user_id: self.users_by_id[user_id]
+            for user_id in user_ids
+            if user_id in self.users_by_id
+        }
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """
+    Nearest-rank percentile of the samples.
+
+    :param samples: The measured values.
+    :param pct: The percentile to compute, between 0 and 100.
+
+    :return: The percentile value, 0 if there are no samples.
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """
+    Summarize latency samples expressed in seconds.
+
+    :param samples: The measured latencies.
+
+    :return: Count and p50/p95/p99/max latencies in milliseconds.
+    """
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "max_ms": round(max(samples, default=0.0) * 1000, 3),
+    }
@@ -0,0 +1,60 @@
+"""
+Per-request dependency-resolution overhead of the auth endpoints.
+
+Compares building Settings and the services on every request, as the application did
+before the dependency container, with resolving them from the application container.
+
+    python -m benchmarks.dependency_overhead --iterations 2000
+"""
+import argparse
+import json
+import timeit
+
+from benchmarks.common import InMemoryUserRepository
+from app.config.settings import Settings
+from app.container import Container
+from app.service.auth import AuthService, get_auth_service
+from app.service.otp import LogOTPSenderService
+
+
+def resolve_per_request(repository: InMemoryUserRepository) -> AuthService:
+    # what `get_auth_service` used to do: re-read the environment and rebuild everything
+    return AuthService(
+        user_repository=repository,
+        app_settings=Settings(),
+        otp_service=LogOTPSenderService(),
+    )
+
+
+def resolve_from_container(repository: InMemoryUserRepository, container: Container):
+    return get_auth_service(user_repository=repository, container=container)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    repository = InMemoryUserRepository()
+    container = Container(Settings())
+
+    before = timeit.timeit(lambda: resolve_per_request(repository), number=args.iterations)
+    after = timeit.timeit(
+        lambda: resolve_from_container(repository, container), number=args.iterations
+    )
+
+    print(
+        json.dumps(
+            {
+                "iterations": args.iterations,
+                "per_request_us": round(before / args.iterations * 1e6, 2),
+                "container_us": round(after / args.iterations * 1e6, 2),
+                "speedup": round(before / after, 1),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Time to import the application module, as measured by `python -X importtime`.
+
+Imports `--module` in `--runs` fresh interpreters and reports the median cumulative import time
+of the module and of its slowest dependencies, so the startup cost of the workers and of the
+command line tools doesn't creep up unnoticed.
+
+    python -m benchmarks.import_time --module app.main --runs 5 --top 10
+"""
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def import_times(module: str) -> Dict[str, int]:
+    """
+    Import a module in a fresh interpreter.
+
+    :param module: The module to import.
+
+    :return: The cumulative import time in microseconds of each module imported.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            times[match.group(4)] = int(match.group(2))
+    return times
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest dependencies to report")
+    args = parser.parse_args()
+
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    medians = {
+        name: statistics.median(run.get(name, 0) for run in runs) for name in set().union(*runs)
+    }
+    slowest = sorted(
+        (name for name in medians if name != args.module), key=medians.get, reverse=True
+    )
+    print(
+        json.dumps(
+            {
+                "module": args.module,
+                "runs": args.runs,
+                "import_ms": round(medians[args.module] / 1000, 1),
+                "slowest_ms": {
+                    name: round(medians[name] / 1000, 1) for name in slowest[: args.top]
+                },
+                "loaded": {
+                    name: name in medians
+                    for name in ("databases", "sqlalchemy", "passlib", "email_validator")
+                },
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Application with an in-memory user repository, served by the multi-worker launcher
+in the benchmarks that need real worker processes.
+
+    python -m app.server --app benchmarks.inmemory_app:app
+
+The users of the load generator are created before the workers are forked, so every worker
+knows them, and every OTP is `OTP`, so the clients can complete the second login step.
+"""
+from typing import Optional
+
+from fastapi import FastAPI
+
+from benchmarks.common import InMemoryUserRepository
+from app.config.settings import OTPSettings, RateLimitSettings, Settings
+from app.hash import PasswordPolicy, get_password_hash
+from app.main import create_app
+from app.repository.postgres.user import get_user_repository
+
+EMAIL = "bench.user@email.com"
+PASSWORD = "bench-password"
+OTP = "777777"
+# a password user and a 2FA user per load generator client, the clients beyond share them
+LOAD_USERS = 64
+
+
+def load_user_email(index: int, two_factor_enabled: bool = False) -> str:
+    kind = "otp" if two_factor_enabled else "password"
+    return f"bench.{kind}.{index % LOAD_USERS}@email.com"
+
+
+def create_inmemory_app(settings: Optional[Settings] = None) -> FastAPI:
+    """
+    Build the application with an in-memory user repository holding the benchmark users.
+
+    :param settings: The application settings, by default read from the environment without
+        the rate limiting, the benchmark clients log in from the same IP and accounts.
+
+    :return: The application.
+    """
+    settings = settings or Settings(rate_limit=RateLimitSettings(enabled=False))
+    # OTP_LENGTH digits picked from ten times the same one
+    settings = settings.copy(update={"otp": OTPSettings(digits=OTP[0] * 10, length=len(OTP))})
+    application = create_app(settings)
+    repository = InMemoryUserRepository()
+    # the same password for all, hashed once
+    password = get_password_hash(PASSWORD, PasswordPolicy.from_settings(settings.hash))
+    repository.add_user(EMAIL, password, "Bench", "User", two_factor_enabled=False)
+    for index in range(LOAD_USERS):
+        for two_factor_enabled in (False, True):
+            email = load_user_email(index, two_factor_enabled)
+            repository.add_user(email, password, "Bench", str(index), two_factor_enabled)
+    application.dependency_overrides[get_user_repository] = lambda: repository
+    return application
+
+
+app = create_inmemory_app()
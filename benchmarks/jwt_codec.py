@@ -0,0 +1,68 @@
+"""
+Encode and decode throughput of the JWT codec compared with python-jose.
+
+    python -m benchmarks.jwt_codec --iterations 20000
+"""
+import argparse
+import json
+import time
+import timeit
+
+from jose import jwk, jwt
+
+from app.jwt_codec import JWTCodec
+
+SECRET = "super-secret-key##"
+ALGORITHM = "HS256"
+
+
+def claims() -> dict:
+    now = int(time.time())
+    return {
+        "sub": "5b0a4b4e-4c1f-4b8e-9d0c-2f6c1d0c7f55",
+        "type": "access_token",
+        "iat": now,
+        "exp": now + 3600,
+    }
+
+
+def ops_per_second(func, iterations: int) -> float:
+    return round(iterations / timeit.timeit(func, number=iterations))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    payload = claims()
+    codec = JWTCodec(ALGORITHM, SECRET)
+    jose_key = jwk.construct(SECRET, algorithm=ALGORITHM)
+    token = codec.encode(payload)
+
+    results = {
+        "iterations": args.iterations,
+        "encode_ops": {
+            "jose": ops_per_second(
+                lambda: jwt.encode(payload, SECRET, algorithm=ALGORITHM), args.iterations
+            ),
+            "jose_prebuilt_key": ops_per_second(
+                lambda: jwt.encode(payload, jose_key, algorithm=ALGORITHM), args.iterations
+            ),
+            "codec": ops_per_second(lambda: codec.encode(payload), args.iterations),
+        },
+        "decode_ops": {
+            "jose": ops_per_second(
+                lambda: jwt.decode(token, SECRET, algorithms=[ALGORITHM]), args.iterations
+            ),
+            "jose_prebuilt_key": ops_per_second(
+                lambda: jwt.decode(token, jose_key, algorithms=[ALGORITHM]), args.iterations
+            ),
+            "codec": ops_per_second(lambda: codec.decode(token), args.iterations),
+        },
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
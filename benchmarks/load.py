@@ -0,0 +1,310 @@
+"""
+Throughput and latency of the register, login, OTP and validate flows under workload profiles.
+
+Drives the in-memory application in-process (no network, no Postgres), or a server at --url
+running `benchmarks.inmemory_app:app`, with --clients concurrent clients each picking its next
+operation from the weights of the profile, and reports the requests per second and the
+p50/p95/p99 latencies of each operation. The `otp` operation is the second login step, its first
+step is reported as `login_2fa`.
+
+    python -m benchmarks.load --profile mixed --duration 10
+    python -m benchmarks.load --profile all --output baseline.json
+    python -m benchmarks.load --profile all --baseline baseline.json
+
+    python -m app.server --app benchmarks.inmemory_app:app --workers 2 &
+    python -m benchmarks.load --url http://127.0.0.1:8000 --profile mixed
+
+With --baseline the results are compared with those saved by a previous run on the same machine,
+a latency or a throughput worse by more than --threshold is reported as a regression and the
+command exits with status 1.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.common import summarize
+from benchmarks.inmemory_app import OTP, PASSWORD, create_inmemory_app, load_user_email
+from app.config.settings import Settings
+
+# operation weights of each workload profile
+PROFILES: Dict[str, Dict[str, int]] = {
+    "register": {"register": 1},
+    "login": {"login": 1},
+    "otp": {"otp": 1},
+    "validate": {"validate": 1},
+    "mixed": {"validate": 90, "login": 8, "register": 2},
+    "mixed-2fa": {"validate": 85, "login": 5, "otp": 8, "register": 2},
+}
+LATENCY_KEYS = ("p50_ms", "p95_ms", "p99_ms")
+# below this difference a latency change is noise, whatever the ratio
+MIN_LATENCY_DELTA_MS = 0.5
+
+
+class Recorder:
+    """
+    Latencies of the successful requests and count of the failed ones, by operation.
+    """
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+
+    async def request(
+        self, operation: str, client: httpx.AsyncClient, method: str, url: str, **kwargs
+    ):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[operation] += 1
+            return None
+        if response.is_success:
+            self.latencies[operation].append(time.perf_counter() - start)
+        else:
+            self.errors[operation] += 1
+        return response
+
+
+class LoadClient:
+    """
+    A client of the load generator, logged in with its own benchmark user.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, index: int):
+        self.client = client
+        self.email = load_user_email(index)
+        self.otp_email = load_user_email(index, two_factor_enabled=True)
+        self.token: Optional[str] = None
+
+    async def setup(self) -> None:
+        response = await self.client.post(
+            "/api/v1/login", json={"email": self.email, "password": PASSWORD}
+        )
+        response.raise_for_status()
+        self.token = response.json()["access_token"]
+
+    async def register(self, recorder: Recorder) -> None:
+        await recorder.request(
+            "register",
+            self.client,
+            "POST",
+            "/api/v1/register",
+            json={
+                "email": f"bench.new.{uuid.uuid4().hex}@email.com",
+                "password": PASSWORD,
+                "first_name": "Bench",
+                "last_name": "New",
+                "two_factor_enabled": False,
+            },
+        )
+
+    async def login(self, recorder: Recorder) -> None:
+        response = await recorder.request(
+            "login",
+            self.client,
+            "POST",
+            "/api/v1/login",
+            json={"email": self.email, "password": PASSWORD},
+        )
+        if response is not None and response.is_success:
+            self.token = response.json()["access_token"]
+
+    async def otp(self, recorder: Recorder) -> None:
+        response = await recorder.request(
+            "login_2fa",
+            self.client,
+            "POST",
+            "/api/v1/login",
+            json={"email": self.otp_email, "password": PASSWORD},
+        )
+        if response is None or not response.is_success:
+            return
+        await recorder.request(
+            "otp",
+            self.client,
+            "POST",
+            "/api/v1/login/otp",
+            json={"otp": OTP},
+            headers={"Authorization": f"Bearer {response.json()['access_token']}"},
+        )
+
+    async def validate(self, recorder: Recorder) -> None:
+        await recorder.request(
+            "validate",
+            self.client,
+            "GET",
+            "/api/v1/login/token/validate",
+            headers={"Authorization": f"Bearer {self.token}"},
+        )
+
+
+async def run_profile(
+    client: httpx.AsyncClient, weights: Dict[str, int], clients: int, duration: float, warmup: float
+) -> Dict:
+    """
+    Run a workload profile.
+
+    :param client: The HTTP client of the application.
+    :param weights: The operation weights of the profile.
+    :param clients: The number of concurrent clients.
+    :param duration: The seconds measured.
+    :param warmup: The seconds run before the measurement, not reported.
+
+    :return: The requests per second, the errors and the latencies of each operation.
+    """
+    load_clients = [LoadClient(client, index) for index in range(clients)]
+    await asyncio.gather(*(load_client.setup() for load_client in load_clients))
+    operations, operation_weights = list(weights), list(weights.values())
+    recorders = [Recorder()]
+    stop = asyncio.Event()
+
+    async def client_loop(load_client: LoadClient) -> None:
+        while not stop.is_set():
+            (operation,) = random.choices(operations, operation_weights)
+            await getattr(load_client, operation)(recorders[-1])
+
+    tasks = [asyncio.create_task(client_loop(load_client)) for load_client in load_clients]
+    await asyncio.sleep(warmup)
+    recorders.append(Recorder())
+    start = time.perf_counter()
+    await asyncio.sleep(duration)
+    stop.set()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    recorder = recorders[-1]
+    results = {}
+    for operation in sorted(set(recorder.latencies) | set(recorder.errors)):
+        latencies = recorder.latencies[operation]
+        results[operation] = {
+            "requests_per_second": round(len(latencies) / elapsed, 1),
+            "errors": recorder.errors[operation],
+            **summarize(latencies),
+        }
+    completed = sum(len(latencies) for latencies in recorder.latencies.values())
+    return {
+        "weights": weights,
+        "requests_per_second": round(completed / elapsed, 1),
+        "errors": sum(recorder.errors.values()),
+        "operations": results,
+    }
+
+
+async def run(
+    profiles: List[str],
+    clients: int,
+    duration: float,
+    warmup: float,
+    url: Optional[str] = None,
+    settings: Optional[Settings] = None,
+) -> Dict:
+    """
+    Run workload profiles against the in-memory application, in-process or served at `url`.
+
+    :param profiles: The names of the profiles.
+    :param clients: The number of concurrent clients.
+    :param duration: The seconds measured for each profile.
+    :param warmup: The seconds run before each measurement.
+    :param url: The server, in-process if not set.
+    :param settings: The settings of the in-process application.
+
+    :return: The results of each profile.
+    """
+    if url is None:
+        transport = {"app": create_inmemory_app(settings), "base_url": "http://bench"}
+    else:
+        transport = {"base_url": url}
+    limits = httpx.Limits(max_connections=clients)
+    results = {}
+    async with httpx.AsyncClient(limits=limits, timeout=30, **transport) as client:
+        for profile in profiles:
+            results[profile] = await run_profile(
+                client, PROFILES[profile], clients, duration, warmup
+            )
+    return {
+        "target": url or "in-process",
+        "clients": clients,
+        "duration": duration,
+        "profiles": results,
+    }
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """
+    Compare results with a baseline, for the profiles and operations of both.
+
+    :param results: The results of `run`.
+    :param baseline: The results of a previous run.
+    :param threshold: The relative change reported, e.g. 0.2 for 20%.
+
+    :return: A description of each regression.
+    """
+    regressions = []
+    for profile, result in results["profiles"].items():
+        baseline_result = baseline.get("profiles", {}).get(profile)
+        if baseline_result is None:
+            continue
+        for operation, stats in result["operations"].items():
+            previous = baseline_result["operations"].get(operation)
+            if not previous or not previous["count"]:
+                continue
+            for key in LATENCY_KEYS:
+                if (
+                    stats[key] > previous[key] * (1 + threshold)
+                    and stats[key] - previous[key] > MIN_LATENCY_DELTA_MS
+                ):
+                    regressions.append(
+                        f"{profile} {operation} {key}: {previous[key]} -> {stats[key]}"
+                    )
+            key = "requests_per_second"
+            if stats[key] < previous[key] * (1 - threshold):
+                regressions.append(f"{profile} {operation} {key}: {previous[key]} -> {stats[key]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--profile",
+        nargs="+",
+        choices=(*PROFILES, "all"),
+        default=["mixed"],
+        help="workload profiles to run",
+    )
+    parser.add_argument("--clients", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per profile")
+    parser.add_argument("--warmup", type=float, default=1.0, help="seconds before measuring")
+    parser.add_argument("--url", help="server running benchmarks.inmemory_app:app")
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results to compare with")
+    parser.add_argument(
+        "--threshold", type=float, default=0.25, help="relative change reported as a regression"
+    )
+    args = parser.parse_args()
+    profiles = list(PROFILES) if "all" in args.profile else args.profile
+
+    results = asyncio.run(run(profiles, args.clients, args.duration, args.warmup, args.url))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline), args.threshold)
+        results["regressions"] = regressions
+    print(json.dumps(results, indent=2))
+    if regressions:
+        print(f"{len(regressions)} regressions against {args.baseline}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
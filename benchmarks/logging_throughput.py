@@ -0,0 +1,112 @@
+"""
+Request throughput with the application logging at INFO and at DEBUG.
+
+Drives logins and token validations in-process (no network, no Postgres) with the logging
+configured like the application, writing to --output instead of stdout, for each level with the
+records written by the queue handler thread and inline on the event loop (LOG_QUEUE_SIZE=0).
+Hashing uses the minimum bcrypt cost, so the logging is a visible share of each request.
+
+    python -m benchmarks.logging_throughput --duration 3
+    python -m benchmarks.logging_throughput --format json --output /tmp/app.log
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging.config
+import os
+import sys
+import time
+
+import httpx
+
+from benchmarks.common import InMemoryUserRepository
+from app.config.settings import HashSettings, RateLimitSettings, Settings
+from app.hash import PasswordPolicy, get_password_hash
+from app.log.logging_conf import get_logging_config, start_log_listener, stop_log_listener
+from app.main import create_app
+from app.repository.postgres.user import get_user_repository
+
+EMAIL = "bench.user@email.com"
+PASSWORD = "bench-password"
+BCRYPT_ROUNDS = 4
+
+
+async def client_loop(client: httpx.AsyncClient, stop: asyncio.Event, counts: list) -> None:
+    credentials = {"email": EMAIL, "password": PASSWORD}
+    while not stop.is_set():
+        response = await client.post("/api/v1/login", json=credentials)
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        response = await client.get("/api/v1/login/token/validate", headers=headers)
+        response.raise_for_status()
+        counts.append(2)
+
+
+async def measure(settings: Settings, clients: int, duration: float) -> float:
+    repository = InMemoryUserRepository()
+    await repository.insert_user(
+        email=EMAIL,
+        password=get_password_hash(PASSWORD, PasswordPolicy(bcrypt_rounds=BCRYPT_ROUNDS)),
+        first_name="Bench",
+        last_name="User",
+        two_factor_enabled=False,
+    )
+    app = create_app(settings)
+    app.dependency_overrides[get_user_repository] = lambda: repository
+
+    # the startup handler isn't run in-process, it would connect to Postgres
+    start_log_listener()
+    try:
+        async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+            stop = asyncio.Event()
+            counts: list = []
+            tasks = [asyncio.create_task(client_loop(client, stop, counts)) for _ in range(clients)]
+            start = time.perf_counter()
+            await asyncio.sleep(duration)
+            stop.set()
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - start
+    finally:
+        stop_log_listener()
+    return sum(counts) / elapsed
+
+
+def run(level: str, queue_size: int, args: argparse.Namespace, output) -> dict:
+    settings = Settings(
+        log_level=level,
+        log_format=args.format,
+        log_queue_size=queue_size,
+        hash=HashSettings(bcrypt_rounds=BCRYPT_ROUNDS),
+        rate_limit=RateLimitSettings(enabled=False),
+    )
+    # the handler writes to sys.stdout as it is when the logging is configured
+    with contextlib.redirect_stdout(output):
+        logging.config.dictConfig(get_logging_config(settings))
+    requests_per_second = asyncio.run(measure(settings, args.clients, args.duration))
+    return {
+        "level": level,
+        "queue": queue_size > 0,
+        "requests_per_second": round(requests_per_second, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds per configuration")
+    parser.add_argument("--format", choices=("text", "json"), default="text")
+    parser.add_argument("--output", default=os.devnull, help="log file, discarded by default")
+    args = parser.parse_args()
+
+    results = []
+    with open(args.output, "a") as output:
+        for level in ("INFO", "DEBUG"):
+            for queue_size in (10_000, 0):
+                results.append(run(level, queue_size, args, output))
+    logging.config.dictConfig({"version": 1, "disable_existing_loggers": False})
+    print(json.dumps({"format": args.format, "results": results}, indent=2), file=sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Requests served with a connection checked out per request against per query.
+
+Drives the application in-process with a simulated pool of `--pool-size` connections,
+each query holding its connection for `--query-ms`, while `--logins` concurrent clients log in
+and `--validations` concurrent clients validate their token against the database.
+The `request` checkout holds the connection for the whole request, password hashing included,
+as the application did before; the `query` checkout is the current one.
+
+    python -m benchmarks.pool_checkout --logins 4 --validations 32 --pool-size 4 --duration 5
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+import httpx
+
+from benchmarks.common import summarize
+from app.config.settings import Settings, UserCacheSettings
+from app.hash import get_password_hash
+from app.main import create_app
+from app.repository.postgres.pool import MeteredDatabase, PoolMetrics
+from app.repository.postgres.user import UserRepository, get_user_repository
+
+EMAIL = "bench.user@email.com"
+PASSWORD = "bench-password"
+
+
+class SimulatedConnection:
+    def __init__(self, rows: dict, query_seconds: float):
+        self.rows = rows
+        self.query_seconds = query_seconds
+
+    async def fetch_one(self, query: str, values: dict):
+        await asyncio.sleep(self.query_seconds)
+        return self.rows.get(values.get("email") or values.get("id"))
+
+
+class SimulatedDatabase:
+    """
+    Stands for a `databases.Database` whose pool has `pool_size` connections.
+    """
+
+    def __init__(self, pool_size: int, rows: dict, query_seconds: float):
+        self.semaphore = asyncio.Semaphore(pool_size)
+        self.rows = rows
+        self.query_seconds = query_seconds
+
+    @asynccontextmanager
+    async def connection(self):
+        async with self.semaphore:
+            yield SimulatedConnection(self.rows, self.query_seconds)
+
+
+async def request_loop(send, stop: asyncio.Event, latencies: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await send()
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(
+    checkout: str, logins: int, validations: int, pool_size: int, query_ms: float, duration: float
+) -> dict:
+    row = {
+        "id": str(uuid.uuid4()),
+        "email": EMAIL,
+        "password": get_password_hash(PASSWORD),
+        "first_name": "Bench",
+        "last_name": "User",
+        "two_factor_enabled": False,
+        "version": 1,
+    }
+    database = SimulatedDatabase(pool_size, {EMAIL: row, row["id"]: row}, query_ms / 1000)
+    metrics = PoolMetrics()
+
+    # every login runs its query
+    application = create_app(Settings(user_cache=UserCacheSettings(enabled=False)))
+    if checkout == "query":
+        repository = UserRepository(db_conn=MeteredDatabase(database, metrics))
+        application.dependency_overrides[get_user_repository] = lambda: repository
+    else:
+
+        async def request_scoped_repository():
+            async with metrics.acquire(database.connection()) as connection:
+                yield UserRepository(db_conn=connection)
+
+        application.dependency_overrides[get_user_repository] = request_scoped_repository
+
+    login_latencies, validate_latencies = [], []
+    async with httpx.AsyncClient(app=application, base_url="http://bench") as client:
+        response = await client.post("/api/v1/login", json={"email": EMAIL, "password": PASSWORD})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        def login():
+            return client.post("/api/v1/login", json={"email": EMAIL, "password": PASSWORD})
+
+        def validate():
+            return client.get("/api/v1/login/token/validate", headers=headers)
+
+        stop = asyncio.Event()
+        tasks = [
+            asyncio.create_task(request_loop(login, stop, login_latencies)) for _ in range(logins)
+        ]
+        tasks += [
+            asyncio.create_task(request_loop(validate, stop, validate_latencies))
+            for _ in range(validations)
+        ]
+        start = time.perf_counter()
+        await asyncio.sleep(duration)
+        stop.set()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+    await application.state.container.shutdown()
+
+    return {
+        "logins_per_second": round(len(login_latencies) / elapsed, 1),
+        "validations_per_second": round(len(validate_latencies) / elapsed, 1),
+        "login": summarize(login_latencies),
+        "validate": summarize(validate_latencies),
+        "pool": metrics.as_dict(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=4, help="concurrent login clients")
+    parser.add_argument(
+        "--validations", type=int, default=32, help="concurrent token validation clients"
+    )
+    parser.add_argument("--pool-size", type=int, default=4, help="simulated pool connections")
+    parser.add_argument("--query-ms", type=float, default=2.0, help="simulated query latency")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds to run each mode")
+    args = parser.parse_args()
+
+    results = {
+        "logins": args.logins,
+        "validations": args.validations,
+        "pool_size": args.pool_size,
+        "query_ms": args.query_ms,
+    }
+    for checkout in ("request", "query"):
+        results[checkout] = asyncio.run(
+            run(
+                checkout,
+                args.logins,
+                args.validations,
+                args.pool_size,
+                args.query_ms,
+                args.duration,
+            )
+        )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
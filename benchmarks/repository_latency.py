@@ -0,0 +1,97 @@
+"""
+Query latency of the user repository backends, `databases` against direct asyncpg.
+
+Unlike the other benchmarks it needs a running Postgres with the `db_schema` DDL applied,
+configured with the usual `DB_*` environment variables (see `make docker-run-local-db`).
+The user cache is disabled, so every call runs a query.
+
+    python -m benchmarks.repository_latency --iterations 5000
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from benchmarks.common import summarize
+from app.config.settings import Settings
+from app.repository import UserAlreadyExistsError
+from app.repository.postgres import create_database
+from app.repository.postgres.asyncpg_user import AsyncpgUserRepository, create_asyncpg_pool
+from app.repository.postgres.user import UserRepository
+
+EMAIL = "bench.repository@email.com"
+
+
+async def measure(call, iterations: int) -> dict:
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await call()
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+
+async def measure_repository(repository: UserRepository, iterations: int) -> dict:
+    try:
+        user_id = await repository.insert_user(
+            email=EMAIL,
+            password="not-used",
+            first_name="Bench",
+            last_name="Repository",
+            two_factor_enabled=False,
+        )
+    except UserAlreadyExistsError:
+        user_id = (await repository.get_user_by_email(EMAIL)).id
+    ids = [user_id] + [str(uuid.uuid4()) for _ in range(9)]
+
+    # warm up the pool connections and their statement caches
+    for _ in range(100):
+        await repository.get_identity_by_id(user_id)
+    return {
+        "get_user_by_email": await measure(lambda: repository.get_user_by_email(EMAIL), iterations),
+        "get_identity_by_id": await measure(
+            lambda: repository.get_identity_by_id(user_id), iterations
+        ),
+        "get_users_by_ids": await measure(lambda: repository.get_users_by_ids(ids), iterations),
+    }
+
+
+async def run(iterations: int) -> dict:
+    settings = Settings().postgres
+    results = {}
+
+    database = create_database(
+        host=settings.host,
+        database=settings.database_name,
+        user=settings.user,
+        password=settings.password,
+        min_size_pool=settings.min_size_pool,
+        max_size_pool=settings.max_size_pool,
+    )
+    await database.connect()
+    try:
+        async with database.connection() as db_conn:
+            results["databases"] = await measure_repository(UserRepository(db_conn), iterations)
+    finally:
+        await database.disconnect()
+
+    pool = await create_asyncpg_pool(settings)
+    try:
+        results["asyncpg"] = await measure_repository(AsyncpgUserRepository(pool), iterations)
+    finally:
+        await pool.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.iterations))
+    print(json.dumps({"iterations": args.iterations, **result}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
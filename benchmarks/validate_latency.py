@@ -0,0 +1,100 @@
+"""
+Latency of /login/token/validate while logins saturate the worker.
+
+Drives the application in-process (no network, no Postgres) and reports the latency
+distribution of the validation endpoint while concurrent logins keep the hasher busy.
+
+    python -m benchmarks.validate_latency --logins 8 --duration 5
+    python -m benchmarks.validate_latency --logins 8 --duration 5 --blocking
+
+`--blocking` runs bcrypt inline on the event loop, as the application did before hashing
+was moved to the worker pool, to compare the two behaviours.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.common import InMemoryUserRepository, summarize
+from app.hash import AsyncHasher, get_password_hash
+from app.main import app
+from app.repository.postgres.user import get_user_repository
+
+EMAIL = "bench.user@email.com"
+PASSWORD = "bench-password"
+
+
+async def _inline_run(self, func, *args):
+    return func(*args)
+
+
+async def login_loop(client: httpx.AsyncClient, stop: asyncio.Event, latencies: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.post("/api/v1/login", json={"email": EMAIL, "password": PASSWORD})
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+
+
+async def validate_loop(client: httpx.AsyncClient, token: str, stop: asyncio.Event, latencies):
+    headers = {"Authorization": f"Bearer {token}"}
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get("/api/v1/login/token/validate", headers=headers)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+        # leave room to the login loops, like independent clients would
+        await asyncio.sleep(0.005)
+
+
+async def run(logins: int, duration: float) -> dict:
+    repository = InMemoryUserRepository()
+    await repository.insert_user(
+        email=EMAIL,
+        password=get_password_hash(PASSWORD),
+        first_name="Bench",
+        last_name="User",
+        two_factor_enabled=False,
+    )
+    app.dependency_overrides[get_user_repository] = lambda: repository
+
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        response = await client.post("/api/v1/login", json={"email": EMAIL, "password": PASSWORD})
+        token = response.json()["access_token"]
+
+        stop = asyncio.Event()
+        login_latencies, validate_latencies = [], []
+        tasks = [
+            asyncio.create_task(login_loop(client, stop, login_latencies)) for _ in range(logins)
+        ]
+        tasks.append(asyncio.create_task(validate_loop(client, token, stop, validate_latencies)))
+        await asyncio.sleep(duration)
+        stop.set()
+        await asyncio.gather(*tasks)
+
+    return {
+        "login": summarize(login_latencies),
+        "validate": summarize(validate_latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=8, help="concurrent login clients")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds to run")
+    parser.add_argument(
+        "--blocking", action="store_true", help="hash on the event loop (previous behaviour)"
+    )
+    args = parser.parse_args()
+
+    if args.blocking:
+        AsyncHasher.run = _inline_run
+
+    result = asyncio.run(run(args.logins, args.duration))
+    print(json.dumps({"blocking": args.blocking, "logins": args.logins, **result}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Logins per second served by the multi-worker launcher against the number of workers.
+
+Starts `python -m app.server` with an in-memory user repository for each worker count,
+and keeps `--clients` concurrent clients logging in for `--duration` seconds.
+
+    python -m benchmarks.worker_throughput --workers 1 2 4 --clients 32 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.common import summarize
+from benchmarks.inmemory_app import EMAIL, PASSWORD
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            (await client.get("/api/v1/healthz")).raise_for_status()
+            return
+        except httpx.HTTPError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+async def login_loop(client: httpx.AsyncClient, stop: asyncio.Event, latencies: list, errors):
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.post("/api/v1/login", json={"email": EMAIL, "password": PASSWORD})
+        if response.status_code == 200:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors.append(response.status_code)
+
+
+async def measure(port: int, clients: int, duration: float) -> dict:
+    limits = httpx.Limits(max_connections=clients)
+    async with httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30
+    ) as client:
+        await wait_ready(client)
+        latencies, errors = [], []
+        stop = asyncio.Event()
+        tasks = [
+            asyncio.create_task(login_loop(client, stop, latencies, errors)) for _ in range(clients)
+        ]
+        start = time.perf_counter()
+        await asyncio.sleep(duration)
+        stop.set()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+    return {
+        "logins_per_second": round(len(latencies) / elapsed, 1),
+        "errors": len(errors),
+        "login": summarize(latencies),
+    }
+
+
+def run(workers: int, clients: int, duration: float) -> dict:
+    port = free_port()
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "app.server",
+            "--app",
+            "benchmarks.inmemory_app:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+        ],
+        env={**os.environ, "LOG_LEVEL": "WARNING"},
+    )
+    try:
+        return asyncio.run(measure(port, clients, duration))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=sorted({1, 2, os.cpu_count() or 1}),
+        help="worker counts to measure",
+    )
+    parser.add_argument("--clients", type=int, default=32, help="concurrent login clients")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run each count")
+    args = parser.parse_args()
+
+    results = {"clients": args.clients, "duration": args.duration, "workers": {}}
+    for workers in args.workers:
+        results["workers"][workers] = run(workers, args.clients, args.duration)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,19 @@
 create extension if not exists "uuid-ossp";
 
-create table users (
+create table if not exists users (
     id uuid not null default uuid_generate_v4(),
     email varchar(254) not null,
     password varchar(255) not null,
     first_name varchar(255) not null,
     last_name varchar(255) not null,
     two_factor_enabled boolean not null default false,
+    -- bumped whenever the tokens issued to the user must be revoked
+    version integer not null default 1,
 
     constraint user_pkey primary key (id),
     constraint user_email_key unique (email)
 );
-create index user_email_idx on users (email);
+create index if not exists user_email_idx on users (email);
+
+-- upgrade of the databases created before the column was added
+alter table users add column if not exists version integer not null default 1;
@@ -0,0 +1,214 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from prometheus_client import REGISTRY
+from pydantic import SecretStr
+
+from app.config.settings import AdmissionSettings, RateLimitSettings, Settings
+from app.hash import HashingQueueFullError, PasswordPolicy, get_password_hash
+from app.main import create_app
+from app.repository import UserNotFoundError
+from app.repository.postgres.user import get_user_repository
+from app.service.auth import AuthService
+
+
+@pytest.fixture
+def application(mocker):
+    application = create_app(
+        Settings(
+            admin_api_key=SecretStr("key"),
+            admission=AdmissionSettings(max_concurrency=1, max_queue_size=1, max_wait_seconds=5),
+        )
+    )
+    application.dependency_overrides[get_user_repository] = lambda: mocker.Mock()
+    return application
+
+
+@pytest.mark.asyncio
+async def test_login_sheds_load_when_queue_full(mocker, application):
+    release = asyncio.Event()
+
+    async def slow_login(self, email, password):
+        await release.wait()
+        return "token"
+
+    mocker.patch.object(AuthService, "authenticate_user", slow_login)
+    credentials = {"email": "john.doe@email.com", "password": "password"}
+
+    async with httpx.AsyncClient(app=application, base_url="http://test") as client:
+        served = [asyncio.create_task(client.post("/api/v1/login", json=credentials))]
+        await asyncio.sleep(0.05)
+        served.append(asyncio.create_task(client.post("/api/v1/login", json=credentials)))
+        await asyncio.sleep(0.05)
+
+        rejected = await client.post("/api/v1/login", json=credentials)
+        expired = await client.post(
+            "/api/v1/register",
+            json={**credentials, "first_name": "John", "last_name": "Doe"},
+            headers={"X-Request-Timeout-Ms": "0"},
+        )
+        # the cheap endpoints don't wait for the admission
+        health = await client.get("/api/v1/healthz")
+        unauthorized = await client.get("/api/v1/admission/stats")
+        stats = await client.get("/api/v1/admission/stats", headers={"X-Admin-Key": "key"})
+
+        release.set()
+        responses = await asyncio.gather(*served)
+
+    assert rejected.status_code == 503
+    assert int(rejected.headers["Retry-After"]) >= 1
+    assert expired.status_code == 503
+    assert health.status_code == 200
+    assert unauthorized.status_code == 401
+    stats = stats.json()["login"]
+    assert stats["active"] == 1
+    assert stats["queued"] == 1
+    assert stats["rejected_queue_full"] == 1
+    assert stats["rejected_deadline"] == 1
+    assert [response.status_code for response in responses] == [200, 200]
+
+
+@pytest.mark.asyncio
+async def test_login_rate_limited_per_ip(mocker):
+    application = create_app(Settings(rate_limit=RateLimitSettings(ip_capacity=2)))
+    repository = mocker.Mock()
+    repository.get_user_by_email = mocker.AsyncMock(side_effect=UserNotFoundError)
+    application.dependency_overrides[get_user_repository] = lambda: repository
+    credentials = {"email": "john.doe@email.com", "password": "password"}
+
+    def logins(outcome):
+        labels = {"step": "password", "outcome": outcome}
+        return REGISTRY.get_sample_value("auth_logins_total", labels) or 0
+
+    invalid, rate_limited = logins("invalid_credentials"), logins("rate_limited")
+
+    async with httpx.AsyncClient(app=application, base_url="http://test") as client:
+        responses = [await client.post("/api/v1/login", json=credentials) for _ in range(3)]
+
+    assert [response.status_code for response in responses] == [401, 401, 429]
+    assert logins("invalid_credentials") == invalid + 2
+    assert logins("rate_limited") == rate_limited + 1
+    assert int(responses[2].headers["Retry-After"]) >= 1
+    assert repository.get_user_by_email.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_register_bulk_requires_admin_key(application):
+    application.state.container.settings.admin_api_key = None
+    async with httpx.AsyncClient(app=application, base_url="http://test") as client:
+        disabled = await client.post(
+            "/api/v1/register/bulk", content=b"", headers={"X-Admin-Key": "key"}
+        )
+        application.state.container.settings.admin_api_key = SecretStr("key")
+        missing = await client.post("/api/v1/register/bulk", content=b"")
+        wrong = await client.post(
+            "/api/v1/register/bulk", content=b"", headers={"X-Admin-Key": "other"}
+        )
+        unsupported = await client.post(
+            "/api/v1/register/bulk",
+            content=b"",
+            headers={"X-Admin-Key": "key", "Content-Type": "application/json"},
+        )
+
+    assert disabled.status_code == 404
+    assert missing.status_code == 401
+    assert wrong.status_code == 401
+    assert unsupported.status_code == 415
+
+
+@pytest.mark.asyncio
+async def test_register_bulk(mocker, application):
+    repository = mocker.Mock()
+    repository.insert_users = mocker.AsyncMock(return_value={"joe@email.com": "1"})
+    application.dependency_overrides[get_user_repository] = lambda: repository
+    hashed = get_password_hash("secret", PasswordPolicy(bcrypt_rounds=4))
+    body = "\n".join(
+        [
+            json.dumps(
+                {
+                    "email": "joe@email.com",
+                    "password_hash": hashed,
+                    "first_name": "Joe",
+                    "last_name": "Doe",
+                }
+            ),
+            json.dumps(
+                {
+                    "email": "ann@email.com",
+                    "password_hash": hashed,
+                    "first_name": "Ann",
+                    "last_name": "Doe",
+                }
+            ),
+            "{broken",
+        ]
+    )
+
+    async with httpx.AsyncClient(app=application, base_url="http://test") as client:
+        response = await client.post(
+            "/api/v1/register/bulk",
+            content=body.encode(),
+            headers={"X-Admin-Key": "key", "Content-Type": "application/x-ndjson"},
+        )
+
+    assert response.status_code == 200
+    result = response.json()
+    assert (result["rows"], result["created"], result["conflicts"], result["invalid"]) == (
+        3,
+        1,
+        1,
+        1,
+    )
+    assert [(row["line"], row["status"]) for row in result["rejected"]] == [
+        (2, "conflict"),
+        (3, "invalid"),
+    ]
+    assert result["rejected_truncated"] is False
+
+
+@pytest.mark.asyncio
+async def test_hashing_unavailable(mocker, application):
+    error = HashingQueueFullError("Hashing queue is full", retry_after_seconds=3)
+    for method in ("register_user", "authenticate_user", "verify_otp"):
+        mocker.patch.object(AuthService, method, side_effect=error)
+    mocker.patch.object(application.state.container.hasher, "get_password_hash", side_effect=error)
+    credentials = {"email": "john.doe@email.com", "password": "password"}
+    row = {**credentials, "first_name": "John", "last_name": "Doe"}
+
+    async with httpx.AsyncClient(app=application, base_url="http://test") as client:
+        responses = [
+            await client.post("/api/v1/register", json=row),
+            await client.post("/api/v1/login", json=credentials),
+            await client.post(
+                "/api/v1/login/otp",
+                json={"otp": "123456"},
+                headers={"Authorization": "Bearer token"},
+            ),
+            await client.post(
+                "/api/v1/register/bulk",
+                content=json.dumps(row).encode(),
+                headers={"X-Admin-Key": "key", "Content-Type": "application/x-ndjson"},
+            ),
+        ]
+
+    assert [response.status_code for response in responses] == [503] * 4
+    assert [response.headers["Retry-After"] for response in responses] == ["3"] * 4
+
+
+@pytest.mark.asyncio
+async def test_register_bulk_rejected_rows_capped(application):
+    application.state.container.settings.user_import.max_rejected = 2
+
+    async with httpx.AsyncClient(app=application, base_url="http://test") as client:
+        response = await client.post(
+            "/api/v1/register/bulk",
+            content=b"{broken\n" * 3,
+            headers={"X-Admin-Key": "key", "Content-Type": "application/x-ndjson"},
+        )
+
+    result = response.json()
+    assert result["invalid"] == 3
+    assert [row["line"] for row in result["rejected"]] == [1, 2]
+    assert result["rejected_truncated"] is True
@@ -0,0 +1,132 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api.endpoint.authz import AuthzApp
+from app.config.settings import JWTSettings, Settings
+from app.jwt_codec import base64url_encode
+from app.main import create_app
+from app.model.user import User
+from app.repository import UserNotFoundError
+from app.service.auth import ACCESS_TOKEN_TYPE, OTP_TOKEN_TYPE, AuthService
+
+
+@pytest.fixture
+def user():
+    return User(
+        id="1",
+        email="john.doe@email.com",
+        password="wonderful_hash",
+        first_name="Jöhn",
+        last_name="Doe",
+        two_factor_enabled=True,
+    )
+
+
+@pytest.fixture
+def user_repository(mocker, user):
+    repository = mocker.Mock()
+    repository.get_identity_by_id = mocker.AsyncMock(return_value=user)
+    mocker.patch.object(AuthzApp, "get_user_repository", return_value=repository)
+    return repository
+
+
+def token(application, **claims) -> str:
+    container = application.state.container
+    auth_service = AuthService(None, container.settings, None, jwt_codec=container.jwt_codec)
+    return auth_service.generate_jwt_token(data=claims)
+
+
+def test_authz_valid_token(user_repository, user):
+    application = create_app(Settings())
+    client = TestClient(application)
+    access_token = token(application, sub="1", type=ACCESS_TOKEN_TYPE)
+
+    response = client.get(
+        "/authz/some/original/path", headers={"Authorization": f"Bearer {access_token}"}
+    )
+
+    assert response.status_code == 200
+    assert response.content == b""
+    assert response.headers["x-auth-user-id"] == "1"
+    assert response.headers["x-auth-user-email"] == "john.doe@email.com"
+    assert response.headers["x-auth-user-first-name"] == "J%C3%B6hn"
+    assert response.headers["x-auth-user-2fa"] == "true"
+    user_repository.get_identity_by_id.assert_called_once_with("1")
+
+
+def test_authz_stateless(user_repository, user):
+    application = create_app(Settings(jwt=JWTSettings(stateless_validation=True)))
+    client = TestClient(application)
+    access_token = token(application, sub="1", type=ACCESS_TOKEN_TYPE, **user.to_claims())
+
+    response = client.post("/authz/", headers={"Authorization": f"Bearer {access_token}"})
+
+    assert response.status_code == 200
+    assert response.headers["x-auth-user-last-name"] == "Doe"
+    user_repository.get_identity_by_id.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "headers",
+    [
+        {},
+        {"Authorization": "Basic dXNlcjpwYXNz"},
+        {"Authorization": "Bearer "},
+        {"Authorization": "Bearer invalid_token"},
+    ],
+)
+def test_authz_unauthorized(user_repository, headers):
+    client = TestClient(create_app(Settings()))
+
+    response = client.get("/authz/", headers=headers)
+
+    assert response.status_code == 401
+    assert response.headers["www-authenticate"] == "Bearer"
+    assert response.content == b""
+
+
+def test_authz_wrong_token_type_or_unknown_user(user_repository):
+    application = create_app(Settings())
+    client = TestClient(application)
+    otp_token = token(application, sub="1", type=OTP_TOKEN_TYPE)
+    access_token = token(application, sub="2", type=ACCESS_TOKEN_TYPE)
+    user_repository.get_identity_by_id.side_effect = UserNotFoundError("User not found")
+
+    for jwt_token in (otp_token, access_token):
+        response = client.get("/authz/", headers={"Authorization": f"Bearer {jwt_token}"})
+        assert response.status_code == 401
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        b'{"alg":"HS256","kid":["a"]}',
+        b'{"alg":"HS256","kid":{}}',
+        pytest.param(b"[" * 5000, id="nested"),
+    ],
+)
+def test_authz_malformed_header(user_repository, header):
+    application = create_app(Settings())
+    client = TestClient(application)
+    access_token = token(application, sub="1", type=ACCESS_TOKEN_TYPE)
+    forged = ".".join([base64url_encode(header).decode(), *access_token.split(".")[1:]])
+
+    response = client.get("/authz/", headers={"Authorization": f"Bearer {forged}"})
+
+    assert response.status_code == 401
+    assert response.content == b""
+    user_repository.get_identity_by_id.assert_not_called()
+
+
+def test_authz_reuses_auth_service(user_repository):
+    application = create_app(Settings())
+    client = TestClient(application)
+    (authz,) = [route.app for route in application.routes if getattr(route, "path", "") == "/authz"]
+    headers = {"Authorization": f"Bearer {token(application, sub='1', type=ACCESS_TOKEN_TYPE)}"}
+
+    assert client.get("/authz/", headers=headers).status_code == 200
+    auth_service = authz._auth_service
+    assert client.get("/authz/", headers=headers).status_code == 200
+
+    assert auth_service is not None
+    assert authz._auth_service is auth_service
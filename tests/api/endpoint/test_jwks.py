@@ -0,0 +1,37 @@
+import pytest
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from cryptography.hazmat.primitives.serialization import Encoding, NoEncryption, PrivateFormat
+from fastapi.testclient import TestClient
+
+from app.config.settings import JWTSettings, Settings
+from app.main import create_app
+
+
+@pytest.fixture
+def client():
+    pem = Ed25519PrivateKey.generate().private_bytes(
+        Encoding.PEM, PrivateFormat.PKCS8, NoEncryption()
+    )
+    settings = Settings(jwt=JWTSettings(crypto_algorithm="EdDSA", private_key=pem.decode()))
+    return TestClient(create_app(settings))
+
+
+def test_jwks(client):
+    response = client.get("/.well-known/jwks.json")
+
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "public, max-age=300"
+    keys = response.json()["keys"]
+    assert len(keys) == 1
+    assert keys[0]["kty"] == "OKP"
+    assert keys[0]["alg"] == "EdDSA"
+
+
+def test_jwks_not_modified(client):
+    etag = client.get("/.well-known/jwks.json").headers["etag"]
+
+    response = client.get("/.well-known/jwks.json", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert response.content == b""
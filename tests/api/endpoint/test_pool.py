@@ -0,0 +1,29 @@
+from fastapi.testclient import TestClient
+from pydantic import SecretStr
+
+from app.config.settings import PostgresSettings, Settings
+from app.main import create_app
+
+
+def test_pool_stats():
+    application = create_app(
+        Settings(admin_api_key=SecretStr("key"), postgres=PostgresSettings(adaptive_pool=True))
+    )
+    client = TestClient(application)
+
+    response = client.get("/api/v1/pool/stats", headers={"X-Admin-Key": "key"})
+
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["primary"]["adaptive"] is True
+    assert stats["primary"]["size"] == stats["primary"]["min_size"]
+    assert stats["primary"]["decisions"] == []
+    assert stats["replicas"] == {}
+
+
+def test_pool_stats_requires_admin_key():
+    client = TestClient(create_app(Settings(admin_api_key=SecretStr("key"))))
+
+    assert client.get("/api/v1/pool/stats").status_code == 401
+    assert client.get("/api/v1/pool/stats", headers={"X-Admin-Key": "other"}).status_code == 401
+    assert TestClient(create_app(Settings())).get("/api/v1/pool/stats").status_code == 404
@@ -0,0 +1,35 @@
+from fastapi.testclient import TestClient
+
+from app.config.settings import Settings
+from app.jwt_codec import base64url_encode
+from app.main import create_app
+from app.model.user import User
+from app.repository.postgres.user import get_user_repository
+from app.service.auth import ACCESS_TOKEN_TYPE, AuthService
+
+
+def test_introspect_malformed_header(mocker):
+    user_repository = mocker.Mock()
+    user = User(
+        id="1",
+        email="john.doe@email.com",
+        password="wonderful_hash",
+        first_name="John",
+        last_name="Doe",
+        two_factor_enabled=False,
+    )
+    user_repository.get_users_by_ids = mocker.AsyncMock(return_value={"1": user})
+    application = create_app(Settings())
+    application.dependency_overrides[get_user_repository] = lambda: user_repository
+    container = application.state.container
+    auth_service = AuthService(None, container.settings, None, jwt_codec=container.jwt_codec)
+    token = auth_service.generate_jwt_token(data={"sub": "1", "type": ACCESS_TOKEN_TYPE})
+    header = base64url_encode(b'{"alg":"HS256","kid":{"a":1}}').decode()
+    forged = ".".join([header, *token.split(".")[1:]])
+
+    response = TestClient(application).post(
+        "/api/v1/tokens/introspect", json={"tokens": [forged, "invalid_token", token]}
+    )
+
+    assert response.status_code == 200
+    assert [result["active"] for result in response.json()["results"]] == [False, False, True]
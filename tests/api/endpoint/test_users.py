@@ -0,0 +1,60 @@
+import json
+
+import httpx
+import pytest
+from pydantic import SecretStr
+
+from app.config.settings import ExportSettings, Settings
+from app.main import create_app
+from app.repository.postgres.user import get_user_repository
+
+USER = {
+    "id": "00000000-0000-0000-0000-000000000001",
+    "email": "joe@email.com",
+    "first_name": "Joe",
+    "last_name": "Doe",
+    "two_factor_enabled": False,
+    "version": 1,
+}
+
+
+@pytest.fixture
+def application(mocker):
+    application = create_app(
+        Settings(admin_api_key=SecretStr("key"), user_export=ExportSettings(page_size=1))
+    )
+    repository = mocker.Mock()
+
+    async def iter_users(after_id=None, page_size=1000, include_password=False):
+        if after_id is None:
+            yield [dict(USER)]
+
+    repository.iter_users = iter_users
+    application.dependency_overrides[get_user_repository] = lambda: repository
+    return application
+
+
+@pytest.mark.asyncio
+async def test_export_users(application):
+    async with httpx.AsyncClient(app=application, base_url="http://test") as client:
+        unauthorized = await client.get("/api/v1/users/export")
+        response = await client.get("/api/v1/users/export", headers={"X-Admin-Key": "key"})
+        cursor = json.loads(response.text.splitlines()[-1])["cursor"]
+        resumed = await client.get(
+            "/api/v1/users/export", params={"cursor": cursor}, headers={"X-Admin-Key": "key"}
+        )
+        invalid = await client.get(
+            "/api/v1/users/export", params={"cursor": "nope"}, headers={"X-Admin-Key": "key"}
+        )
+        csv = await client.get(
+            "/api/v1/users/export", params={"format": "csv"}, headers={"X-Admin-Key": "key"}
+        )
+
+    assert unauthorized.status_code == 401
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert json.loads(response.text.splitlines()[0]) == USER
+    assert resumed.text == ""
+    assert invalid.status_code == 400
+    assert csv.headers["content-type"].startswith("text/csv")
+    assert csv.text.splitlines()[1] == f"{USER['id']},joe@email.com,Joe,Doe,False,1"
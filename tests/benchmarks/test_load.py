@@ -0,0 +1,68 @@
+import copy
+
+import pytest
+
+from app.config.settings import HashSettings, RateLimitSettings, Settings
+
+with pytest.MonkeyPatch.context() as monkeypatch:
+    # benchmarks.common defaults LOG_LEVEL for the benchmarks, keep it out of the other tests
+    monkeypatch.setenv("LOG_LEVEL", "WARNING")
+    from benchmarks.load import compare, run
+
+
+def operation(rps=100.0, p50=1.0, p95=2.0, p99=3.0):
+    return {
+        "requests_per_second": rps,
+        "errors": 0,
+        "count": 100,
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "p99_ms": p99,
+        "max_ms": p99,
+    }
+
+
+@pytest.mark.asyncio
+async def test_run_mixed_2fa_profile():
+    results = await run(
+        ["mixed-2fa"],
+        clients=2,
+        duration=0.3,
+        warmup=0,
+        # the clients log in from the same IP
+        settings=Settings(
+            hash=HashSettings(bcrypt_rounds=4), rate_limit=RateLimitSettings(enabled=False)
+        ),
+    )
+
+    result = results["profiles"]["mixed-2fa"]
+    assert result["errors"] == 0
+    assert result["requests_per_second"] > 0
+    assert "validate" in result["operations"]
+    # each OTP step follows a password step
+    if "otp" in result["operations"]:
+        assert result["operations"]["login_2fa"]["count"] >= result["operations"]["otp"]["count"]
+
+
+def test_compare():
+    baseline = {"profiles": {"mixed": {"operations": {"login": operation(p50=20, p99=40)}}}}
+    results = copy.deepcopy(baseline)
+
+    assert compare(results, baseline, threshold=0.2) == []
+
+    login = results["profiles"]["mixed"]["operations"]["login"]
+    login.update(p99_ms=60, requests_per_second=50.0)
+    assert compare(results, baseline, threshold=0.2) == [
+        "mixed login p99_ms: 40 -> 60",
+        "mixed login requests_per_second: 100.0 -> 50.0",
+    ]
+
+
+def test_compare_ignores_small_latency_changes():
+    baseline = {"profiles": {"validate": {"operations": {"validate": operation(p50=0.2)}}}}
+    results = copy.deepcopy(baseline)
+    results["profiles"]["validate"]["operations"]["validate"]["p50_ms"] = 0.4
+    # unknown profiles aren't compared
+    results["profiles"]["login"] = {"operations": {"login": operation()}}
+
+    assert compare(results, baseline, threshold=0.2) == []
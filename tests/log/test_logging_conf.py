@@ -0,0 +1,134 @@
+import io
+import json
+import logging
+import threading
+
+import pytest
+
+from app.config.settings import Settings
+from app.log.logging_conf import (
+    EndpointFilter,
+    JsonFormatter,
+    QueueLoggingHandler,
+    get_logging_config,
+)
+
+
+class CountingRecord(logging.LogRecord):
+    merged = 0
+
+    def getMessage(self):
+        self.merged += 1
+        return super().getMessage()
+
+
+def make_record(msg, *args, exc_info=None):
+    return CountingRecord("test", logging.INFO, __file__, 1, msg, args, exc_info)
+
+
+class ThreadFormatter(logging.Formatter):
+    # the thread formatting the record, not the one logging it
+    def format(self, record):
+        return f"{threading.current_thread().name} {super().format(record)}"
+
+
+@pytest.fixture
+def stream():
+    return io.StringIO()
+
+
+@pytest.fixture
+def handler(stream):
+    handler = QueueLoggingHandler(stream)
+    handler.setFormatter(ThreadFormatter())
+    yield handler
+    handler.close()
+
+
+def test_endpoint_filter_merges_message_once():
+    endpoint_filter = EndpointFilter()
+    health = make_record('"GET %s HTTP/1.1" 200', "/api/v1/healthz")
+    login = make_record('"POST %s HTTP/1.1" 200', "/api/v1/login")
+
+    assert not endpoint_filter.filter(health)
+    assert endpoint_filter.filter(login)
+    assert login.merged == 1
+
+
+def test_json_formatter():
+    try:
+        raise ValueError("boom")
+    except ValueError as e:
+        record = make_record("Login of %s failed", "john", exc_info=(type(e), e, e.__traceback__))
+    record.correlation_id = "abc"
+
+    entry = json.loads(JsonFormatter().format(record))
+
+    assert entry["message"] == "Login of john failed"
+    assert entry["level"] == "INFO"
+    assert entry["correlation_id"] == "abc"
+    assert entry["timestamp"].endswith("Z")
+    assert "ValueError: boom" in entry["exception"]
+
+
+def test_queue_handler_writes_inline_until_started(handler, stream):
+    handler.handle(make_record("before start"))
+
+    assert stream.getvalue() == f"{threading.current_thread().name} before start\n"
+
+
+def test_queue_handler_writes_from_listener_thread(handler, stream):
+    handler.start()
+    claims = {"sub": "1"}
+    record = make_record("payload %s", claims)
+    handler.handle(record)
+    # merged when logged, the listener doesn't see the later changes
+    claims["sub"] = "2"
+    handler.stop()
+
+    thread_name, _, message = stream.getvalue().rstrip("\n").rpartition(" payload ")
+    assert message == "{'sub': '1'}"
+    assert thread_name != threading.current_thread().name
+
+
+def test_queue_handler_drops_when_full(stream):
+    handler = QueueLoggingHandler(stream, queue_size=1)
+    writing, release = threading.Event(), threading.Event()
+    target_handle = handler.target.handle
+
+    def slow_handle(record):
+        writing.set()
+        release.wait()
+        return target_handle(record)
+
+    handler.target.handle = slow_handle
+    handler.start()
+    handler.handle(make_record("first"))
+    writing.wait(1)
+    handler.handle(make_record("queued"))
+    handler.handle(make_record("dropped"))
+    release.set()
+    handler.stop()
+
+    lines = stream.getvalue().splitlines()
+    assert lines[:2] == ["first", "queued"]
+    assert lines[2] == "1 log records dropped, the logging queue was full"
+
+
+def test_queue_handler_inline_after_fork(mocker, handler, stream):
+    handler.start()
+    # a forked child has no listener thread
+    mocker.patch("app.log.logging_conf.os.getpid", return_value=-1)
+
+    assert not handler.started
+    handler.handle(make_record("in the child"))
+    assert stream.getvalue() == f"{threading.current_thread().name} in the child\n"
+
+
+def test_logging_config():
+    config = get_logging_config(Settings(log_format="json", log_queue_size=0))
+
+    assert config["handlers"]["console"]["class"] == "logging.StreamHandler"
+    assert config["handlers"]["console"]["formatter"] == "json_formatter"
+    assert get_logging_config(Settings())["handlers"]["console"]["()"] is QueueLoggingHandler
+    assert config["loggers"]["root"]["level"] == "INFO"
@@ -0,0 +1,106 @@
+import pytest
+from asyncpg import Pool, UniqueViolationError
+
+from app.repository import UserAlreadyExistsError, UserNotFoundError
+from app.repository.cache import TTLCache
+from app.repository.postgres import asyncpg_user_query
+from app.repository.postgres.asyncpg_user import AsyncpgUserRepository
+
+
+@pytest.fixture
+def pool(mocker):
+    return mocker.AsyncMock(spec=Pool)
+
+
+@pytest.fixture
+def user_repository(pool):
+    return AsyncpgUserRepository(pool, cache=TTLCache(max_size=10, ttl_seconds=60))
+
+
+@pytest.mark.asyncio
+async def test_insert_user_success(create_user_request, pool, user_repository):
+    pool.fetchval.return_value = "1"
+
+    user_id = await user_repository.insert_user(**create_user_request)
+
+    assert user_id == "1"
+    pool.fetchval.assert_called_once_with(
+        asyncpg_user_query.insert_user,
+        "john.doe@email.com",
+        "password",
+        "John",
+        "Doe",
+        False,
+    )
+
+
+@pytest.mark.asyncio
+async def test_insert_user_already_exists(create_user_request, pool, user_repository):
+    pool.fetchval.side_effect = UniqueViolationError("duplicate key")
+
+    with pytest.raises(UserAlreadyExistsError):
+        await user_repository.insert_user(**create_user_request)
+
+
+@pytest.mark.asyncio
+async def test_get_user_by_email(create_user_request, pool, user_repository):
+    pool.fetchrow.return_value = dict(**create_user_request, id="1", version=1)
+
+    user = await user_repository.get_user_by_email("john.doe@email.com")
+    await user_repository.get_user_by_email("john.doe@email.com")
+
+    assert user.id == "1"
+    assert user.password.get_secret_value() == "password"
+    pool.fetchrow.assert_called_once_with(
+        asyncpg_user_query.get_user_by_email, "john.doe@email.com"
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_identity_by_id(create_user_request, pool, user_repository):
+    pool.fetchrow.return_value = dict(**create_user_request, id="1", version=2)
+
+    identity = await user_repository.get_identity_by_id("1")
+
+    assert identity.version == 2
+    assert not hasattr(identity, "password")
+    pool.fetchrow.assert_called_once_with(asyncpg_user_query.get_identity_by_id, "1")
+
+
+@pytest.mark.asyncio
+async def test_get_identity_by_id_not_found(pool, user_repository):
+    pool.fetchrow.return_value = None
+
+    with pytest.raises(UserNotFoundError):
+        await user_repository.get_identity_by_id("1")
+
+
+@pytest.mark.asyncio
+async def test_get_users_by_ids(create_user_request, pool, user_repository):
+    known_id = "5b0a4b4e-4c1f-4b8e-9d0c-2f6c1d0c7f55"
+    pool.fetch.return_value = [dict(**create_user_request, id=known_id, version=1)]
+
+    users = await user_repository.get_users_by_ids([known_id, "not-a-uuid"])
+
+    assert set(users) == {known_id}
+    pool.fetch.assert_called_once_with(asyncpg_user_query.get_identities_by_ids, [known_id])
+
+
+@pytest.mark.asyncio
+async def test_insert_users_copy(mocker, create_user_request, pool, user_repository):
+    connection = mocker.AsyncMock()
+    connection.transaction = mocker.MagicMock()
+    connection.fetch.return_value = [{"id": "1", "email": "john.doe@email.com"}]
+    pool.acquire = mocker.MagicMock()
+    pool.acquire.return_value.__aenter__.return_value = connection
+
+    inserted = await user_repository.insert_users([create_user_request])
+
+    assert inserted == {"john.doe@email.com": "1"}
+    connection.execute.assert_called_once_with(asyncpg_user_query.create_import_table)
+    connection.copy_records_to_table.assert_called_once_with(
+        "users_import",
+        records=[("john.doe@email.com", "password", "John", "Doe", False)],
+        columns=asyncpg_user_query.import_columns,
+    )
+    connection.fetch.assert_called_once_with(asyncpg_user_query.insert_imported_users)
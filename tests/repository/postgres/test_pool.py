@@ -0,0 +1,184 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from app.repository.postgres.pool import (
+    MeteredAsyncpgPool,
+    MeteredDatabase,
+    PoolManager,
+    PoolMetrics,
+)
+from app.repository.postgres.user import UserRepository
+
+
+class FakePool:
+    """
+    Pool of `size` connections answering every query with the same row.
+    """
+
+    def __init__(self, mocker, size: int, row=None):
+        self.semaphore = asyncio.Semaphore(size)
+        self.connection = mocker.AsyncMock()
+        self.connection.fetch_one.return_value = row
+        self.connection.fetchrow.return_value = row
+
+    @asynccontextmanager
+    async def acquire(self):
+        async with self.semaphore:
+            yield self.connection
+
+
+@pytest.mark.asyncio
+async def test_pool_metrics_records_waits(mocker):
+    pool = FakePool(mocker, size=1)
+    metrics = PoolMetrics()
+    release = asyncio.Event()
+
+    async def hold():
+        async with metrics.acquire(pool.acquire()):
+            await release.wait()
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(hold())
+    await asyncio.sleep(0.01)
+
+    assert metrics.in_use == 1
+    assert metrics.waiting == 1
+
+    release.set()
+    await asyncio.gather(holder, waiter)
+
+    stats = metrics.as_dict()
+    assert stats["acquisitions"] == 2
+    assert stats["in_use"] == 0
+    assert stats["waiting"] == 0
+    assert stats["max_in_use"] == 1
+    assert stats["max_waiting"] == 1
+    assert stats["max_wait_ms"] >= 10
+
+
+@pytest.mark.asyncio
+async def test_pool_metrics_failed_checkout(mocker):
+    metrics = PoolMetrics()
+    checkout = mocker.AsyncMock()
+    checkout.__aenter__.side_effect = ConnectionError
+
+    with pytest.raises(ConnectionError):
+        async with metrics.acquire(checkout):
+            pass
+
+    assert metrics.waiting == 0
+    assert metrics.acquisitions == 0
+
+
+@pytest.mark.asyncio
+async def test_metered_database_releases_connection_per_query(mocker, create_user_request):
+    pool = FakePool(mocker, size=1, row=dict(**create_user_request, id="1", version=1))
+    database = mocker.Mock()
+    database.connection.side_effect = pool.acquire
+    metrics = PoolMetrics()
+    repository = UserRepository(db_conn=MeteredDatabase(database, metrics))
+
+    # a single connection serves concurrent lookups, none holds it after its query
+    users = await asyncio.gather(*(repository.get_user_by_email("a@b.c") for _ in range(5)))
+
+    assert all(user.id == "1" for user in users)
+    assert metrics.acquisitions == 5
+    assert metrics.in_use == 0
+
+
+@pytest.mark.asyncio
+async def test_metered_asyncpg_pool(mocker):
+    pool = FakePool(mocker, size=2, row={"id": "1"})
+    metrics = PoolMetrics()
+
+    row = await MeteredAsyncpgPool(pool, metrics).fetchrow("select $1", "1")
+
+    assert row == {"id": "1"}
+    pool.connection.fetchrow.assert_called_once_with("select $1", "1")
+    assert metrics.acquisitions == 1
+
+
+@pytest.mark.asyncio
+async def test_pool_manager_limits_checkouts(mocker):
+    pool = FakePool(mocker, size=10)
+    manager = PoolManager(min_size=2, max_size=8, adaptive=True)
+    release = asyncio.Event()
+
+    async def hold():
+        async with manager.acquire(pool.acquire()):
+            await release.wait()
+
+    tasks = [asyncio.create_task(hold()) for _ in range(3)]
+    await asyncio.sleep(0.01)
+
+    assert manager.in_use == 2
+    assert manager.waiting == 1
+
+    decision = await manager.adjust()
+    await asyncio.sleep(0)
+
+    assert decision is None
+    release.set()
+    await asyncio.gather(*tasks)
+    assert manager.acquisitions == 3
+
+
+@pytest.mark.asyncio
+async def test_pool_manager_grows_on_waits_and_shrinks_when_idle(mocker):
+    manager = PoolManager(min_size=2, max_size=8, adaptive=True, target_wait_ms=5)
+    for _ in range(10):
+        manager._record_wait(0.02)
+
+    decision = await manager.adjust()
+
+    assert (decision.action, decision.from_size, decision.to_size) == ("grow", 2, 4)
+    assert manager.size == 4
+
+    decision = await manager.adjust()
+
+    assert (decision.action, decision.from_size, decision.to_size) == ("shrink", 4, 3)
+    assert [d["action"] for d in manager.stats()["decisions"]] == ["grow", "shrink"]
+
+
+@pytest.mark.asyncio
+async def test_pool_manager_not_adaptive(mocker):
+    manager = PoolManager(min_size=2, max_size=8)
+    for _ in range(10):
+        manager._record_wait(0.02)
+
+    assert await manager.adjust() is None
+    assert manager.stats()["size"] == 8
+
+
+def test_pool_metrics_window_only_kept_for_adaptive_manager():
+    metrics = PoolMetrics(window=8)
+    manager = PoolManager(min_size=2, max_size=8)
+    adaptive = PoolManager(min_size=2, max_size=8, adaptive=True)
+    for _ in range(100):
+        for pool_metrics in (metrics, manager, adaptive):
+            pool_metrics._record_wait(0.001)
+
+    assert metrics._window_waits == [] and manager._window_waits == []
+    assert metrics.as_dict()["acquisitions"] == 100
+    assert len(adaptive.take_window()[0]) == 100
+
+
+@pytest.mark.asyncio
+async def test_pool_manager_warm_up(mocker):
+    pool = FakePool(mocker, size=4)
+    manager = PoolManager(min_size=3, max_size=4, adaptive=True)
+    opened = mocker.Mock()
+
+    @asynccontextmanager
+    async def checkout():
+        async with pool.acquire() as connection:
+            opened()
+            yield connection
+
+    await manager.warm_up(checkout)
+
+    assert opened.call_count == 3
+    assert manager.stats()["warm_up_ms"] is not None
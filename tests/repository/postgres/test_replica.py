@@ -0,0 +1,104 @@
+import pytest
+from databases.core import Connection
+
+from app.repository.postgres.pool import PoolMetrics
+from app.repository.postgres.replica import Replica, ReplicaRouter
+from app.repository.postgres.user import UserRepository
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def primary(mocker):
+    return mocker.Mock(spec=Connection)
+
+
+@pytest.fixture
+def replicas(mocker):
+    return [
+        Replica(name=name, executor=mocker.Mock(spec=Connection), metrics=PoolMetrics())
+        for name in ("replica-1", "replica-2")
+    ]
+
+
+@pytest.fixture
+def router(primary, replicas, clock):
+    return ReplicaRouter(
+        primary=primary,
+        replicas=replicas,
+        read_your_writes_seconds=5,
+        retry_seconds=10,
+        clock=clock,
+    )
+
+
+def test_select_round_robin(router, replicas):
+    selected = [router.select([("id", "1")]) for _ in range(4)]
+
+    assert selected == [replicas[0], replicas[1], replicas[0], replicas[1]]
+
+
+def test_select_pinned_key_reads_primary(router, clock):
+    router.pin(("id", "1"))
+
+    assert router.select([("id", "1")]) is None
+    assert router.select([("id", "2")]) is not None
+
+    clock.now = 5
+    assert router.select([("id", "1")]) is not None
+
+
+@pytest.mark.asyncio
+async def test_read_unavailable_replica_falls_back_to_primary(router, replicas, primary, clock):
+    replicas[0].executor.fetch_one.side_effect = ConnectionRefusedError
+    primary.fetch_one.return_value = "from_primary"
+
+    result = await router.read([("id", "1")], lambda conn: conn.fetch_one(query="q"))
+
+    assert result == "from_primary"
+    assert router.stats()["replica-1"]["healthy"] is False
+    assert router.stats()["replica-1"]["failures"] == 1
+    # the unhealthy replica is skipped until the retry delay
+    assert router.select([("id", "1")]) is replicas[1]
+    assert router.select([("id", "1")]) is replicas[1]
+    clock.now = 10
+    assert router.select([("id", "1")]) is replicas[0]
+
+
+@pytest.mark.asyncio
+async def test_read_all_replicas_unhealthy(router, replicas, primary, clock):
+    for replica in replicas:
+        replica.unhealthy_until = 10
+
+    assert router.select([("id", "1")]) is None
+
+
+@pytest.mark.asyncio
+async def test_repository_read_your_writes(create_user_request, router, replicas, primary, mocker):
+    repository = UserRepository(db_conn=primary, replicas=router)
+    row = dict(**create_user_request, id="1", version=1)
+    primary.execute.return_value = "1"
+    primary.fetch_one.return_value = row
+    for replica in replicas:
+        replica.executor.fetch_one.return_value = row
+
+    await repository.insert_user(**create_user_request)
+    await repository.get_user_by_email(create_user_request["email"])
+    await repository.get_identity_by_id("1")
+    await repository.get_user_by_id("2")
+
+    # the registered user is read from the primary, the others from the replicas
+    assert primary.fetch_one.call_count == 2
+    replicas[0].executor.fetch_one.assert_called_once()
+    replicas[1].executor.fetch_one.assert_not_called()
@@ -1,9 +1,11 @@
 import pytest
 from asyncpg import UniqueViolationError
+from prometheus_client import REGISTRY
 from databases.core import Connection
 from pydantic import SecretStr
 
 from app.repository import UserAlreadyExistsError, UserNotFoundError
+from app.repository.cache import TTLCache
 from app.repository.postgres.user import UserRepository
 
 
@@ -19,6 +21,11 @@ def user_repository(mocker, db_conn):
     return user_repository
 
 
+@pytest.fixture
+def cached_user_repository(mocker, db_conn):
+    return UserRepository(db_conn=db_conn, cache=TTLCache(max_size=10, ttl_seconds=60))
+
+
 @pytest.mark.asyncio
 async def test_insert_user_success(create_user_request, db_conn, user_repository):
     db_conn.execute.return_value = "1"
@@ -48,7 +55,7 @@ async def test_insert_user_failure(create_user_request, db_conn, user_repository
 
 @pytest.mark.asyncio
 async def test_get_user_by_email_success(create_user_request, db_conn, user_repository):
-    db_conn.fetch_one.return_value = dict(**create_user_request, id="1")
+    db_conn.fetch_one.return_value = dict(**create_user_request, id="1", version=1)
     _input = create_user_request
     user = await user_repository.get_user_by_email(_input["email"])
 
@@ -60,7 +67,7 @@ async def test_get_user_by_email_success(create_user_request, db_conn, user_repo
     assert user.two_factor_enabled == _input["two_factor_enabled"]
     db_conn.fetch_one.assert_called_once_with(
         query="""
-select id, email, password, first_name, last_name, two_factor_enabled
+select id, email, password, first_name, last_name, two_factor_enabled, version
     from users
     where email = :email
 """,
@@ -79,7 +86,7 @@ async def test_get_user_by_email_not_found(create_user_request, db_conn, user_re
 
 @pytest.mark.asyncio
 async def test_get_user_by_id_success(create_user_request, db_conn, user_repository):
-    db_conn.fetch_one.return_value = dict(**create_user_request, id="1")
+    db_conn.fetch_one.return_value = dict(**create_user_request, id="1", version=1)
     _input = create_user_request
 
     user = await user_repository.get_user_by_id("1")
@@ -92,7 +99,7 @@ async def test_get_user_by_id_success(create_user_request, db_conn, user_reposit
     assert user.two_factor_enabled == _input["two_factor_enabled"]
     db_conn.fetch_one.assert_called_once_with(
         query="""
-select id, email, password, first_name, last_name, two_factor_enabled
+select id, email, password, first_name, last_name, two_factor_enabled, version
     from users
     where id = :id
 """,
@@ -106,3 +113,172 @@ async def test_get_user_by_id_not_found(create_user_request, db_conn, user_repos
 
     with pytest.raises(UserNotFoundError):
         await user_repository.get_user_by_id("1")
+
+
+@pytest.mark.asyncio
+async def test_get_user_by_id_cached(create_user_request, db_conn, cached_user_repository):
+    db_conn.fetch_one.return_value = dict(**create_user_request, id="1", version=1)
+
+    first = await cached_user_repository.get_user_by_id("1")
+    second = await cached_user_repository.get_user_by_id("1")
+
+    assert first == second
+    db_conn.fetch_one.assert_called_once()
+    assert cached_user_repository.cache.stats.hits == 1
+
+
+@pytest.mark.asyncio
+async def test_get_user_by_email_not_found_not_cached(
+    create_user_request, db_conn, cached_user_repository
+):
+    db_conn.fetch_one.return_value = None
+
+    for _ in range(2):
+        with pytest.raises(UserNotFoundError):
+            await cached_user_repository.get_user_by_email(create_user_request["email"])
+
+    assert db_conn.fetch_one.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_insert_user_invalidates_cache(create_user_request, db_conn, cached_user_repository):
+    cache = cached_user_repository.cache
+    cache.set(("email", create_user_request["email"]), "stale")
+    cache.set(("id", "1"), "stale")
+    db_conn.execute.return_value = "1"
+
+    await cached_user_repository.insert_user(**create_user_request)
+
+    assert cache.get(("email", create_user_request["email"])) is None
+    assert cache.get(("id", "1")) is None
+
+
+@pytest.mark.asyncio
+async def test_get_users_by_ids(create_user_request, db_conn, cached_user_repository):
+    known_id = "5b0a4b4e-4c1f-4b8e-9d0c-2f6c1d0c7f55"
+    cached_id = "0f5e1a7e-0b64-4bd8-8a0f-9d3b0e6a6c11"
+    missing_id = "2c1d9c4e-6a5b-4b8e-9d0c-7f552f6c1d0c"
+    cached_user_repository.cache.set(("identity", cached_id), "cached_user")
+    db_conn.fetch_all.return_value = [dict(**create_user_request, id=known_id, version=1)]
+
+    users = await cached_user_repository.get_users_by_ids(
+        [known_id, cached_id, missing_id, "not-a-uuid"]
+    )
+
+    assert set(users) == {known_id, cached_id}
+    assert users[cached_id] == "cached_user"
+    assert users[known_id].email == create_user_request["email"]
+    db_conn.fetch_all.assert_called_once_with(
+        query="""
+select id, email, first_name, last_name, two_factor_enabled, version
+    from users
+    where id = any(:ids)
+""",
+        values={"ids": [known_id, missing_id]},
+    )
+    assert cached_user_repository.cache.get(("identity", known_id)) == users[known_id]
+
+
+@pytest.mark.asyncio
+async def test_get_identity_by_id_cached(create_user_request, db_conn, cached_user_repository):
+    db_conn.fetch_one.return_value = dict(**create_user_request, id="1", version=1)
+
+    first = await cached_user_repository.get_identity_by_id("1")
+    second = await cached_user_repository.get_identity_by_id("1")
+
+    assert first is second
+    assert not hasattr(first, "password")
+    db_conn.fetch_one.assert_called_once_with(
+        query="""
+select id, email, first_name, last_name, two_factor_enabled, version
+    from users
+    where id = :id
+""",
+        values={"id": "1"},
+    )
+
+    cached_user_repository.invalidate_user(user_id="1")
+    assert cached_user_repository.cache.get(("identity", "1")) is None
+
+
+@pytest.mark.asyncio
+async def test_update_password_invalidates_cache(
+    create_user_request, db_conn, cached_user_repository
+):
+    cache = cached_user_repository.cache
+    cache.set(("email", create_user_request["email"]), "stale")
+    cache.set(("id", "1"), "stale")
+    db_conn.execute.return_value = create_user_request["email"]
+
+    updated = await cached_user_repository.update_password("1", "new_hash", "old_hash")
+
+    assert updated is True
+    assert cache.get(("email", create_user_request["email"])) is None
+    assert cache.get(("id", "1")) is None
+    db_conn.execute.assert_called_once_with(
+        query="""
+update users set password = :password
+    where id = :id and password = :previous_password
+returning email
+""",
+        values={"id": "1", "password": "new_hash", "previous_password": "old_hash"},
+    )
+
+
+@pytest.mark.asyncio
+async def test_update_password_changed_concurrently(db_conn, user_repository):
+    # the previous hash doesn't match anymore, no row is updated
+    db_conn.execute.return_value = None
+
+    assert await user_repository.update_password("1", "new_hash", "old_hash") is False
+
+
+@pytest.mark.asyncio
+async def test_insert_users(create_user_request, db_conn, cached_user_repository):
+    other = {**create_user_request, "email": "jane.doe@email.com", "two_factor_enabled": True}
+    cached_user_repository.cache.set(("email", "john.doe@email.com"), "stale")
+    # jane already exists
+    db_conn.fetch_all.return_value = [{"id": "1", "email": "john.doe@email.com"}]
+
+    inserted = await cached_user_repository.insert_users([create_user_request, other])
+
+    assert inserted == {"john.doe@email.com": "1"}
+    assert cached_user_repository.cache.get(("email", "john.doe@email.com")) is None
+    values = db_conn.fetch_all.call_args.kwargs["values"]
+    assert values["emails"] == ["john.doe@email.com", "jane.doe@email.com"]
+    assert values["two_factor_enabled"] == [False, True]
+
+
+@pytest.mark.asyncio
+async def test_iter_users_keyset_pages(create_user_request, db_conn, user_repository):
+    rows = [
+        dict(create_user_request, id=f"0000000{i}-0000-0000-0000-000000000000") for i in range(3)
+    ]
+    db_conn.fetch_all.side_effect = [rows[:2], rows[2:]]
+
+    pages = [page async for page in user_repository.iter_users(page_size=2)]
+
+    assert [[user["id"] for user in page] for page in pages] == [
+        [rows[0]["id"], rows[1]["id"]],
+        [rows[2]["id"]],
+    ]
+    # the short page is the last one, no empty query
+    assert [call.kwargs["values"]["after_id"] for call in db_conn.fetch_all.call_args_list] == [
+        "00000000-0000-0000-0000-000000000000",
+        rows[1]["id"],
+    ]
+    assert "password" not in db_conn.fetch_all.call_args.kwargs["query"]
+
+
+@pytest.mark.asyncio
+async def test_get_user_by_id_timed_on_cache_miss_only(
+    create_user_request, db_conn, cached_user_repository
+):
+    db_conn.fetch_one.return_value = dict(**create_user_request, id="1", version=1)
+    labels = {"method": "get_user_by_id"}
+    before = REGISTRY.get_sample_value("auth_db_query_duration_seconds_count", labels)
+
+    await cached_user_repository.get_user_by_id("1")
+    await cached_user_repository.get_user_by_id("1")
+
+    assert REGISTRY.get_sample_value("auth_db_query_duration_seconds_count", labels) == before + 1
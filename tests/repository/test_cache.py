@@ -0,0 +1,162 @@
+import asyncio
+
+import pytest
+
+from app.repository import UserNotFoundError
+from app.repository.cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def cache(clock):
+    return TTLCache(max_size=2, ttl_seconds=10, clock=clock)
+
+
+def test_get_set(cache):
+    assert cache.get("a") is None
+
+    cache.set("a", 1)
+
+    assert cache.get("a") == 1
+    assert cache.stats.hits == 1
+    assert cache.stats.misses == 1
+
+
+def test_ttl_expiration(cache, clock):
+    cache.set("a", 1)
+    clock.now = 10
+
+    assert cache.get("a") is None
+    assert cache.stats.expirations == 1
+    assert len(cache) == 0
+
+
+def test_lru_eviction(cache):
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # touch "a" so that "b" is the least recently used entry
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats.evictions == 1
+
+
+def test_invalidate(cache):
+    cache.set("a", 1)
+
+    cache.invalidate("a")
+
+    assert cache.get("a") is None
+    assert cache.stats.invalidations == 1
+
+
+@pytest.mark.asyncio
+async def test_get_or_load_coalesces_concurrent_misses(cache):
+    calls = 0
+    release = asyncio.Event()
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return "user"
+
+    waiters = [asyncio.create_task(cache.get_or_load("a", loader)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*waiters) == ["user"] * 5
+    assert calls == 1
+    assert cache.stats.coalesced == 4
+    assert await cache.get_or_load("a", loader) == "user"
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_get_or_load_does_not_cache_errors(cache):
+    async def loader():
+        raise UserNotFoundError("User not found")
+
+    waiters = [asyncio.create_task(cache.get_or_load("a", loader)) for _ in range(2)]
+    results = await asyncio.gather(*waiters, return_exceptions=True)
+
+    assert all(isinstance(result, UserNotFoundError) for result in results)
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_invalidate_during_load_discards_value(cache):
+    release = asyncio.Event()
+
+    async def loader():
+        await release.wait()
+        return "stale"
+
+    loading = asyncio.create_task(cache.get_or_load("a", loader))
+    await asyncio.sleep(0)
+    cache.invalidate("a")
+    release.set()
+
+    assert await loading == "stale"
+    assert cache.get("a") is None
+
+
+@pytest.mark.asyncio
+async def test_get_or_load_leader_cancelled(cache):
+    calls = 0
+    release = asyncio.Event()
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return "user"
+
+    leader = asyncio.create_task(cache.get_or_load("a", loader))
+    await asyncio.sleep(0)
+    waiters = [asyncio.create_task(cache.get_or_load("a", loader)) for _ in range(3)]
+    await asyncio.sleep(0)
+    leader.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    # the waiters weren't cancelled, one of them loads the value for the others
+    assert await asyncio.gather(*waiters) == ["user"] * 3
+    assert leader.cancelled()
+    assert calls == 2
+    assert cache.get("a") == "user"
+
+
+@pytest.mark.asyncio
+async def test_get_or_load_waiter_cancelled(cache):
+    release = asyncio.Event()
+
+    async def loader():
+        await release.wait()
+        return "user"
+
+    leader = asyncio.create_task(cache.get_or_load("a", loader))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(cache.get_or_load("a", loader))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await leader == "user"
+    assert waiter.cancelled()
@@ -2,10 +2,21 @@ import json
 
 import pytest
 from fastapi.security import HTTPAuthorizationCredentials
-from jose import jws, jwt
+from pydantic import SecretStr
+from jose import jws
 
-from app.config.settings import Settings
+from app.config.settings import Settings, JWTSettings
+from app.hash import AsyncHasher, PasswordPolicy, get_password_hash
+from app.jwt_codec import TokenError, base64url_encode
 from app.model.user import User
+from app.rate_limit import (
+    EMAIL_SCOPE,
+    OTP_SCOPE,
+    MemoryRateLimitBackend,
+    RateLimit,
+    RateLimiter,
+    RateLimitExceededError,
+)
 from app.repository import UserAlreadyExistsError, UserNotFoundError
 from app.repository.postgres.user import UserRepository
 from app.service import InvalidCredentialsError
@@ -25,6 +36,26 @@ def auth_service(mocker, otp_service):
     return AuthService(UserRepository(None), Settings(), otp_service)
 
 
+@pytest.fixture()
+def stateless_auth_service(mocker, otp_service):
+    mocker.patch("app.repository.postgres.user.UserRepository.__init__", return_value=None)
+    settings = Settings(jwt=JWTSettings(stateless_validation=True))
+    return AuthService(UserRepository(None), settings, otp_service)
+
+
+@pytest.fixture()
+def user():
+    return User(
+        id="1",
+        email="john.doe@email.com",
+        password="wonderful_hash",
+        first_name="John",
+        last_name="Doe",
+        two_factor_enabled=False,
+        version=2,
+    )
+
+
 @pytest.mark.asyncio
 async def test_register_user_success(mocker, create_user_request, auth_service):
     mocker.patch("app.hash.pwd_context.hash", return_value="wonderful_hash")
@@ -139,7 +170,7 @@ async def test_authenticate_user_with_2fa_success(mocker, auth_service, otp_serv
     )
     mocker.patch("app.hash.pwd_context.verify", return_value=True)
     mocker.patch("app.service.auth.AuthService.generate_otp", return_value="001100")
-    mocker.patch("app.hash.otp_context.hash", return_value="123456")
+    otp_hash_mock = mocker.patch("app.hash.otp_context.hash", return_value="123456")
 
     _input = {
         "email": "john.doe@email.com",
@@ -151,7 +182,9 @@ async def test_authenticate_user_with_2fa_success(mocker, auth_service, otp_serv
     payload = json.loads(jws.get_unverified_claims(token))
     assert payload["sub"] == "1"
     assert payload["type"] == OTP_TOKEN_TYPE
-    assert payload["otp"] == "123456"
+    assert "otp" not in payload
+    assert auth_service.otp_binder.verify("1", "001100", payload["otp_nonce"], payload["otp_mac"])
+    otp_hash_mock.assert_not_called()
     otp_service.send_otp.assert_called_once_with("john.doe@email.com", "001100")
 
 
@@ -159,7 +192,7 @@ async def test_authenticate_user_with_2fa_success(mocker, auth_service, otp_serv
 async def test_verify_otp(mocker, auth_service):
     mocker.patch("app.hash.otp_context.verify", return_value=True)
     mocker.patch(
-        "jose.jwt.decode",
+        "app.jwt_codec.JWTCodec.decode",
         return_value={"sub": "1", "type": OTP_TOKEN_TYPE, "otp": "wonderful_hash"},
     )
 
@@ -175,11 +208,51 @@ async def test_verify_otp(mocker, auth_service):
     assert payload["type"] == ACCESS_TOKEN_TYPE
 
 
+@pytest.mark.asyncio
+async def test_verify_otp_hmac_binding(mocker, auth_service):
+    otp_verify_mock = mocker.patch("app.hash.otp_context.verify", return_value=True)
+    otp_nonce, otp_mac = auth_service.otp_binder.bind("1", "123456")
+    mocker.patch(
+        "app.jwt_codec.JWTCodec.decode",
+        return_value={
+            "sub": "1",
+            "type": OTP_TOKEN_TYPE,
+            "otp_nonce": otp_nonce,
+            "otp_mac": otp_mac,
+        },
+    )
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials="valid_token")
+
+    token = await auth_service.verify_otp(credentials=credentials, otp="123456")
+    payload = json.loads(jws.get_unverified_claims(token))
+    assert payload["sub"] == "1"
+    assert payload["type"] == ACCESS_TOKEN_TYPE
+
+    with pytest.raises(InvalidCredentialsError):
+        await auth_service.verify_otp(credentials=credentials, otp="654321")
+
+    otp_verify_mock.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_verify_otp_bcrypt_tokens_disabled(mocker, auth_service):
+    auth_service.app_settings.otp.accept_bcrypt_tokens = False
+    mocker.patch("app.hash.otp_context.verify", return_value=True)
+    mocker.patch(
+        "app.jwt_codec.JWTCodec.decode",
+        return_value={"sub": "1", "type": OTP_TOKEN_TYPE, "otp": "wonderful_hash"},
+    )
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials="valid_token")
+
+    with pytest.raises(InvalidCredentialsError):
+        await auth_service.verify_otp(credentials=credentials, otp="123456")
+
+
 @pytest.mark.asyncio
 async def test_verify_otp_invalid(mocker, auth_service):
     mocker.patch("app.hash.otp_context.verify", return_value=False)
     mocker.patch(
-        "jose.jwt.decode",
+        "app.jwt_codec.JWTCodec.decode",
         return_value={"sub": "1", "type": OTP_TOKEN_TYPE, "otp": "wonderful_hash"},
     )
 
@@ -192,7 +265,7 @@ async def test_verify_otp_invalid(mocker, auth_service):
         await auth_service.verify_otp(**_input)
 
     mocker.patch(
-        "jose.jwt.decode",
+        "app.jwt_codec.JWTCodec.decode",
         return_value={"sub": "1", "type": ACCESS_TOKEN_TYPE, "otp": "wonderful_hash"},
     )
 
@@ -200,7 +273,7 @@ async def test_verify_otp_invalid(mocker, auth_service):
         await auth_service.verify_otp(**_input)
 
     mocker.patch(
-        "jose.jwt.decode",
+        "app.jwt_codec.JWTCodec.decode",
         return_value={"sub": "1", "type": OTP_TOKEN_TYPE, "otp": "wonderful_hash"},
     )
     mocker.patch("app.hash.otp_context.verify", return_value=True)
@@ -214,7 +287,7 @@ async def test_verify_otp_invalid(mocker, auth_service):
     with pytest.raises(InvalidCredentialsError):
         await auth_service.verify_otp(**_input)
 
-    mocker.patch("jose.jwt.decode", side_effect=jwt.JWTError)
+    mocker.patch("app.jwt_codec.JWTCodec.decode", side_effect=TokenError)
 
     _input = {
         "credentials": HTTPAuthorizationCredentials(scheme="Bearer", credentials="valid_token"),
@@ -235,18 +308,20 @@ async def test_verify_jwt_token_success(mocker, auth_service):
         last_name="Doe",
         two_factor_enabled=True,
     )
-    get_user_by_id_mock = mocker.patch(
-        "app.repository.postgres.user.UserRepository.get_user_by_id",
+    get_identity_by_id_mock = mocker.patch(
+        "app.repository.postgres.user.UserRepository.get_identity_by_id",
         return_value=_expected_user,
     )
-    mocker.patch("jose.jwt.decode", return_value={"sub": "1", "type": ACCESS_TOKEN_TYPE})
+    mocker.patch(
+        "app.jwt_codec.JWTCodec.decode", return_value={"sub": "1", "type": ACCESS_TOKEN_TYPE}
+    )
 
     _input = {
         "credentials": HTTPAuthorizationCredentials(scheme="Bearer", credentials="valid_token"),
     }
 
     user = await auth_service.verify_jwt_token(**_input)
-    get_user_by_id_mock.assert_called_once_with("1")
+    get_identity_by_id_mock.assert_called_once_with("1")
     assert user == _expected_user
 
 
@@ -260,7 +335,7 @@ async def test_verify_jwt_token_invalid(mocker, auth_service):
         last_name="Doe",
         two_factor_enabled=True,
     )
-    mocker.patch("jose.jwt.decode", return_value={"sub": "1", "type": OTP_TOKEN_TYPE})
+    mocker.patch("app.jwt_codec.JWTCodec.decode", return_value={"sub": "1", "type": OTP_TOKEN_TYPE})
 
     _input = {
         "credentials": HTTPAuthorizationCredentials(scheme="Bearer", credentials="invalid_token"),
@@ -270,10 +345,12 @@ async def test_verify_jwt_token_invalid(mocker, auth_service):
         await auth_service.verify_jwt_token(**_input)
 
     _ = mocker.patch(
-        "app.repository.postgres.user.UserRepository.get_user_by_id",
+        "app.repository.postgres.user.UserRepository.get_identity_by_id",
         side_effect=InvalidCredentialsError,
     )
-    mocker.patch("jose.jwt.decode", return_value={"sub": "1", "type": ACCESS_TOKEN_TYPE})
+    mocker.patch(
+        "app.jwt_codec.JWTCodec.decode", return_value={"sub": "1", "type": ACCESS_TOKEN_TYPE}
+    )
 
     with pytest.raises(InvalidCredentialsError):
         await auth_service.verify_jwt_token(**_input)
@@ -287,7 +364,7 @@ async def test_verify_jwt_token_invalid(mocker, auth_service):
     with pytest.raises(InvalidCredentialsError):
         await auth_service.verify_jwt_token(**_input)
 
-    mocker.patch("jose.jwt.decode", side_effect=jwt.JWTError)
+    mocker.patch("app.jwt_codec.JWTCodec.decode", side_effect=TokenError)
     _input = {
         "credentials": HTTPAuthorizationCredentials(scheme="Bearer", credentials="invalid_token"),
     }
@@ -295,9 +372,12 @@ async def test_verify_jwt_token_invalid(mocker, auth_service):
     with pytest.raises(InvalidCredentialsError):
         await auth_service.verify_jwt_token(**_input)
 
-    mocker.patch("jose.jwt.decode", return_value={"sub": "1", "type": ACCESS_TOKEN_TYPE})
     mocker.patch(
-        "app.repository.postgres.user.UserRepository.get_user_by_id", side_effect=UserNotFoundError
+        "app.jwt_codec.JWTCodec.decode", return_value={"sub": "1", "type": ACCESS_TOKEN_TYPE}
+    )
+    mocker.patch(
+        "app.repository.postgres.user.UserRepository.get_identity_by_id",
+        side_effect=UserNotFoundError,
     )
     _input = {
         "credentials": HTTPAuthorizationCredentials(scheme="Bearer", credentials="valid_token"),
@@ -312,3 +392,209 @@ def test_generate_otp(auth_service):
     assert otp is not None
     assert len(otp) == 6
     assert otp.isdigit()
+
+
+@pytest.mark.asyncio
+async def test_authenticate_user_stateless_claims(mocker, stateless_auth_service, user):
+    mocker.patch("app.repository.postgres.user.UserRepository.get_user_by_email", return_value=user)
+    mocker.patch("app.hash.pwd_context.verify", return_value=True)
+
+    token = await stateless_auth_service.authenticate_user(
+        email="john.doe@email.com", password="password"
+    )
+    payload = json.loads(jws.get_unverified_claims(token))
+    assert payload["sub"] == "1"
+    assert payload["email"] == "john.doe@email.com"
+    assert payload["given_name"] == "John"
+    assert payload["family_name"] == "Doe"
+    assert payload["2fa"] is False
+    assert payload["ver"] == 2
+
+
+@pytest.mark.asyncio
+async def test_verify_jwt_token_stateless(mocker, stateless_auth_service, user):
+    get_identity_by_id_mock = mocker.patch(
+        "app.repository.postgres.user.UserRepository.get_identity_by_id", return_value=user
+    )
+    token = stateless_auth_service.generate_jwt_token(
+        data={"sub": user.id, "type": ACCESS_TOKEN_TYPE, **user.to_claims()}
+    )
+
+    identity = await stateless_auth_service.verify_jwt_token(
+        HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    )
+
+    get_identity_by_id_mock.assert_not_called()
+    assert identity.id == user.id
+    assert identity.email == user.email
+    assert identity.first_name == user.first_name
+    assert identity.version == user.version
+
+
+@pytest.mark.asyncio
+async def test_verify_jwt_token_stateless_without_claims(mocker, stateless_auth_service, user):
+    get_identity_by_id_mock = mocker.patch(
+        "app.repository.postgres.user.UserRepository.get_identity_by_id", return_value=user
+    )
+    token = stateless_auth_service.generate_jwt_token(
+        data={"sub": user.id, "type": ACCESS_TOKEN_TYPE}
+    )
+
+    identity = await stateless_auth_service.verify_jwt_token(
+        HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    )
+
+    get_identity_by_id_mock.assert_called_once_with("1")
+    assert identity == user
+
+
+@pytest.mark.asyncio
+async def test_verify_jwt_token_stateless_version_check(mocker, stateless_auth_service, user):
+    stateless_auth_service.app_settings.jwt.user_version_check_seconds = -1
+    get_identity_by_id_mock = mocker.patch(
+        "app.repository.postgres.user.UserRepository.get_identity_by_id", return_value=user
+    )
+    credentials = HTTPAuthorizationCredentials(
+        scheme="Bearer",
+        credentials=stateless_auth_service.generate_jwt_token(
+            data={"sub": user.id, "type": ACCESS_TOKEN_TYPE, **user.to_claims()}
+        ),
+    )
+
+    assert await stateless_auth_service.verify_jwt_token(credentials) == user
+    get_identity_by_id_mock.assert_called_once_with("1")
+
+    # the user version has been bumped after the token was issued
+    get_identity_by_id_mock.return_value = user.copy(update={"version": 3})
+    with pytest.raises(InvalidCredentialsError):
+        await stateless_auth_service.verify_jwt_token(credentials)
+
+
+@pytest.mark.asyncio
+async def test_introspect_tokens(mocker, auth_service, user):
+    other_user = user.copy(update={"id": "2", "email": "jane.doe@email.com"})
+    get_users_by_ids_mock = mocker.patch(
+        "app.repository.postgres.user.UserRepository.get_users_by_ids",
+        return_value={"1": user, "2": other_user},
+    )
+    tokens = [
+        auth_service.generate_jwt_token(data={"sub": "1", "type": ACCESS_TOKEN_TYPE}),
+        "invalid_token",
+        auth_service.generate_jwt_token(data={"sub": "2", "type": OTP_TOKEN_TYPE}),
+        auth_service.generate_jwt_token(data={"sub": "2", "type": ACCESS_TOKEN_TYPE}),
+        auth_service.generate_jwt_token(data={"sub": "3", "type": ACCESS_TOKEN_TYPE}),
+        # issued before the user version was bumped
+        auth_service.generate_jwt_token(data={"sub": "1", "type": ACCESS_TOKEN_TYPE, "ver": 1}),
+    ]
+
+    identities = await auth_service.introspect_tokens(tokens)
+
+    assert identities == [user, None, None, other_user, None, None]
+    get_users_by_ids_mock.assert_called_once()
+    assert sorted(get_users_by_ids_mock.call_args.args[0]) == ["1", "2", "3"]
+
+
+@pytest.mark.asyncio
+async def test_introspect_tokens_malformed_header(mocker, auth_service, user):
+    mocker.patch(
+        "app.repository.postgres.user.UserRepository.get_users_by_ids",
+        return_value={"1": user},
+    )
+    token = auth_service.generate_jwt_token(data={"sub": "1", "type": ACCESS_TOKEN_TYPE})
+    header = base64url_encode(b'{"alg":"HS256","kid":["a"]}').decode()
+    forged = ".".join([header, *token.split(".")[1:]])
+
+    identities = await auth_service.introspect_tokens([token, forged])
+
+    assert identities == [user, None]
+
+
+@pytest.mark.asyncio
+async def test_introspect_tokens_stateless(mocker, stateless_auth_service, user):
+    get_users_by_ids_mock = mocker.patch(
+        "app.repository.postgres.user.UserRepository.get_users_by_ids"
+    )
+    token = stateless_auth_service.generate_jwt_token(
+        data={"sub": user.id, "type": ACCESS_TOKEN_TYPE, **user.to_claims()}
+    )
+
+    identities = await stateless_auth_service.introspect_tokens([token, "invalid_token"])
+
+    assert identities[0].id == user.id
+    assert identities[1] is None
+    get_users_by_ids_mock.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_authenticate_user_rate_limited(mocker, auth_service, user):
+    auth_service.rate_limiter = RateLimiter(
+        MemoryRateLimitBackend(max_keys=10), {EMAIL_SCOPE: RateLimit(1, 0.01)}
+    )
+    get_user_by_email_mock = mocker.patch(
+        "app.repository.postgres.user.UserRepository.get_user_by_email",
+        side_effect=UserNotFoundError,
+    )
+    verify_password_mock = mocker.patch("app.hash.pwd_context.verify")
+
+    with pytest.raises(InvalidCredentialsError):
+        await auth_service.authenticate_user("john.doe@email.com", "password")
+    # the email is normalized, the bucket is shared
+    with pytest.raises(RateLimitExceededError):
+        await auth_service.authenticate_user("John.Doe@email.com", "password")
+
+    get_user_by_email_mock.assert_called_once()
+    verify_password_mock.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_verify_otp_rate_limited(mocker, auth_service):
+    auth_service.rate_limiter = RateLimiter(
+        MemoryRateLimitBackend(max_keys=10), {OTP_SCOPE: RateLimit(1, 0.01)}
+    )
+    otp_nonce, otp_mac = auth_service.otp_binder.bind("1", "123456")
+    mocker.patch(
+        "app.jwt_codec.JWTCodec.decode",
+        return_value={
+            "sub": "1",
+            "type": OTP_TOKEN_TYPE,
+            "otp_nonce": otp_nonce,
+            "otp_mac": otp_mac,
+        },
+    )
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials="valid_token")
+
+    with pytest.raises(InvalidCredentialsError):
+        await auth_service.verify_otp(credentials=credentials, otp="000000")
+    with pytest.raises(RateLimitExceededError):
+        await auth_service.verify_otp(credentials=credentials, otp="123456")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("stored_rounds, rehashed", [(4, True), (5, False)])
+async def test_authenticate_user_rehashes_weak_password(
+    mocker, otp_service, user, stored_rounds, rehashed
+):
+    mocker.patch("app.repository.postgres.user.UserRepository.__init__", return_value=None)
+    hasher = AsyncHasher(
+        workers=1, max_queue_size=1, timeout_seconds=5.0, policy=PasswordPolicy(bcrypt_rounds=5)
+    )
+    auth_service = AuthService(UserRepository(None), Settings(), otp_service, hasher=hasher)
+    stored_hash = get_password_hash("password", PasswordPolicy(bcrypt_rounds=stored_rounds))
+    user.password = SecretStr(stored_hash)
+    mocker.patch("app.repository.postgres.user.UserRepository.get_user_by_email", return_value=user)
+    update_password_mock = mocker.patch(
+        "app.repository.postgres.user.UserRepository.update_password", return_value=True
+    )
+    schedule_rehash = mocker.spy(auth_service, "schedule_rehash")
+
+    token = await auth_service.authenticate_user(email="john.doe@email.com", password="password")
+
+    assert token is not None
+    assert schedule_rehash.called is rehashed
+    if rehashed:
+        await schedule_rehash.spy_return
+        user_id, new_hash, previous_hash = update_password_mock.call_args.args
+        assert (user_id, previous_hash) == (user.id, stored_hash)
+        assert new_hash.startswith("$2b$05$")
+    assert update_password_mock.called is rehashed
+    hasher.shutdown()
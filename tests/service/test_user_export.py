@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from app.service.user_export import InvalidCursorError, UserExporter, decode_cursor, encode_cursor
+
+USER_IDS = [f"0000000{i}-0000-0000-0000-000000000000" for i in range(3)]
+
+
+@pytest.fixture
+def user_repository(mocker):
+    users = [
+        {
+            "id": user_id,
+            "email": f"user{i}@email.com",
+            "password": "$2b$04$hash",
+            "first_name": "Joe",
+            "last_name": "Doe",
+            "two_factor_enabled": False,
+            "version": 1,
+        }
+        for i, user_id in enumerate(USER_IDS)
+    ]
+
+    async def iter_users(after_id=None, page_size=1000, include_password=False):
+        remaining = [user for user in users if after_id is None or user["id"] > after_id]
+        for start in range(0, len(remaining), page_size):
+            yield [dict(user) for user in remaining[start : start + page_size]]
+
+    repository = mocker.Mock()
+    repository.iter_users = iter_users
+    return repository
+
+
+async def collect(exporter, format, cursor=None):
+    return b"".join([chunk async for chunk in exporter.export(format, cursor)]).decode()
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(USER_IDS[1])) == USER_IDS[1]
+    for token in ("not-base64!", encode_cursor("not-a-uuid"), "e30"):
+        with pytest.raises(InvalidCursorError):
+            decode_cursor(token)
+
+
+@pytest.mark.asyncio
+async def test_export_ndjson_resumable(user_repository):
+    exporter = UserExporter(user_repository, page_size=2, cursor_lines=True)
+
+    lines = [json.loads(line) for line in (await collect(exporter, "ndjson")).splitlines()]
+
+    assert [line.get("id") or "cursor" for line in lines] == [
+        *USER_IDS[:2],
+        "cursor",
+        USER_IDS[2],
+        "cursor",
+    ]
+    assert "password" not in lines[0] and "password_hash" not in lines[0]
+    assert exporter.exported == 3
+
+    resumed = UserExporter(user_repository, page_size=2)
+    output = await collect(resumed, "ndjson", cursor=lines[2]["cursor"])
+    assert [json.loads(line)["id"] for line in output.splitlines()] == [USER_IDS[2]]
+
+
+@pytest.mark.asyncio
+async def test_export_csv_with_password_hash(user_repository):
+    exporter = UserExporter(user_repository, page_size=2, include_password=True)
+
+    lines = (await collect(exporter, "csv")).splitlines()
+    resumed = (await collect(exporter, "csv", cursor=encode_cursor(USER_IDS[1]))).splitlines()
+
+    assert lines[0] == "id,email,first_name,last_name,two_factor_enabled,version,password_hash"
+    assert lines[1] == f"{USER_IDS[0]},user0@email.com,Joe,Doe,False,1,$2b$04$hash"
+    assert len(lines) == 4
+    # appended to the previous output, without the header
+    assert resumed == [f"{USER_IDS[2]},user2@email.com,Joe,Doe,False,1,$2b$04$hash"]
@@ -0,0 +1,119 @@
+import pytest
+
+from app.hash import AsyncHasher, PasswordPolicy, get_password_hash
+from app.service.user_import import RowParser, UserImporter, iter_lines
+
+
+async def aiter(items):
+    for item in items:
+        yield item
+
+
+async def collect(lines, format, importer):
+    return [
+        result async for chunk in importer.import_lines(aiter(lines), format) for result in chunk
+    ]
+
+
+@pytest.fixture
+def hasher():
+    hasher = AsyncHasher(
+        workers=2, max_queue_size=0, timeout_seconds=5.0, policy=PasswordPolicy(bcrypt_rounds=4)
+    )
+    yield hasher
+    hasher.shutdown()
+
+
+@pytest.fixture
+def user_repository(mocker):
+    repository = mocker.Mock()
+    existing = {"taken@email.com"}
+
+    async def insert_users(users):
+        inserted = {}
+        for user in users:
+            if user["email"] not in existing:
+                existing.add(user["email"])
+                inserted[user["email"]] = str(len(existing))
+        return inserted
+
+    repository.insert_users = mocker.AsyncMock(side_effect=insert_users)
+    return repository
+
+
+@pytest.mark.asyncio
+async def test_iter_lines_split_anywhere():
+    chunks = [b'{"a": 1}\n{"b"', b': "\xc3', b'\xa9"}\r\n', b"last"]
+
+    lines = [line async for line in iter_lines(aiter(chunks))]
+
+    assert lines == ['{"a": 1}', '{"b": "é"}', "last"]
+
+
+def test_row_parser_csv():
+    parser = RowParser("csv")
+
+    assert parser.parse("email,first_name,last_name") is None
+    assert parser.parse('joe@email.com,Joe,"Doe, Jr"') == {
+        "email": "joe@email.com",
+        "first_name": "Joe",
+        "last_name": "Doe, Jr",
+    }
+    with pytest.raises(ValueError):
+        parser.parse("joe@email.com,Joe")
+
+
+def test_row_parser_jsonl():
+    parser = RowParser("jsonl")
+
+    assert parser.parse("") is None
+    assert parser.parse('{"email": "joe@email.com"}') == {"email": "joe@email.com"}
+    # the cursor lines of an export
+    assert parser.parse('{"cursor": "eyJhZnRlciI6IjEifQ"}') is None
+    assert parser.parse('{"cursor": "1", "email": "joe@email.com"}') == {
+        "cursor": "1",
+        "email": "joe@email.com",
+    }
+    with pytest.raises(ValueError):
+        parser.parse("[1, 2]")
+    with pytest.raises(ValueError):
+        parser.parse("{not json")
+
+
+@pytest.mark.asyncio
+async def test_import_reports_rejected_rows(hasher, user_repository):
+    existing_hash = get_password_hash("secret", PasswordPolicy(bcrypt_rounds=4))
+    lines = [
+        "email,password,password_hash,first_name,last_name,two_factor_enabled",
+        "joe@email.com,secret,,Joe,Doe,false",
+        "taken@email.com,secret,,Ann,Doe,true",
+        f"hashed@email.com,,{existing_hash},Bob,Doe,false",
+        "joe@email.com,other,,Joe,Again,false",
+        "not-an-email,secret,,Bad,Row,false",
+        "nopassword@email.com,,,No,Password,false",
+        "plain@email.com,,not-a-hash,Plain,Hash,false",
+        "too,many,columns,here,and,there,again",
+    ]
+    importer = UserImporter(user_repository, hasher, chunk_size=3)
+
+    results = await collect(lines, "csv", importer)
+
+    assert [(r.line, r.status) for r in results] == [
+        (2, "created"),
+        (3, "conflict"),
+        (4, "created"),
+        (5, "conflict"),
+        (6, "invalid"),
+        (7, "invalid"),
+        (8, "invalid"),
+        (9, "invalid"),
+    ]
+    assert importer.stats.as_dict()["created"] == 2
+    assert importer.stats.conflicts == 2
+    assert importer.stats.invalid == 4
+    # a query per chunk of valid rows
+    assert user_repository.insert_users.call_count == 2
+    inserted = user_repository.insert_users.call_args_list[0].args[0]
+    assert inserted[0]["password"].startswith("$2b$04$")
+    assert inserted[2]["password"] == existing_hash
+    assert inserted[1]["two_factor_enabled"] is True
@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+import pytest
+
+from app.admission import AdmissionController, AdmissionDeadlineError, AdmissionQueueFullError
+
+
+async def hold(controller: AdmissionController, release: asyncio.Event, deadline=None):
+    async with controller.admit(deadline):
+        await release.wait()
+
+
+@pytest.mark.asyncio
+async def test_admit_queues_over_concurrency():
+    controller = AdmissionController(max_concurrency=2, max_queue_size=2, max_wait_seconds=1)
+    release = asyncio.Event()
+
+    tasks = [asyncio.create_task(hold(controller, release)) for _ in range(4)]
+    await asyncio.sleep(0.01)
+
+    assert controller.active == 2
+    assert controller.queued == 2
+
+    release.set()
+    await asyncio.gather(*tasks)
+
+    stats = controller.stats()
+    assert stats["active"] == 0
+    assert stats["queued"] == 0
+    assert stats["admitted"] == 4
+    assert stats["max_queued"] == 2
+
+
+@pytest.mark.asyncio
+async def test_admit_rejects_when_queue_full():
+    controller = AdmissionController(max_concurrency=1, max_queue_size=1, max_wait_seconds=1)
+    release = asyncio.Event()
+    tasks = [asyncio.create_task(hold(controller, release)) for _ in range(2)]
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(AdmissionQueueFullError) as e:
+        async with controller.admit():
+            pass
+
+    assert e.value.retry_after_seconds >= 1
+    assert controller.stats()["rejected_queue_full"] == 1
+    release.set()
+    await asyncio.gather(*tasks)
+
+
+@pytest.mark.asyncio
+async def test_admit_drops_queued_requests_past_deadline():
+    controller = AdmissionController(max_concurrency=1, max_queue_size=4, max_wait_seconds=1)
+    release = asyncio.Event()
+    holder = asyncio.create_task(hold(controller, release))
+    await asyncio.sleep(0)
+
+    with pytest.raises(AdmissionDeadlineError):
+        await hold(controller, release, deadline=time.monotonic() + 0.01)
+    with pytest.raises(AdmissionDeadlineError):
+        await hold(controller, release, deadline=time.monotonic() - 1)
+
+    assert controller.queued == 0
+    assert controller.stats()["rejected_deadline"] == 2
+    release.set()
+    await holder
+    assert controller.active == 0
+
+
+@pytest.mark.asyncio
+async def test_admit_cancelled_waiter_passes_the_slot_on():
+    controller = AdmissionController(max_concurrency=1, max_queue_size=4, max_wait_seconds=1)
+    release = asyncio.Event()
+    holder = asyncio.create_task(hold(controller, release))
+    await asyncio.sleep(0)
+    cancelled = asyncio.create_task(hold(controller, release))
+    waiting = asyncio.create_task(hold(controller, release))
+    await asyncio.sleep(0)
+
+    cancelled.cancel()
+    release.set()
+    await asyncio.gather(holder, waiting)
+
+    assert controller.active == 0
+    assert controller.queued == 0
@@ -0,0 +1,69 @@
+import pytest
+
+from app.config.settings import PostgresSettings, Settings, UserCacheSettings
+from app.container import Container
+from app.repository.postgres.asyncpg_user import AsyncpgUserRepository
+from app.repository.postgres.pool import MeteredDatabase
+from app.service.auth import get_auth_service
+from app.service.otp import LogOTPSenderService
+
+
+def test_container_builds_application_scoped_objects():
+    settings = Settings()
+
+    container = Container(settings)
+
+    assert container.settings is settings
+    assert container.hasher.workers == settings.hash.workers
+    assert isinstance(container.otp_service, LogOTPSenderService)
+    # the databases backend checks a connection out per query, metered by the container
+    assert isinstance(container.user_repository.db_conn, MeteredDatabase)
+    assert container.user_repository.db_conn.metrics is container.pool_manager
+
+
+def test_get_auth_service_reuses_container_objects(mocker):
+    container = Container(Settings())
+    user_repository = mocker.Mock()
+
+    first = get_auth_service(user_repository=user_repository, container=container)
+    second = get_auth_service(user_repository=user_repository, container=container)
+
+    assert first is not second
+    assert first.app_settings is second.app_settings is container.settings
+    assert first.hasher is second.hasher is container.hasher
+    assert first.jwt_codec is second.jwt_codec is container.jwt_codec
+
+
+@pytest.mark.asyncio
+async def test_container_asyncpg_backend(mocker):
+    settings = Settings(
+        postgres=PostgresSettings(backend="asyncpg"), user_cache=UserCacheSettings(enabled=True)
+    )
+    pool = mocker.AsyncMock()
+    mocker.patch("app.container.create_asyncpg_pool", return_value=pool)
+    mocker.patch("app.repository.postgres.pool.PoolManager.warm_up")
+    container = Container(settings)
+
+    await container.startup()
+
+    assert isinstance(container.user_repository, AsyncpgUserRepository)
+    assert container.user_repository.pool.pool is pool
+    assert container.user_cache is not None
+    assert container.user_repository.cache is container.user_cache
+
+    await container.shutdown()
+
+    pool.close.assert_awaited_once()
+    assert container.user_repository is None
+
+
+def test_container_read_replicas(monkeypatch):
+    monkeypatch.setenv("DB_REPLICA_HOSTS", "replica-1:5432, replica-2")
+
+    container = Container(Settings(postgres=PostgresSettings()))
+
+    assert [replica.name for replica in container.replica_router.replicas] == [
+        "replica-1:5432",
+        "replica-2",
+    ]
+    assert container.user_repository.replicas is container.replica_router
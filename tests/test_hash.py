@@ -0,0 +1,178 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.config.settings import HashSettings, JWTSettings, OTPSettings
+from app.hash import (
+    AsyncHasher,
+    HashingQueueFullError,
+    HashingTimeoutError,
+    OTPBinder,
+    PasswordPolicy,
+    calibrate_password_policy,
+    get_password_hash,
+    password_needs_rehash,
+    verify_password,
+)
+
+# cheap costs, the tests check the behaviour not the strength
+FAST_BCRYPT = PasswordPolicy(bcrypt_rounds=4)
+FAST_ARGON2 = PasswordPolicy(scheme="argon2", argon2_time_cost=1, argon2_memory_kib=1024)
+
+
+@pytest.fixture
+def hasher():
+    hasher = AsyncHasher(workers=1, max_queue_size=1, timeout_seconds=1.0)
+    yield hasher
+    hasher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_run_off_event_loop(hasher):
+    loop_thread = threading.get_ident()
+
+    worker_thread = await hasher.run(threading.get_ident)
+
+    assert worker_thread != loop_thread
+    assert hasher.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_hash_and_verify_password(mocker, hasher):
+    mocker.patch("app.hash.pwd_context.hash", return_value="wonderful_hash")
+    verify_mock = mocker.patch("app.hash.pwd_context.verify", return_value=True)
+
+    assert await hasher.get_password_hash("password") == "wonderful_hash"
+    assert await hasher.verify_password("password", "wonderful_hash") is True
+    verify_mock.assert_called_once_with("password", "wonderful_hash")
+
+
+@pytest.mark.asyncio
+async def test_run_queue_full(hasher):
+    release = threading.Event()
+    running = [asyncio.create_task(hasher.run(release.wait)) for _ in range(2)]
+    await asyncio.sleep(0)
+
+    with pytest.raises(HashingQueueFullError) as e:
+        await hasher.run(release.wait)
+
+    # the fixture times the jobs out after a second
+    assert e.value.retry_after_seconds == 1
+    release.set()
+    await asyncio.gather(*running)
+    assert hasher.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_run_timeout(hasher):
+    release = threading.Event()
+    hasher.timeout_seconds = 0.01
+
+    with pytest.raises(HashingTimeoutError):
+        await hasher.run(release.wait)
+
+    # the job still holds its worker until it completes, so it counts against the queue bound
+    assert hasher.in_flight == 1
+    hasher.timeout_seconds = 5
+    queued = asyncio.create_task(hasher.run(release.wait))
+    await asyncio.sleep(0)
+    try:
+        with pytest.raises(HashingQueueFullError):
+            await hasher.run(release.wait)
+    finally:
+        release.set()
+    await queued
+    for _ in range(100):
+        if hasher.in_flight == 0:
+            break
+        await asyncio.sleep(0.01)
+    assert hasher.in_flight == 0
+
+
+def test_unsupported_executor():
+    with pytest.raises(ValueError):
+        AsyncHasher(workers=1, max_queue_size=1, timeout_seconds=1.0, executor="fiber")
+
+
+def test_otp_binder_bind_and_verify():
+    binder = OTPBinder(key=b"key")
+
+    nonce, mac = binder.bind("1", "123456")
+
+    assert binder.verify("1", "123456", nonce, mac)
+    assert not binder.verify("1", "654321", nonce, mac)
+    assert not binder.verify("2", "123456", nonce, mac)
+    assert not OTPBinder(key=b"other-key").verify("1", "123456", nonce, mac)
+    assert binder.bind("1", "123456")[0] != nonce
+
+
+def test_otp_binder_from_settings():
+    jwt_settings = JWTSettings(secret_key="secret")
+
+    derived = OTPBinder.from_settings(OTPSettings(), jwt_settings)
+    explicit = OTPBinder.from_settings(
+        OTPSettings(hmac_key="otp-key", hmac_algorithm="sha512"), jwt_settings
+    )
+
+    assert derived.key != b"secret"
+    assert explicit.key == b"otp-key"
+    assert explicit.algorithm == "sha512"
+    with pytest.raises(ValueError):
+        OTPBinder(key=b"key", algorithm="rot13")
+
+
+def test_password_needs_rehash():
+    weak_hash = get_password_hash("password", FAST_BCRYPT)
+
+    assert password_needs_rehash(weak_hash, FAST_BCRYPT) is False
+    assert password_needs_rehash(weak_hash, PasswordPolicy(bcrypt_rounds=5)) is True
+    assert password_needs_rehash(weak_hash, FAST_ARGON2) is True
+    assert password_needs_rehash("not_a_hash", FAST_BCRYPT) is False
+
+
+def test_argon2_policy_verifies_bcrypt_hashes():
+    bcrypt_hash = get_password_hash("password", FAST_BCRYPT)
+    argon2_hash = get_password_hash("password", FAST_ARGON2)
+
+    assert argon2_hash.startswith("$argon2id$")
+    assert verify_password("password", argon2_hash, FAST_ARGON2) is True
+    assert verify_password("password", bcrypt_hash, FAST_ARGON2) is True
+    assert verify_password("wrong", argon2_hash, FAST_ARGON2) is False
+
+
+@pytest.mark.parametrize(
+    "baseline_ms, target_ms, rounds",
+    [(50, 250, 12), (50, 50, 10), (200, 100, 10), (1, 10_000, 16)],
+)
+def test_calibrate_bcrypt_rounds(baseline_ms, target_ms, rounds):
+    measured = []
+
+    def measure(policy):
+        measured.append(policy)
+        return baseline_ms / 1000
+
+    policy = calibrate_password_policy(PasswordPolicy(), target_ms, measure=measure)
+
+    assert policy.bcrypt_rounds == rounds
+    assert measured == [PasswordPolicy(bcrypt_rounds=10)]
+
+
+def test_calibrate_argon2_time_cost():
+    policy = calibrate_password_policy(FAST_ARGON2, 100, measure=lambda policy: 0.02)
+
+    assert policy == PasswordPolicy(scheme="argon2", argon2_time_cost=5, argon2_memory_kib=1024)
+
+
+def test_hasher_from_settings_calibrated(mocker):
+    mocker.patch("app.hash._measure_hash", return_value=0.05)
+
+    hasher = AsyncHasher.from_settings(HashSettings(target_ms=200, bcrypt_rounds=14))
+
+    assert hasher.policy.bcrypt_rounds == 12
+    assert hasher.needs_rehash(get_password_hash("password", FAST_BCRYPT)) is True
+
+
+def test_unsupported_scheme():
+    with pytest.raises(ValueError):
+        AsyncHasher.from_settings(HashSettings(scheme="md5"))
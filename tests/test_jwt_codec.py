@@ -0,0 +1,185 @@
+import time
+
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from cryptography.hazmat.primitives.serialization import (
+    Encoding,
+    NoEncryption,
+    PrivateFormat,
+    PublicFormat,
+)
+from jose import jwt
+
+from app.config.settings import JWTSettings
+from app.jwt_codec import JWTCodec, JWTKey, TokenError, base64url_encode
+
+
+@pytest.fixture
+def claims():
+    return {"sub": "1", "type": "access_token", "exp": int(time.time()) + 60}
+
+
+@pytest.mark.parametrize("algorithm", ["HS256", "HS384", "HS512"])
+def test_decode_jose_tokens(algorithm, claims):
+    token = jwt.encode(claims, "secret", algorithm=algorithm)
+
+    assert JWTCodec(algorithm, "secret").decode(token) == claims
+
+
+@pytest.mark.parametrize("algorithm", ["HS256", "HS384", "HS512"])
+def test_jose_decodes_codec_tokens(algorithm, claims):
+    token = JWTCodec(algorithm, "secret").encode(claims)
+
+    assert jwt.decode(token, "secret", algorithms=[algorithm]) == claims
+    assert jwt.get_unverified_header(token) == {"alg": algorithm, "typ": "JWT"}
+
+
+def test_eddsa_round_trip(claims):
+    private_key = Ed25519PrivateKey.generate()
+    pem = private_key.private_bytes(Encoding.PEM, PrivateFormat.PKCS8, NoEncryption())
+    codec = JWTCodec.from_settings(JWTSettings(crypto_algorithm="EdDSA", private_key=pem.decode()))
+
+    token = codec.encode(claims)
+
+    assert codec.decode(token) == claims
+    with pytest.raises(TokenError):
+        JWTCodec("EdDSA", Ed25519PrivateKey.generate()).decode(token)
+
+
+def test_decode_expired(claims):
+    codec = JWTCodec("HS256", "secret")
+    claims["exp"] = int(time.time()) - 1
+
+    with pytest.raises(TokenError):
+        codec.decode(codec.encode(claims))
+
+
+def test_decode_wrong_key(claims):
+    token = JWTCodec("HS256", "other-secret").encode(claims)
+
+    with pytest.raises(TokenError):
+        JWTCodec("HS256", "secret").decode(token)
+
+
+def test_decode_algorithm_not_allowed(claims):
+    token = jwt.encode(claims, "secret", algorithm="HS512")
+    header = base64url_encode(b'{"alg":"none","typ":"JWT"}').decode()
+    unsigned = ".".join([header, token.split(".")[1], ""])
+
+    with pytest.raises(TokenError):
+        JWTCodec("HS256", "secret").decode(token)
+    with pytest.raises(TokenError):
+        JWTCodec("HS256", "secret").decode(unsigned)
+
+
+@pytest.mark.parametrize("token", ["", "not-a-token", "a.b", "a.b.c", "é.b.c"])
+def test_decode_malformed(token):
+    with pytest.raises(TokenError):
+        JWTCodec("HS256", "secret").decode(token)
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        b'{"alg":"HS256","kid":["a"]}',
+        b'{"alg":"HS256","kid":{}}',
+        b"[]",
+        pytest.param(b"[" * 5000, id="nested"),
+    ],
+)
+def test_decode_invalid_header(claims, header):
+    token = JWTCodec("HS256", "secret").encode(claims)
+    forged = ".".join([base64url_encode(header).decode(), *token.split(".")[1:]])
+
+    with pytest.raises(TokenError):
+        JWTCodec("HS256", "secret").decode(forged)
+
+
+def test_decode_invalid_subject(claims):
+    codec = JWTCodec("HS256", "secret")
+    claims["sub"] = 1
+
+    with pytest.raises(TokenError):
+        codec.decode(codec.encode(claims))
+
+
+def test_unsupported_algorithm():
+    with pytest.raises(ValueError):
+        JWTCodec("none", "secret")
+    with pytest.raises(ValueError):
+        JWTCodec("EdDSA", "secret")
+
+
+def _pem(private_key, public=False) -> bytes:
+    if public:
+        return private_key.public_key().public_bytes(
+            Encoding.PEM, PublicFormat.SubjectPublicKeyInfo
+        )
+    return private_key.private_bytes(Encoding.PEM, PrivateFormat.PKCS8, NoEncryption())
+
+
+@pytest.mark.parametrize(
+    "algorithm, private_key",
+    [
+        ("RS256", rsa.generate_private_key(public_exponent=65537, key_size=2048)),
+        ("ES256", ec.generate_private_key(ec.SECP256R1())),
+    ],
+)
+def test_asymmetric_interchangeable_with_jose(algorithm, private_key, claims):
+    codec = JWTCodec(algorithm, private_key, kid="key-1")
+    public_pem = _pem(private_key, public=True).decode()
+
+    token = codec.encode(claims)
+
+    assert jwt.get_unverified_header(token)["kid"] == "key-1"
+    assert jwt.decode(token, public_pem, algorithms=[algorithm]) == claims
+    jose_token = jwt.encode(
+        claims, _pem(private_key).decode(), algorithm=algorithm, headers={"kid": "key-1"}
+    )
+    assert codec.decode(jose_token) == claims
+
+
+def test_keys_dir_rotation(tmp_path, claims):
+    old_key = ec.generate_private_key(ec.SECP256R1())
+    new_key = Ed25519PrivateKey.generate()
+    # the retired key is kept as a public key to verify the tokens it signed
+    (tmp_path / "2023-01.pem").write_bytes(_pem(old_key, public=True))
+    (tmp_path / "2023-06.pem").write_bytes(_pem(new_key))
+    (tmp_path / "README").write_text("not a key")
+    old_token = JWTCodec("ES256", old_key, kid="2023-01").encode(claims)
+
+    codec = JWTCodec.from_settings(
+        JWTSettings(crypto_algorithm="EdDSA", keys_dir=str(tmp_path), signing_key_id="2023-06")
+    )
+
+    assert jwt.get_unverified_header(codec.encode(claims))["kid"] == "2023-06"
+    assert codec.decode(old_token) == claims
+    assert codec.decode(codec.encode(claims)) == claims
+    with pytest.raises(TokenError):
+        codec.decode(JWTCodec("ES256", old_key, kid="2022-12").encode(claims))
+    with pytest.raises(ValueError):
+        JWTCodec.from_settings(
+            JWTSettings(crypto_algorithm="ES256", keys_dir=str(tmp_path), signing_key_id="2023-01")
+        )
+
+
+def test_jwks(claims):
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    rotated = JWTKey("RS256", rsa.generate_private_key(65537, 2048).public_key(), kid="old")
+    codec = JWTCodec("ES256", private_key, verification_keys=[rotated])
+
+    jwks = codec.jwks()
+
+    assert [key["kid"] for key in jwks["keys"]] == ["old", codec.signing_key.kid]
+    assert jwks["keys"][0]["kty"] == "RSA"
+    assert jwks["keys"][1] == {
+        "kty": "EC",
+        "crv": "P-256",
+        "x": jwks["keys"][1]["x"],
+        "y": jwks["keys"][1]["y"],
+        "kid": codec.signing_key.thumbprint(),
+        "alg": "ES256",
+        "use": "sig",
+    }
+    assert JWTCodec("HS256", "secret").jwks() == {"keys": []}
@@ -0,0 +1,47 @@
+import json
+import os
+import subprocess
+import sys
+
+from app.config.settings import Settings
+from benchmarks.import_time import import_times
+
+# generous, the import takes about half a second on a single core
+IMPORT_TIME_BUDGET_MS = float(os.environ.get("IMPORT_TIME_BUDGET_MS", 2000))
+
+IMPORT_SIDE_EFFECTS = """
+import json, logging, sys
+import app.main
+print(json.dumps({
+    "app_built": app.main._app is not None,
+    "root_handlers": len(logging.getLogger().handlers),
+    "modules": [m for m in ("databases", "sqlalchemy", "passlib") if m in sys.modules],
+}))
+"""
+
+
+def test_import_has_no_side_effects():
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SIDE_EFFECTS], capture_output=True, text=True, check=True
+    )
+    report = json.loads(result.stdout)
+
+    assert report == {"app_built": False, "root_handlers": 0, "modules": []}
+
+
+def test_import_time_budget():
+    times = import_times("app.main")
+
+    assert times["app.main"] / 1000 < IMPORT_TIME_BUDGET_MS
+    assert "databases" not in times
+    assert "passlib.context" not in times
+
+
+def test_settings_read_environment_when_built(monkeypatch):
+    monkeypatch.setenv("DB_HOST", "db.example.com")
+    monkeypatch.setenv("RATE_LIMIT_ENABLED", "false")
+
+    settings = Settings()
+
+    assert settings.postgres.host == "db.example.com"
+    assert settings.rate_limit.enabled is False
@@ -0,0 +1,103 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from app.config.settings import Settings
+from app.jwt_codec import JWTCodec
+from app.main import create_app
+from app.metrics import HASH_SECONDS, timed
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.mark.asyncio
+async def test_timed_observes_failures():
+    histogram = HASH_SECONDS.labels("test_timed")
+
+    async def fail():
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        await timed(histogram, fail())
+
+    assert sample("auth_hash_duration_seconds_count", operation="test_timed") == 1
+
+
+def test_jwt_encode_and_decode_timed():
+    codec = JWTCodec("HS256", "secret")
+    encoded = sample("auth_jwt_duration_seconds_count", operation="encode")
+    decoded = sample("auth_jwt_duration_seconds_count", operation="decode")
+
+    codec.decode(codec.encode({"sub": "1"}))
+
+    assert sample("auth_jwt_duration_seconds_count", operation="encode") == encoded + 1
+    assert sample("auth_jwt_duration_seconds_count", operation="decode") == decoded + 1
+
+
+def test_request_latency_by_route_template():
+    client = TestClient(create_app(Settings()))
+    labels = {"method": "GET", "route": "/api/v1/healthz", "status": "200"}
+    before = sample("auth_http_request_duration_seconds_count", **labels)
+    unmatched = sample(
+        "auth_http_request_duration_seconds_count", method="GET", route="unmatched", status="404"
+    )
+
+    client.get("/api/v1/healthz")
+    client.get("/api/v1/healthz")
+    client.get("/not/a/route")
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "auth_http_request_duration_seconds_bucket" in response.text
+    assert sample("auth_http_request_duration_seconds_count", **labels) == before + 2
+    assert (
+        sample(
+            "auth_http_request_duration_seconds_count",
+            method="GET",
+            route="unmatched",
+            status="404",
+        )
+        == unmatched + 1
+    )
+
+
+def test_metrics_disabled():
+    client = TestClient(create_app(Settings(metrics_enabled=False)))
+
+    assert client.get("/metrics").status_code == 404
+
+
+def test_metrics_summed_across_processes(tmp_path):
+    # prometheus_client reads the directory when imported, so in a fresh interpreter
+    script = textwrap.dedent(
+        """
+        import os
+        from app.metrics import LOGINS, render_metrics
+
+        for _ in range(2):
+            pid = os.fork()
+            if pid == 0:
+                LOGINS.labels("password", "success").inc()
+                os._exit(0)
+            os.waitpid(pid, 0)
+        print(render_metrics()[0].decode())
+        """
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        env={**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)},
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+
+    assert 'auth_logins_total{outcome="success",step="password"} 2.0' in output
@@ -0,0 +1,156 @@
+import time
+
+import httpx
+import pytest
+from pydantic import SecretStr
+
+from app.config.settings import ProfilingSettings, Settings
+from app.main import create_app
+from app.profiling import (
+    TRUNCATED_STACK,
+    SamplingProfiler,
+    sign_profile_token,
+    verify_profile_token,
+)
+
+ADMIN_HEADERS = {"X-Admin-Key": "key"}
+
+
+def burn_cpu(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+@pytest.fixture
+def application():
+    application = create_app(
+        Settings(
+            admin_api_key=SecretStr("key"),
+            profiling=ProfilingSettings(enabled=True, interval_ms=1),
+        )
+    )
+
+    @application.get("/burn/{item}")
+    async def burn(item: str):
+        burn_cpu(0.05)
+        return {"item": item}
+
+    yield application
+    application.state.container.profiler.stop()
+
+
+@pytest.fixture
+def profiler(application):
+    return application.state.container.profiler
+
+
+async def request(application, method, url, **kwargs):
+    async with httpx.AsyncClient(app=application, base_url="http://test") as client:
+        return await client.request(method, url, **kwargs)
+
+
+def test_profile_token():
+    token = sign_profile_token(b"key", 2000)
+
+    assert verify_profile_token(b"key", token, now=1000)
+    assert not verify_profile_token(b"key", token, now=2001)
+    assert not verify_profile_token(b"other", token, now=1000)
+    assert not verify_profile_token(b"key", token.replace("2000", "3000"), now=1000)
+    assert not verify_profile_token(b"key", "garbage", now=1000)
+
+
+def test_disabled_by_default():
+    application = create_app(Settings())
+
+    assert application.state.container.profiler is None
+    assert SamplingProfiler.from_settings(ProfilingSettings()) is None
+
+
+@pytest.mark.asyncio
+async def test_sampled_request_stacks(application, profiler):
+    profiler.sample_ratio = 1.0
+
+    response = await request(application, "GET", "/burn/1")
+    await request(application, "GET", "/burn/2")
+
+    assert response.status_code == 200
+    collapsed = profiler.collapsed()
+    lines = collapsed.splitlines()
+    assert lines and all(line.startswith("GET /burn/{item};") for line in lines)
+    # rooted at the route, the handler then the busy loop
+    assert any("test_profiling:burn_cpu" in line for line in lines)
+    assert sum(int(line.rpartition(" ")[2]) for line in lines) >= 10
+    assert profiler.stats()["routes"]["GET /burn/{item}"]["requests"] == 2
+    assert profiler.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_unsampled_requests_are_not_profiled(application, profiler):
+    await request(application, "GET", "/burn/1")
+
+    assert profiler.collapsed() == ""
+    # no thread until a request is profiled
+    assert profiler._thread is None
+
+
+@pytest.mark.asyncio
+async def test_profile_token_header(application, profiler):
+    response = await request(application, "POST", "/api/v1/profiling/token", headers=ADMIN_HEADERS)
+    token = response.json()
+
+    await request(application, "GET", "/burn/1", headers={token["header"]: token["token"]})
+    await request(application, "GET", "/burn/1", headers={token["header"]: "1.invalid"})
+
+    assert profiler.sample_ratio == 0
+    assert profiler.stats()["routes"]["GET /burn/{item}"]["requests"] == 1
+
+
+def test_max_stacks(profiler):
+    profiler.max_stacks = 1
+    samples = {"a;b": 2, "a;c": 1}
+
+    profiler.end_request(object(), samples, "GET /route")
+
+    assert profiler.collapsed("GET /route") == f"GET /route;a;b 2\nGET /route;{TRUNCATED_STACK} 1\n"
+
+
+@pytest.mark.asyncio
+async def test_profiling_endpoints(application, profiler):
+    response = await request(application, "GET", "/api/v1/profiling")
+    assert response.status_code == 401
+
+    response = await request(
+        application, "PUT", "/api/v1/profiling", json={"sample_ratio": 2}, headers=ADMIN_HEADERS
+    )
+    assert response.status_code == 422
+    response = await request(
+        application, "PUT", "/api/v1/profiling", json={"sample_ratio": 1}, headers=ADMIN_HEADERS
+    )
+    assert response.json()["sample_ratio"] == 1
+
+    await request(application, "GET", "/burn/1")
+    response = await request(
+        application,
+        "GET",
+        "/api/v1/profiling/stacks",
+        params={"route": "GET /burn/{item}"},
+        headers=ADMIN_HEADERS,
+    )
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "test_profiling:burn_cpu" in response.text
+
+    response = await request(
+        application, "DELETE", "/api/v1/profiling/stacks", headers=ADMIN_HEADERS
+    )
+    assert response.status_code == 204
+    assert profiler.collapsed("GET /burn/{item}") == ""
+
+
+@pytest.mark.asyncio
+async def test_profiling_endpoints_disabled():
+    application = create_app(Settings(admin_api_key=SecretStr("key")))
+
+    response = await request(application, "GET", "/api/v1/profiling", headers=ADMIN_HEADERS)
+
+    assert response.status_code == 404
@@ -0,0 +1,118 @@
+import pytest
+from pydantic import ValidationError
+
+from app.config.settings import RateLimitSettings
+from app.rate_limit import (
+    EMAIL_SCOPE,
+    IP_SCOPE,
+    MemoryRateLimitBackend,
+    RateLimit,
+    RateLimiter,
+    RateLimitExceededError,
+    RedisRateLimitBackend,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def backend(clock):
+    return MemoryRateLimitBackend(max_keys=100, clock=clock)
+
+
+@pytest.mark.asyncio
+async def test_memory_bucket_burst_and_refill(backend, clock):
+    limit = RateLimit(capacity=3, refill_per_second=1)
+
+    results = [(await backend.hit("ip:1", limit))[0] for _ in range(4)]
+
+    assert results == [True, True, True, False]
+    # other keys have their own bucket
+    assert (await backend.hit("ip:2", limit))[0] is True
+
+    clock.now = 1.5
+    assert (await backend.hit("ip:1", limit))[0] is True
+    assert (await backend.hit("ip:1", limit))[0] is False
+
+
+@pytest.mark.asyncio
+async def test_memory_buckets_are_bounded(clock):
+    backend = MemoryRateLimitBackend(max_keys=2, clock=clock)
+    limit = RateLimit(capacity=1, refill_per_second=0.1)
+
+    for key in ("a", "b", "c"):
+        await backend.hit(key, limit)
+
+    buckets = backend._buckets[limit]
+    assert len(buckets) == 2
+    assert buckets.stats.evictions == 1
+
+    # idle buckets expire once refilled
+    clock.now = 10
+    assert buckets.get("b") is None
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_rejects_with_retry_after(clock, backend):
+    limiter = RateLimiter(backend, {EMAIL_SCOPE: RateLimit(capacity=1, refill_per_second=0.1)})
+
+    await limiter.hit(EMAIL_SCOPE, "john.doe@email.com")
+    with pytest.raises(RateLimitExceededError) as e:
+        await limiter.hit(EMAIL_SCOPE, "john.doe@email.com")
+
+    assert e.value.retry_after_seconds == 10
+    assert limiter.rejected == {EMAIL_SCOPE: 1}
+
+
+def test_rate_limiter_from_settings():
+    assert RateLimiter.from_settings(RateLimitSettings(enabled=False)) is None
+
+    limiter = RateLimiter.from_settings(RateLimitSettings(ip_capacity=7))
+
+    assert isinstance(limiter.backend, MemoryRateLimitBackend)
+    assert limiter.limits[IP_SCOPE].capacity == 7
+
+
+@pytest.mark.parametrize(
+    "invalid", [{"ip_refill_per_second": 0}, {"otp_refill_per_second": -1}, {"email_capacity": 0}]
+)
+def test_rate_limit_settings_invalid(invalid):
+    with pytest.raises(ValidationError):
+        RateLimitSettings(**invalid)
+
+
+@pytest.mark.asyncio
+async def test_redis_backend(mocker):
+    client = mocker.Mock()
+    client.eval = mocker.AsyncMock(return_value=[0, "0.25"])
+    backend = RedisRateLimitBackend(client)
+    limit = RateLimit(capacity=5, refill_per_second=0.5)
+
+    allowed, tokens = await backend.hit("ip:1", limit)
+
+    assert (allowed, tokens) == (False, 0.25)
+    args = client.eval.call_args.args
+    assert args[1:5] == (1, "rate-limit:ip:1", 5, 0.5)
+    # the bucket expires once fully refilled
+    assert args[6] == 10_000
+
+
+@pytest.mark.asyncio
+async def test_redis_backend_unavailable_allows(mocker):
+    client = mocker.Mock()
+    client.eval = mocker.AsyncMock(side_effect=ConnectionRefusedError)
+
+    allowed, _ = await RedisRateLimitBackend(client).hit("ip:1", RateLimit(5, 0.5))
+
+    assert allowed is True
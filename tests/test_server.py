@@ -0,0 +1,94 @@
+import asyncio
+import os
+import socket
+
+from app.config.settings import PostgresSettings
+from app.server import (
+    METRICS_DIR_ENV,
+    Master,
+    create_socket,
+    load_app,
+    prepare_metrics_dir,
+    worker_config,
+)
+
+
+def test_create_socket_reuse_port():
+    first = create_socket("127.0.0.1", 0, reuse_port=True)
+    port = first.getsockname()[1]
+    # the workers bind their own socket on the same port
+    second = create_socket("127.0.0.1", port, reuse_port=True)
+
+    assert first.getsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT) == 1
+    assert second.getsockname()[1] == port
+    assert first.get_inheritable()
+    first.close()
+    second.close()
+
+
+def test_load_app():
+    assert load_app("app.main:app") is load_app("app.main")
+
+
+def test_pool_budget_divided_across_workers(monkeypatch):
+    monkeypatch.setenv("DB_POOL_WORKERS", "4")
+    monkeypatch.setenv("DB_MIN_POOL_SIZE", "4")
+    monkeypatch.setenv("DB_MAX_POOL_SIZE", "20")
+
+    settings = PostgresSettings()
+
+    assert (settings.min_size_pool, settings.max_size_pool) == (1, 5)
+    assert PostgresSettings(pool_workers=64).max_size_pool == 1
+
+
+def test_prepare_metrics_dir(monkeypatch, tmp_path):
+    monkeypatch.delenv(METRICS_DIR_ENV, raising=False)
+
+    created = prepare_metrics_dir()
+
+    assert created is not None
+    assert os.environ[METRICS_DIR_ENV] == created
+    os.rmdir(created)
+
+
+def test_prepare_metrics_dir_clears_previous_run(monkeypatch, tmp_path):
+    monkeypatch.setenv(METRICS_DIR_ENV, str(tmp_path))
+    (tmp_path / "counter_1234.db").write_bytes(b"")
+    (tmp_path / "keep.txt").write_text("")
+
+    assert prepare_metrics_dir() is None
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["keep.txt"]
+
+
+def test_worker_config_trusts_forwarded_allow_ips():
+    clients = []
+
+    async def app(scope, receive, send):
+        clients.append(scope["client"][0])
+
+    config = worker_config(app, forwarded_allow_ips="10.0.0.1,10.0.0.2")
+    config.load()
+    for client in ("10.0.0.2", "10.0.0.3"):
+        scope = {
+            "type": "http",
+            "scheme": "http",
+            "client": (client, 1234),
+            "headers": [(b"x-forwarded-for", b"203.0.113.7")],
+        }
+        asyncio.run(config.loaded_app(scope, None, None))
+
+    # only the trusted proxies set the client IP
+    assert clients == ["203.0.113.7", "10.0.0.3"]
+
+
+def test_worker_exit_status(mocker):
+    master = Master(app=None, workers=1, host="127.0.0.1", port=0, reuse_port=True)
+    statuses = []
+    for outcome in (None, RuntimeError("startup failed")):
+        mocker.patch("app.server.run_worker", side_effect=outcome)
+        master.spawn()
+        pid = list(master.children)[-1]
+        statuses.append(os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1]))
+
+    # a worker that raised isn't restarted as if it had exited cleanly
+    assert statuses == [0, 1]
@@ -0,0 +1,210 @@
+import json
+import threading
+import uuid
+from contextlib import asynccontextmanager
+
+import httpx
+import pytest
+
+from app.config.settings import RateLimitSettings, Settings, TracingSettings, UserCacheSettings
+from app.hash import PasswordPolicy, get_password_hash
+from app.main import create_app
+from app.repository.postgres.pool import MeteredDatabase, PoolMetrics
+from app.repository.postgres.user import UserRepository, get_user_repository
+from app.tracing import (
+    FileSpanExporter,
+    InMemorySpanExporter,
+    Tracer,
+    activate,
+    format_traceparent,
+    parse_traceparent,
+    span,
+    start_span,
+    traced,
+)
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+PASSWORD = "password"
+
+
+class FakeDatabase:
+    def __init__(self, row):
+        self.row = row
+
+    @asynccontextmanager
+    async def connection(self):
+        yield self
+
+    async def fetch_one(self, query, values):
+        return self.row
+
+
+@pytest.fixture
+def application():
+    row = {
+        "id": uuid.uuid4(),
+        "email": "john.doe@email.com",
+        "password": get_password_hash(PASSWORD, PasswordPolicy(bcrypt_rounds=4)),
+        "first_name": "John",
+        "last_name": "Doe",
+        "two_factor_enabled": False,
+        "version": 1,
+    }
+    application = create_app(
+        Settings(
+            tracing=TracingSettings(exporter="memory", sample_ratio=1.0),
+            user_cache=UserCacheSettings(enabled=False),
+            rate_limit=RateLimitSettings(enabled=False),
+        )
+    )
+    repository = UserRepository(db_conn=MeteredDatabase(FakeDatabase(row), PoolMetrics()))
+    application.dependency_overrides[get_user_repository] = lambda: repository
+    return application
+
+
+@pytest.fixture
+def exporter(application):
+    return application.state.container.tracer.exporter
+
+
+async def login(application, headers=None):
+    async with httpx.AsyncClient(app=application, base_url="http://test") as client:
+        return await client.post(
+            "/api/v1/login",
+            json={"email": "john.doe@email.com", "password": PASSWORD},
+            headers=headers,
+        )
+
+
+def test_parse_traceparent():
+    assert parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-01") == (TRACE_ID, PARENT_ID, True)
+    assert parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-00") == (TRACE_ID, PARENT_ID, False)
+    assert parse_traceparent(f"00-{'0' * 32}-{PARENT_ID}-01") is None
+    assert parse_traceparent(f"00-{TRACE_ID.upper()}-{PARENT_ID}-01") is None
+    assert parse_traceparent("garbage") is None
+    assert format_traceparent(TRACE_ID, PARENT_ID) == f"00-{TRACE_ID}-{PARENT_ID}-01"
+
+
+@pytest.mark.asyncio
+async def test_no_span_outside_of_a_trace():
+    @traced("traced")
+    async def work():
+        return 1
+
+    assert span("noop").__enter__() is None
+    assert start_span("noop") is None
+    assert await work() == 1
+
+
+@pytest.mark.asyncio
+async def test_login_spans(application, exporter):
+    response = await login(application)
+
+    assert response.status_code == 200
+    spans = {span.name: span for span in exporter.spans}
+    assert set(spans) >= {
+        "POST /api/v1/login",
+        "handler /api/v1/login",
+        "AuthService.authenticate_user",
+        "UserRepository.get_user_by_email",
+        "db.pool.acquire",
+        "hash.verify_password",
+        "jwt.encode",
+    }
+    root = spans["POST /api/v1/login"]
+    assert root.parent_span_id is None
+    assert root.attributes["http.status_code"] == 200
+    assert root.attributes["http.route"] == "/api/v1/login"
+    assert response.headers["traceparent"] == root.traceparent
+    assert {span.trace_id for span in exporter.spans} == {root.trace_id}
+    # each span is nested in the one calling it
+    assert spans["handler /api/v1/login"].parent_span_id == root.span_id
+    assert (
+        spans["UserRepository.get_user_by_email"].parent_span_id
+        == spans["AuthService.authenticate_user"].span_id
+    )
+    assert spans["db.pool.acquire"].parent_span_id == (
+        spans["UserRepository.get_user_by_email"].span_id
+    )
+    assert all(span.status != "error" for span in exporter.spans)
+
+
+@pytest.mark.asyncio
+async def test_incoming_traceparent_continued(application, exporter):
+    application.state.container.tracer.sample_ratio = 0.0
+
+    sampled = await login(application, {"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"})
+    root = exporter.find("POST /api/v1/login")[0]
+    exporter.clear()
+    not_sampled = await login(application, {"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-00"})
+    without_header = await login(application)
+
+    assert root.trace_id == TRACE_ID
+    assert root.parent_span_id == PARENT_ID
+    assert sampled.headers["traceparent"].startswith(f"00-{TRACE_ID}-")
+    assert "traceparent" not in not_sampled.headers
+    assert "traceparent" not in without_header.headers
+    assert len(exporter.spans) == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_span_and_late_spans():
+    exporter = InMemorySpanExporter()
+    root = Tracer(exporter).start_trace("request")
+
+    with activate(root):
+        with pytest.raises(ValueError):
+            with span("failing"):
+                raise ValueError()
+        late = start_span("background")
+
+    assert [span.name for span in exporter.spans] == ["failing", "request"]
+    assert exporter.spans[0].status == "error"
+    assert exporter.spans[0].attributes["exception.type"] == "ValueError"
+    # ending after its request, exported on its own
+    late.end()
+    assert exporter.spans[-1] is late
+
+
+def test_file_exporter(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    tracer = Tracer(FileSpanExporter(str(path)))
+
+    with activate(tracer.start_trace("request")):
+        with span("child", {"key": "value"}):
+            pass
+    tracer.shutdown()
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["name"] for line in lines] == ["child", "request"]
+    assert lines[0]["attributes"] == {"key": "value"}
+    assert lines[0]["parent_span_id"] == lines[1]["span_id"]
+
+
+def test_file_exporter_drops_spans_when_full(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    exporter = FileSpanExporter(str(path), max_pending=1)
+    release = threading.Event()
+
+    def write():
+        release.wait()
+        FileSpanExporter._write(exporter)
+
+    exporter._write = write
+    tracer = Tracer(exporter)
+    for name in ("first", "second", "third"):
+        with activate(tracer.start_trace(name)):
+            pass
+
+    # the writer is stuck, the export didn't wait for it
+    assert exporter.dropped == 2
+    release.set()
+    tracer.shutdown()
+    assert [json.loads(line)["name"] for line in path.read_text().splitlines()] == ["first"]
+
+
+def test_unsupported_exporter():
+    with pytest.raises(ValueError):
+        Tracer.from_settings(TracingSettings(exporter="zipkin"))
+    assert Tracer.from_settings(TracingSettings()) is None
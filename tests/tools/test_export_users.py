@@ -0,0 +1,33 @@
+import json
+
+from app.service.user_export import encode_cursor
+from app.tools.export_users import main
+
+
+def test_export_users(mocker, tmp_path, capsys):
+    user_id = "00000000-0000-0000-0000-000000000001"
+
+    async def iter_users(after_id=None, page_size=1000, include_password=False):
+        yield [
+            {
+                "id": user_id,
+                "email": "joe@email.com",
+                "first_name": "Joe",
+                "last_name": "Doe",
+                "two_factor_enabled": False,
+                "version": 1,
+            }
+        ]
+
+    repository = mocker.Mock()
+    repository.iter_users = iter_users
+    close = mocker.AsyncMock()
+    mocker.patch("app.tools.export_users.connect_repository", return_value=(repository, close))
+    output = tmp_path / "users.ndjson"
+
+    assert main(["--output", str(output)]) == 0
+
+    assert [json.loads(line)["id"] for line in output.read_text().splitlines()] == [user_id]
+    summary = json.loads(capsys.readouterr().err.splitlines()[-1])
+    assert summary == {"exported": 1, "cursor": encode_cursor(user_id)}
+    close.assert_awaited_once()
@@ -0,0 +1,32 @@
+import json
+
+from app.tools.import_users import guess_format, main
+
+
+def test_guess_format():
+    assert guess_format("users.csv") == "csv"
+    assert guess_format("users.ndjson") == "jsonl"
+    assert guess_format("-") is None
+
+
+def test_import_users(mocker, tmp_path, capsys):
+    repository = mocker.Mock()
+    repository.insert_users = mocker.AsyncMock(return_value={"joe@email.com": "1"})
+    close = mocker.AsyncMock()
+    mocker.patch("app.tools.import_users.connect_repository", return_value=(repository, close))
+    path = tmp_path / "users.csv"
+    path.write_text(
+        "email,password,first_name,last_name\n"
+        "joe@email.com,secret,Joe,Doe\n"
+        "ann@email.com,secret,Ann,Doe\n"
+    )
+    mocker.patch.dict("os.environ", {"HASH_BCRYPT_ROUNDS": "4"})
+
+    assert main([str(path), "--chunk-size", "1", "--hash-workers", "2"]) == 0
+
+    out, err = capsys.readouterr()
+    assert [json.loads(line)["status"] for line in out.splitlines()] == ["conflict"]
+    assert "2 rows, 1 created, 1 conflicts, 0 invalid" in err
+    assert json.loads(err.splitlines()[-1])["created"] == 1
+    assert repository.insert_users.call_count == 2
+    close.assert_awaited_once()